@@ -0,0 +1,196 @@
+"""Runs a local Swish cluster and measures player placement and migration.
+
+Every node runs in its own process on a separate port with cluster mode enabled and every other node as a peer. Players
+are placed through `/cluster/place` and created on the node it returns, then the busiest node is drained. Each
+`player_migrate` event is handled like a client would: the player is recreated on the node named in the event and then
+destroyed on the drained node. Players are never connected to a voice server, so this measures how placement spreads
+players and how long draining takes, not audio.
+
+Requires the native_voice extension to be built. Run from the repository root with
+`python -m benchmarks.cluster [--nodes 3] [--players 300]`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import collections
+import json
+import multiprocessing
+import time
+from typing import Any
+
+import aiohttp
+
+from .common import free_ports
+
+
+PASSWORD: str = 'cluster-test'
+
+POLL_INTERVAL: int = 250
+
+
+def run_node(port: int, urls: list[str]) -> None:
+
+    from swish.config import CONFIG
+
+    CONFIG.server.port = port
+    CONFIG.server.password = PASSWORD
+    CONFIG.server.track_update_interval = 0
+    CONFIG.cluster.enabled = True
+    CONFIG.cluster.url = f'http://127.0.0.1:{port}'
+    CONFIG.cluster.nodes = urls
+    CONFIG.cluster.poll_interval = POLL_INTERVAL
+
+    from swish.app import App
+
+    loop = asyncio.new_event_loop()
+    loop.create_task(App().run())
+    loop.run_forever()
+
+
+class Client:
+
+    def __init__(self, session: aiohttp.ClientSession) -> None:
+
+        self.session: aiohttp.ClientSession = session
+
+        self.websockets: dict[str, aiohttp.ClientWebSocketResponse] = {}
+        self.players: dict[str, str] = {}
+        self.migrations: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+
+    async def websocket(self, node: str) -> aiohttp.ClientWebSocketResponse:
+
+        if (websocket := self.websockets.get(node)) is None:
+            websocket = self.websockets[node] = await self.session.ws_connect(
+                node,
+                headers={'Authorization': PASSWORD, 'User-Id': '1', 'User-Agent': 'benchmarks.cluster'},
+            )
+            asyncio.create_task(self._read(websocket))
+
+        return websocket
+
+    async def _read(self, websocket: aiohttp.ClientWebSocketResponse) -> None:
+        async for message in websocket:
+            data = json.loads(message.data)['d']
+            if data.get('type') == 'player_migrate':
+                self.migrations.put_nowait(data)
+
+    async def send(self, node: str, op: str, data: dict[str, Any]) -> None:
+        await (await self.websocket(node)).send_str(json.dumps({'op': op, 'd': data}))
+
+    async def create_player(self, node: str, guild_id: str) -> None:
+        # any op creates the player, debug is the only one that works without a voice connection.
+        await self.send(node, 'debug', {'guild_id': guild_id})
+        self.players[guild_id] = node
+
+    async def migrate(self, event: dict[str, Any]) -> None:
+
+        # a real client would also send voice_update, play the track at event['position'] and restore the filters and
+        # paused state before destroying the old player.
+        old = self.players[event['guild_id']]
+        await self.create_player(event['node'], event['guild_id'])
+        await self.send(old, 'destroy', {'guild_id': event['guild_id']})
+
+
+async def get(session: aiohttp.ClientSession, url: str, **params: str) -> Any:
+    async with session.get(url, params=params) as response:
+        return await response.json()
+
+
+async def wait_for_cluster(session: aiohttp.ClientSession, urls: list[str]) -> None:
+
+    while True:
+        try:
+            views = [await get(session, f'{url}/cluster') for url in urls]
+        except aiohttp.ClientError:
+            await asyncio.sleep(0.1)
+            continue
+        if all(len(view) == len(urls) for view in views):
+            return
+        await asyncio.sleep(0.1)
+
+
+def print_stats(title: str, stats: list[dict[str, Any]]) -> None:
+
+    print(f'\n{title}')
+    for node in sorted(stats, key=lambda node: node['node']):
+        draining = ' (draining)' if node['draining'] else ''
+        print(f'{node["node"]:>24}: {node["players"]:5} players  load {node["load"]:.3f}{draining}')
+
+
+async def run(arguments: argparse.Namespace, urls: list[str]) -> None:
+
+    async with aiohttp.ClientSession() as session:
+
+        await wait_for_cluster(session, urls)
+        client = Client(session)
+
+        start = time.perf_counter()
+        for index in range(arguments.players):
+            guild_id = str(490948346773635102 + index)
+            placement = await get(session, f'{urls[0]}/cluster/place', guild_id=guild_id)
+            await client.create_player(placement['node'], guild_id)
+
+            # let the nodes poll each other every so often, so that later placements see the players created so far.
+            if index % 50 == 49:
+                await asyncio.sleep(POLL_INTERVAL * 2 / 1000)
+
+        print(f'placed {arguments.players} players in {time.perf_counter() - start:.2f}s')
+
+        await asyncio.sleep(POLL_INTERVAL * 2 / 1000)
+        stats = [await get(session, f'{url}/stats') for url in urls]
+        print_stats('after placement', stats)
+
+        busiest = max(stats, key=lambda node: node['players'])
+        start = time.perf_counter()
+        async with session.post(f'{busiest["node"]}/cluster/drain', headers={'Authorization': PASSWORD}) as response:
+            migrating = (await response.json())['migrating']
+
+        targets: collections.Counter[str] = collections.Counter()
+        for _ in range(migrating):
+            event = await client.migrations.get()
+            targets[event['node']] += 1
+            await client.migrate(event)
+
+        # the node counts are only right once every destroy has been handled.
+        while (await get(session, f'{busiest["node"]}/stats'))['players']:
+            await asyncio.sleep(0.01)
+
+        print(f'\ndrained {busiest["node"]}, migrated {migrating} players in {time.perf_counter() - start:.2f}s')
+        for node, count in sorted(targets.items()):
+            print(f'{node:>24}: {count:5} players')
+
+        await asyncio.sleep(POLL_INTERVAL * 2 / 1000)
+        print_stats('after draining', [await get(session, f'{url}/stats') for url in urls])
+
+        for websocket in client.websockets.values():
+            await websocket.close()
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.cluster')
+    parser.add_argument('--nodes', type=int, default=3, help='nodes to start')
+    parser.add_argument('--players', type=int, default=300, help='players to place')
+    arguments = parser.parse_args()
+
+    urls = [f'http://127.0.0.1:{port}' for port in free_ports(arguments.nodes)]
+    context = multiprocessing.get_context('spawn')
+
+    processes = [
+        context.Process(target=run_node, args=(int(url.rpartition(':')[2]), urls), daemon=True)
+        for url in urls
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        asyncio.run(run(arguments, urls))
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Helpers shared by the benchmarks, this isn't a benchmark of its own."""
+
+from __future__ import annotations
+
+import array
+import math
+import random
+import socket
+import subprocess
+import time
+from collections.abc import Callable, Iterable
+from typing import Any, TypeVar
+
+
+T = TypeVar('T')
+
+
+FRAMES: int = 2500  # 50 seconds of audio
+
+SAMPLES_PER_FRAME: int = 960
+SAMPLE_RATE: int = 48000
+FRAME_DURATION: float = 0.02
+
+
+def generate_frames(frequencies: tuple[float, ...], count: int = FRAMES) -> list[bytes]:
+
+    # 20ms frames of 16-bit stereo PCM, the tones with some noise on top. silence or a pure tone would be
+    # unrealistically cheap to encode or filter.
+    rng = random.Random(0)
+    frames = []
+
+    for index in range(count):
+        samples = array.array('h')
+        for sample in range(SAMPLES_PER_FRAME):
+            t = (index * SAMPLES_PER_FRAME + sample) / SAMPLE_RATE
+            value = sum(math.sin(2 * math.pi * frequency * t) for frequency in frequencies)
+            value = int(value * 6000 + rng.gauss(0, 800))
+            samples.extend((value, value))
+        frames.append(samples.tobytes())
+
+    return frames
+
+
+def generate_track(path: str, duration: int, codec: tuple[str, ...] = ('-c:a', 'libopus', '-b:a', '96k')) -> None:
+    # a stereo 440Hz sine of `duration` seconds, requires ffmpeg on PATH.
+    subprocess.run(
+        [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+            '-ac', '2', *codec, path,
+        ],
+        check=True,
+    )
+
+
+def timed(function: Callable[..., Any], iterations: int, *args: Any) -> float:
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function(*args)
+
+    return time.perf_counter() - start
+
+
+def timed_each(function: Callable[[T], Any], items: Iterable[T]) -> float:
+
+    start = time.perf_counter()
+    for item in items:
+        function(item)
+
+    return time.perf_counter() - start
+
+
+def frame_cost(elapsed: float, frames: int) -> str:
+    return (
+        f'{elapsed / frames * 1_000_000:8.2f} µs/frame '
+        f'{elapsed / (frames * FRAME_DURATION) * 100:6.3f}% of a core per player'
+    )
+
+
+def free_ports(count: int) -> list[int]:
+
+    # all sockets are bound before any is closed, so the ports are distinct.
+    sockets = [socket.socket() for _ in range(count)]
+    try:
+        for sock in sockets:
+            sock.bind(('127.0.0.1', 0))
+        return [sock.getsockname()[1] for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
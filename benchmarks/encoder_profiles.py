@@ -0,0 +1,42 @@
+"""Reports the Opus encode time per 20ms frame, and the resulting packet size, for every encoder profile in swish.toml.
+
+Requires the native_voice extension to be built. Run from the repository root with
+`python -m benchmarks.encoder_profiles`.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+
+from discord.ext.native_voice import native_voice  # type: ignore
+
+from swish.config import CONFIG
+
+from .common import frame_cost, generate_frames, timed_each
+
+
+# an A major chord.
+FREQUENCIES: tuple[float, ...] = (220.0, 277.2, 329.6, 440.0)
+
+
+def measure(name: str, profile: native_voice.EncoderProfile, frames: list[bytes]) -> None:
+
+    debugger = native_voice.Debugger(bytes(32), profile)
+    elapsed = timed_each(debugger.encode_opus, frames)
+
+    # packet sizes are measured in a second pass, so that summing them up isn't part of the encode time.
+    size = sum(len(debugger.encode_opus(frame)) for frame in frames)
+
+    print(f'{name:>12}: {frame_cost(elapsed, len(frames))} {size / len(frames):8.1f} bytes/frame')
+
+
+def main() -> None:
+
+    frames = generate_frames(FREQUENCIES)
+
+    for name, profile in CONFIG.encoder.profiles.items():
+        measure(name, native_voice.EncoderProfile(**dataclasses.asdict(profile)), frames)
+
+
+if __name__ == '__main__':
+    main()
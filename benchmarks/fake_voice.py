@@ -0,0 +1,227 @@
+"""A local stand-in for discord's voice gateway and voice UDP server, used by `benchmarks.load`.
+
+It speaks just enough of the voice protocol for native_voice to connect: hello, ready, IP discovery and a session
+description. Every RTP packet received afterwards is timed per SSRC to work out packet rates and RFC 3550 interarrival
+jitter, the packets themselves are never decrypted. Swish only connects to it with `server.allow_plaintext_voice`
+enabled, as it has no TLS.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import math
+import multiprocessing.connection
+import random
+import time
+from typing import Any
+
+import aiohttp
+import aiohttp.web
+
+
+SAMPLE_RATE: int = 48000
+
+# packets arriving this much later than the previous one are counted as gaps.
+GAP_THRESHOLD: float = 0.04
+
+DISCOVERY_SIZE: int = 70
+
+
+class StreamStats:
+
+    def __init__(self) -> None:
+        self.packets: int = 0
+        self.gaps: int = 0
+        self.first: float = 0.0
+        self.last: float = 0.0
+        self.transit: float | None = None
+        self.jitter: float = 0.0
+
+    def record(self, arrival: float, timestamp: int) -> None:
+
+        if self.packets and arrival - self.last > GAP_THRESHOLD:
+            self.gaps += 1
+        if not self.packets:
+            self.first = arrival
+
+        self.packets += 1
+        self.last = arrival
+
+        # RFC 3550 interarrival jitter, the smoothed change in transit time between consecutive packets.
+        transit = arrival - timestamp / SAMPLE_RATE
+        if self.transit is not None:
+            self.jitter += (abs(transit - self.transit) - self.jitter) / 16
+        self.transit = transit
+
+    def to_dict(self) -> dict[str, Any]:
+
+        duration = self.last - self.first
+        return {
+            'packets': self.packets,
+            'rate':    (self.packets - 1) / duration if duration > 0 else 0.0,
+            'gaps':    self.gaps,
+            'jitter':  self.jitter * 1000,
+        }
+
+
+class _UDPProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, server: FakeVoiceServer) -> None:
+        self.server: FakeVoiceServer = server
+        self.transport: asyncio.DatagramTransport | None = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport  # type: ignore
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+
+        arrival = time.perf_counter()
+
+        # IP discovery request: type 1, length 70, ssrc. the reply is the same size, with the port in its last 2 bytes.
+        if len(data) == DISCOVERY_SIZE and data[:2] == b'\x00\x01':
+            assert self.transport is not None
+            ip = addr[0].encode().ljust(DISCOVERY_SIZE - 10, b'\x00')
+            self.transport.sendto(
+                b'\x00\x02' + DISCOVERY_SIZE.to_bytes(2, 'big') + data[4:8] + ip + addr[1].to_bytes(2, 'big'),
+                addr
+            )
+            return
+
+        if len(data) < 12:
+            return
+
+        ssrc = int.from_bytes(data[8:12], 'big')
+        timestamp = int.from_bytes(data[4:8], 'big')
+
+        if (stats := self.server.streams.get(ssrc)) is None:
+            stats = self.server.streams[ssrc] = StreamStats()
+        stats.record(arrival, timestamp)
+
+
+class FakeVoiceServer:
+
+    def __init__(self, host: str = '127.0.0.1') -> None:
+
+        self.host: str = host
+        self.ws_port: int = 0
+        self.udp_port: int = 0
+
+        self.streams: dict[int, StreamStats] = {}
+        self._ssrcs: itertools.count[int] = itertools.count(1)
+
+        self._runner: aiohttp.web.AppRunner | None = None
+        self._transport: asyncio.DatagramTransport | None = None
+
+    @property
+    def endpoint(self) -> str:
+        return f'ws://{self.host}:{self.ws_port}'
+
+    async def start(self) -> None:
+
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(lambda: _UDPProtocol(self), local_addr=(self.host, 0))
+        self._transport = transport
+        self.udp_port = transport.get_extra_info('sockname')[1]
+
+        app = aiohttp.web.Application()
+        app.add_routes([aiohttp.web.get('/', self._websocket_handler)])
+
+        self._runner = aiohttp.web.AppRunner(app)
+        await self._runner.setup()
+        site = aiohttp.web.TCPSite(self._runner, self.host, 0)
+        await site.start()
+        self.ws_port = site._server.sockets[0].getsockname()[1]  # type: ignore
+
+    async def stop(self) -> None:
+
+        if self._transport is not None:
+            self._transport.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _websocket_handler(self, request: aiohttp.web.Request) -> aiohttp.web.WebSocketResponse:
+
+        websocket = aiohttp.web.WebSocketResponse()
+        await websocket.prepare(request)
+
+        await websocket.send_json({'op': 8, 'd': {'heartbeat_interval': 41250.0}})
+
+        async for message in websocket:
+
+            if message.type is not aiohttp.WSMsgType.TEXT:
+                continue
+
+            payload = json.loads(message.data)
+            op, data = payload['op'], payload['d']
+
+            if op == 0:  # identify
+                await websocket.send_json(
+                    {
+                        'op': 2,
+                        'd':  {
+                            'ssrc':  next(self._ssrcs),
+                            'ip':    self.host,
+                            'port':  self.udp_port,
+                            'modes': ['xsalsa20_poly1305_lite', 'xsalsa20_poly1305_suffix', 'xsalsa20_poly1305'],
+                        }
+                    }
+                )
+            elif op == 1:  # select protocol
+                await websocket.send_json(
+                    {
+                        'op': 4,
+                        'd':  {
+                            'mode':       data['data']['mode'],
+                            # native_voice waits for a key that isn't all zeroes.
+                            'secret_key': [random.randint(1, 255) for _ in range(32)],
+                        }
+                    }
+                )
+            elif op == 3:  # heartbeat
+                await websocket.send_json({'op': 6, 'd': data})
+            elif op == 7:  # resume
+                await websocket.send_json({'op': 9, 'd': None})
+
+        return websocket
+
+    def summary(self) -> dict[str, Any]:
+
+        streams = [stats.to_dict() for stats in self.streams.values() if stats.packets > 1]
+        jitters = sorted(stream['jitter'] for stream in streams)
+
+        return {
+            'streams':     len(streams),
+            'packets':     sum(stream['packets'] for stream in streams),
+            'gaps':        sum(stream['gaps'] for stream in streams),
+            'rate':        sum(stream['rate'] for stream in streams) / len(streams) if streams else 0.0,
+            'jitter_mean': sum(jitters) / len(jitters) if jitters else 0.0,
+            'jitter_p99':  jitters[min(len(jitters) - 1, math.ceil(len(jitters) * 0.99) - 1)] if jitters else 0.0,
+            'jitter_max':  jitters[-1] if jitters else 0.0,
+        }
+
+
+async def _serve(connection: multiprocessing.connection.Connection) -> None:
+
+    server = FakeVoiceServer()
+    await server.start()
+    connection.send(server.endpoint)
+
+    loop = asyncio.get_running_loop()
+    while True:
+        command = await loop.run_in_executor(None, connection.recv)
+        if command == 'reset':
+            server.streams.clear()
+        elif command == 'stop':
+            connection.send(server.summary())
+            break
+
+    await server.stop()
+
+
+def serve(connection: multiprocessing.connection.Connection) -> None:
+
+    # runs in its own process so that timing packets isn't disturbed by swish or the simulated clients. sends the
+    # endpoint once listening, then takes 'reset' (forget the packets so far) and 'stop' (reply with the summary).
+    asyncio.run(_serve(connection))
@@ -0,0 +1,48 @@
+"""Reports the per-frame cost of the native volume and equalizer filters.
+
+Each 20ms frame is run through the same filter chain the native player uses. The 'none' case is the unfiltered fast
+path, where frames aren't touched, plus the cost of copying frames in and out of python. Requires the native_voice
+extension to be built. Run from the repository root with `python -m benchmarks.filters`.
+"""
+
+from __future__ import annotations
+
+from discord.ext.native_voice import native_voice  # type: ignore
+
+from .common import frame_cost, generate_frames, timed_each
+
+
+# (name, volume, equalizer gains)
+CASES: tuple[tuple[str, float, list[float]], ...] = (
+    ('none', 1.0, []),
+    ('volume', 0.5, []),
+    ('bass boost', 1.0, [0.3, 0.25, 0.2]),
+    ('eq 15 bands', 1.0, [0.1] * 15),
+    ('volume + eq', 0.5, [0.1] * 15),
+)
+
+
+# low, mid and high tones so that every equalizer band has something to work on.
+FREQUENCIES: tuple[float, ...] = (55.0, 220.0, 1760.0)
+
+
+def measure(name: str, volume: float, equalizer: list[float], frames: list[bytes]) -> None:
+
+    debugger = native_voice.Debugger(bytes(32))
+    debugger.set_filters(volume, equalizer)
+
+    # filter_pcm copies each frame in and out of python, so the 'none' case is mostly that overhead.
+    elapsed = timed_each(debugger.filter_pcm, frames)
+    print(f'{name:>12}: {frame_cost(elapsed, len(frames))}')
+
+
+def main() -> None:
+
+    frames = generate_frames(FREQUENCIES)
+
+    for name, volume, equalizer in CASES:
+        measure(name, volume, equalizer, frames)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,443 @@
+"""A self-contained load test of a Swish node.
+
+Swish runs in this process with a stub extractor that serves generated local audio files in place of yt-dlp. Simulated
+clients run in a second process and connect over websocket. Their players connect to a stand-in for discord's voice
+servers (`benchmarks.fake_voice`) that runs in a third process and times every RTP packet it receives.
+
+Once every player is playing, the clients run a mix of ops for `--duration` seconds. Each op is followed by a `debug` op,
+and the time until its `player_debug` event arrives is recorded as that op's latency. Searches are timed as HTTP
+requests.
+
+The report includes:
+- op latency percentiles
+- players per core and memory per player, for Swish and its ffmpeg processes
+- packet rate and jitter as seen by the voice server
+
+Requires ffmpeg on PATH and the native_voice extension to be built. Run from the repository root with
+`python -m benchmarks.load [--clients 4] [--players 25] [--duration 60] [--scheduler 0]`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import multiprocessing.connection
+import os
+import random
+import resource
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any
+
+import aiohttp
+
+from . import fake_voice
+from .common import free_ports, generate_track
+
+
+PASSWORD: str = 'load-test'
+
+# (op, weight), every op is followed by a debug op to time it.
+OP_MIX: tuple[tuple[str, int], ...] = (
+    ('debug', 30),
+    ('set_pause_state', 20),
+    ('set_position', 20),
+    ('set_filter', 15),
+    ('search', 10),
+    ('play', 5),
+)
+
+# (file name, ffmpeg codec arguments, acodec reported by the stub extractor), opus tracks are passed through while
+# the others are decoded and re-encoded.
+TRACKS: tuple[tuple[str, tuple[str, ...], str], ...] = (
+    ('opus.webm', ('-c:a', 'libopus', '-b:a', '128k'), 'opus'),
+    ('aac.m4a', ('-c:a', 'aac', '-b:a', '128k'), 'mp4a.40.2'),
+)
+
+
+###########
+# Helpers #
+###########
+
+def percentiles(values: list[float]) -> str:
+
+    if not values:
+        return 'n/a'
+
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, math.ceil(len(values) * q) - 1)]
+    return f'p50 {pick(0.5):8.2f}ms  p95 {pick(0.95):8.2f}ms  p99 {pick(0.99):8.2f}ms  max {values[-1]:8.2f}ms'
+
+
+def generate_tracks(directory: str, length: int) -> dict[str, str]:
+
+    tracks = {}
+    for name, codec, acodec in TRACKS:
+        path = os.path.join(directory, name)
+        generate_track(path, length, codec)
+        tracks[path] = acodec
+
+    return tracks
+
+
+def ffmpeg_processes() -> list[int]:
+
+    # ffmpeg processes started by this process, the extension spawns them directly.
+    pid = str(os.getpid())
+    pids = []
+
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as file:
+                # the command name is in parentheses and may contain spaces, fields are counted from after it.
+                name, fields = file.read().split('(', 1)[1].rsplit(')', 1)
+        except OSError:
+            continue
+        if name == 'ffmpeg' and fields.split()[1] == pid:
+            pids.append(int(entry))
+
+    return pids
+
+
+def process_usage(pid: int | str = 'self') -> tuple[float, int]:
+
+    # cpu seconds and resident bytes of a process, read from /proc.
+    try:
+        with open(f'/proc/{pid}/stat') as file:
+            fields = file.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/statm') as file:
+            resident = int(file.read().split()[1])
+    except OSError:
+        return 0.0, 0
+
+    ticks = os.sysconf('SC_CLK_TCK')
+    return (int(fields[11]) + int(fields[12])) / ticks, resident * resource.getpagesize()
+
+
+def ffmpeg_usage() -> tuple[float, int, int]:
+
+    usage = [process_usage(pid) for pid in ffmpeg_processes()]
+    return sum(cpu for cpu, _ in usage), sum(rss for _, rss in usage), len(usage)
+
+
+##################
+# Stub extractor #
+##################
+
+class StubExtractor:
+
+    # stands in for YTDLPool/YTDLProcessPool, searches return every local track and playback urls are the local paths.
+    def __init__(self, tracks: dict[str, str], length: int, delay: float) -> None:
+        self.tracks: dict[str, str] = tracks
+        self.length: int = length
+        self.delay: float = delay
+
+    def extract(
+        self,
+        query: str,
+        extract_flat: bool,
+        source_address: str,
+        playlist_items: str | None = None,
+    ) -> dict[str, Any] | None:
+
+        if self.delay:
+            time.sleep(self.delay)
+
+        if not extract_flat:
+            return {'url': query, 'acodec': self.tracks[query]}
+
+        return {
+            'entries': [
+                {
+                    'title':      os.path.basename(path),
+                    'id':         os.path.basename(path),
+                    'url':        path,
+                    'duration':   self.length,
+                    'uploader':   'benchmarks.load',
+                    'channel_id': None,
+                }
+                for path in self.tracks
+            ]
+        }
+
+
+###########
+# Clients #
+###########
+
+class Client:
+
+    def __init__(self, index: int, options: dict[str, Any], session: aiohttp.ClientSession) -> None:
+
+        self.index: int = index
+        self.options: dict[str, Any] = options
+        self.session: aiohttp.ClientSession = session
+        self.rng: random.Random = random.Random(index)
+
+        self.websocket: aiohttp.ClientWebSocketResponse | None = None
+        self.pending: dict[str, asyncio.Future[dict[str, Any]]] = {}
+
+        self.latencies: defaultdict[str, list[float]] = defaultdict(list)
+        self.timeouts: int = 0
+        self.debug: dict[str, dict[str, Any]] = {}
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.options["port"]}'
+
+    async def connect(self) -> None:
+
+        self.websocket = await self.session.ws_connect(
+            self.url,
+            headers={'Authorization': PASSWORD, 'User-Id': str(self.index + 1), 'User-Agent': 'benchmarks.load'},
+        )
+        asyncio.create_task(self._read())
+
+    async def _read(self) -> None:
+
+        assert self.websocket is not None
+        async for message in self.websocket:
+            data = json.loads(message.data)['d']
+            if data.get('type') == 'player_debug' and (future := self.pending.pop(data['guild_id'], None)):
+                future.set_result(data)
+
+    async def send(self, op: str, data: dict[str, Any]) -> None:
+        assert self.websocket is not None
+        await self.websocket.send_str(json.dumps({'op': op, 'd': data}))
+
+    async def probe(self, guild_id: str) -> dict[str, Any] | None:
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[guild_id] = future
+        await self.send('debug', {'guild_id': guild_id})
+
+        try:
+            data = await asyncio.wait_for(future, timeout=10)
+        except asyncio.TimeoutError:
+            self.pending.pop(guild_id, None)
+            self.timeouts += 1
+            return None
+
+        self.debug[guild_id] = data
+        return data
+
+    async def search(self) -> list[str]:
+
+        start = time.perf_counter()
+        # a new query every time so that the search cache doesn't answer it.
+        async with self.session.get(f'{self.url}/search', params={'query': f'load {self.rng.random()}'}) as response:
+            tracks = await response.json()
+        self.latencies['search'].append((time.perf_counter() - start) * 1000)
+
+        return [track['id'] for track in tracks]
+
+    async def start_player(self, guild_id: str, track_ids: list[str], shared: bool = False) -> bool:
+
+        await self.send(
+            'voice_update',
+            {'guild_id': guild_id, 'session_id': 'load', 'token': 'load', 'endpoint': self.options['endpoint']},
+        )
+        await self.send('play', {'guild_id': guild_id, 'track_id': self.rng.choice(track_ids), 'shared': shared})
+
+        deadline = time.perf_counter() + 30
+        while time.perf_counter() < deadline:
+            if (data := await self.probe(guild_id)) is not None and data['playing']:
+                return True
+            await asyncio.sleep(0.5)
+
+        return False
+
+    async def run_player(self, guild_id: str, track_ids: list[str], until: float) -> None:
+
+        ops, weights = zip(*OP_MIX)
+        paused = False
+
+        while (remaining := until - time.perf_counter()) > 0:
+
+            await asyncio.sleep(min(remaining, self.rng.expovariate(self.options['rate'])))
+            op = self.rng.choices(ops, weights)[0]
+
+            if op == 'search':
+                track_ids = await self.search() or track_ids
+                continue
+
+            start = time.perf_counter()
+            if op == 'set_pause_state':
+                paused = not paused
+                await self.send(op, {'guild_id': guild_id, 'state': paused})
+            elif op == 'set_position':
+                await self.send(op, {'guild_id': guild_id, 'position': self.rng.randrange(self.options['length'] * 500)})
+            elif op == 'set_filter':
+                await self.send(op, {'guild_id': guild_id, 'volume': self.rng.uniform(0.5, 1.5)})
+            elif op == 'play':
+                paused = False
+                await self.send(op, {'guild_id': guild_id, 'track_id': self.rng.choice(track_ids)})
+
+            if await self.probe(guild_id) is not None:
+                self.latencies[op].append((time.perf_counter() - start) * 1000)
+
+
+async def _run_clients(options: dict[str, Any], connection: multiprocessing.connection.Connection) -> None:
+
+    async with aiohttp.ClientSession() as session:
+
+        clients = [Client(index, options, session) for index in range(options['clients'])]
+        for client in clients:
+            await client.connect()
+
+        track_ids = await clients[0].search()
+        guilds = [
+            (client, f'{client.index}{player:05}')
+            for client in clients for player in range(options['players'])
+        ]
+
+        started = await asyncio.gather(*(client.start_player(guild_id, track_ids) for client, guild_id in guilds))
+        connection.send(sum(started))
+
+        # the op mix only starts once swish has measured its idle baseline.
+        await asyncio.get_running_loop().run_in_executor(None, connection.recv)
+
+        until = time.perf_counter() + options['duration']
+        await asyncio.gather(*(client.run_player(guild_id, track_ids, until) for client, guild_id in guilds))
+
+        latencies: defaultdict[str, list[float]] = defaultdict(list)
+        for client in clients:
+            for op, values in client.latencies.items():
+                latencies[op].extend(values)
+
+        pacing = [data['pacing'] for client in clients for data in client.debug.values() if data.get('pacing')]
+        connection.send(
+            {
+                'latencies': dict(latencies),
+                'timeouts':  sum(client.timeouts for client in clients),
+                'pacing':    pacing,
+            }
+        )
+
+
+def run_clients(options: dict[str, Any], connection: multiprocessing.connection.Connection) -> None:
+    asyncio.run(_run_clients(options, connection))
+
+
+########
+# Main #
+########
+
+async def run(arguments: argparse.Namespace, directory: str) -> None:
+
+    context = multiprocessing.get_context('spawn')
+    loop = asyncio.get_running_loop()
+
+    length = arguments.duration + 120
+    tracks = generate_tracks(directory, length)
+
+    voice, voice_child = context.Pipe()
+    voice_process = context.Process(target=fake_voice.serve, args=(voice_child,), daemon=True)
+    voice_process.start()
+    endpoint = voice.recv()
+
+    # swish is only imported here, the spawned processes don't need it.
+    from swish.config import CONFIG
+
+    CONFIG.server.port = free_ports(1)[0]
+    CONFIG.server.password = PASSWORD
+    CONFIG.server.allow_plaintext_voice = True
+    CONFIG.extractor.mode = 'thread'
+    CONFIG.playback.scheduler.enabled = arguments.scheduler > 0
+    CONFIG.playback.scheduler.threads = arguments.scheduler
+
+    from swish.app import App
+
+    app = App()
+    app._ytdl_pool = StubExtractor(tracks, length, arguments.extractor_delay)  # type: ignore
+    await app.run()
+
+    _, base_rss = process_usage()
+
+    options = {
+        'port':     CONFIG.server.port,
+        'endpoint': endpoint,
+        'clients':  arguments.clients,
+        'players':  arguments.players,
+        'duration': arguments.duration,
+        'rate':     arguments.rate,
+        'length':   length,
+    }
+    clients, clients_child = context.Pipe()
+    clients_process = context.Process(target=run_clients, args=(options, clients_child), daemon=True)
+    clients_process.start()
+
+    players = await loop.run_in_executor(None, clients.recv)
+    print(f'{players}/{arguments.clients * arguments.players} players started.')
+
+    # let every decoder settle before taking the baseline.
+    await asyncio.sleep(2)
+    voice.send('reset')
+    start = time.perf_counter()
+    cpu, rss = process_usage()
+    ffmpeg_cpu, ffmpeg_rss, processes = ffmpeg_usage()
+    clients.send('start')
+
+    results = await loop.run_in_executor(None, clients.recv)
+
+    wall = time.perf_counter() - start
+    cpu = process_usage()[0] - cpu
+    ffmpeg_cpu = ffmpeg_usage()[0] - ffmpeg_cpu
+
+    voice.send('stop')
+    packets = await loop.run_in_executor(None, voice.recv)
+
+    print(f'\n{"op":>16}  latency (op + debug round trip, search is an http request)')
+    for op, _ in OP_MIX:
+        print(f'{op:>16}: {percentiles(results["latencies"].get(op, []))}')
+    print(f'{"timeouts":>16}: {results["timeouts"]}')
+
+    players = max(players, 1)
+    print('\nswish process')
+    print(f'{"cpu":>16}: {cpu / wall * 100:.1f}% of a core, {players / max(cpu / wall, 1e-9):.0f} players per core')
+    print(f'{"memory":>16}: {(rss - base_rss) / players / 1024:.0f} KiB per player')
+    print(f'ffmpeg processes ({processes})')
+    print(f'{"cpu":>16}: {ffmpeg_cpu / wall * 100:.1f}% of a core, {ffmpeg_cpu / wall / players * 100:.2f}% per player')
+    print(f'{"memory":>16}: {ffmpeg_rss / players / 1024:.0f} KiB per player')
+
+    print('\nvoice server')
+    print(f'{"streams":>16}: {packets["streams"]}, {packets["rate"]:.2f} packets/s per stream (50 expected)')
+    print(f'{"gaps":>16}: {packets["gaps"]} (more than {fake_voice.GAP_THRESHOLD * 1000:.0f}ms between packets)')
+    print(
+        f'{"jitter":>16}: mean {packets["jitter_mean"]:.2f}ms  p99 {packets["jitter_p99"]:.2f}ms  '
+        f'max {packets["jitter_max"]:.2f}ms'
+    )
+
+    if pacing := results['pacing']:
+        print('\nnative pacing (player_debug)')
+        print(f'{"late frames":>16}: {sum(stats["late_frames"] for stats in pacing)} of {sum(stats["frames"] for stats in pacing)}')
+        print(f'{"jitter":>16}: max {max(stats["jitter"] for stats in pacing):.2f}ms')
+        print(f'{"drift":>16}: {sum(stats["drift"] for stats in pacing):.0f}ms total')
+
+    clients_process.join(timeout=5)
+    voice_process.join(timeout=5)
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load')
+    parser.add_argument('--clients', type=int, default=4, help='websocket connections')
+    parser.add_argument('--players', type=int, default=25, help='players per connection')
+    parser.add_argument('--duration', type=int, default=60, help='seconds to run the op mix for')
+    parser.add_argument('--rate', type=float, default=0.2, help='ops per player per second')
+    parser.add_argument('--scheduler', type=int, default=0, help='native scheduler threads, 0 for a thread per player')
+    parser.add_argument('--extractor-delay', type=float, default=0.0, help='seconds each stub extraction takes')
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(arguments, directory))
+
+
+if __name__ == '__main__':
+    main()
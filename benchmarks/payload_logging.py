@@ -0,0 +1,96 @@
+"""Measures payload throughput through `Player.handle_payload` with DEBUG logging on and off.
+
+Payloads are decoded and handed to a player whose op handlers do nothing, so only decoding and logging is measured.
+Records are written to a log file in a temporary directory, either through the queue pipeline set up by
+`swish.logging.setup_logging` or directly by a RotatingFileHandler on the event loop. `loop` is the throughput seen by the
+event loop, `total` includes waiting for the queued records to be written out.
+
+Requires the native_voice extension to be built. Run from the repository root with `python -m benchmarks.payload_logging`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import atexit
+import logging
+import logging.handlers
+import os
+import tempfile
+import time
+from typing import Any
+
+from swish.logging import ColourFormatter, queue_handlers
+from swish.player import Player
+from swish.serialization import decode_payload, dumps
+
+
+PAYLOADS: int = 50_000
+
+PAYLOAD: str = dumps({'op': 'set_position', 'd': {'guild_id': '490948346773635102', 'position': 63240}})
+
+# (name, level, queued)
+CASES: tuple[tuple[str, int, bool], ...] = (
+    ('info', logging.INFO, True),
+    ('debug direct', logging.DEBUG, False),
+    ('debug queued', logging.DEBUG, True),
+)
+
+
+async def noop(data: Any) -> None:
+    pass
+
+
+async def handle_payloads(player: Player) -> float:
+
+    start = time.perf_counter()
+    for _ in range(PAYLOADS):
+        await player.handle_payload(decode_payload(PAYLOAD))
+
+    return time.perf_counter() - start
+
+
+def measure(name: str, level: int, queued: bool, directory: str) -> None:
+
+    logger = logging.getLogger('swish')
+    logger.handlers.clear()
+    logger.setLevel(level)
+    logger.propagate = False
+
+    handler = logging.handlers.RotatingFileHandler(
+        filename=os.path.join(directory, f'{name.replace(" ", "-")}.log'),
+        maxBytes=5242880,
+        backupCount=1,
+        encoding='utf-8',
+    )
+    handler.setFormatter(ColourFormatter(enabled=False))
+
+    listener = None
+    if queued:
+        listener = queue_handlers(logger, handler)
+    else:
+        logger.addHandler(handler)
+
+    player = Player({'app': None, 'user_id': '0', 'client_name': 'benchmark'}, '490948346773635102')  # type: ignore
+    player._PAYLOAD_HANDLERS = dict.fromkeys(player._PAYLOAD_HANDLERS, noop)  # type: ignore
+
+    start = time.perf_counter()
+    loop = asyncio.run(handle_payloads(player))
+
+    if listener is not None:
+        atexit.unregister(listener.stop)
+        listener.stop()
+    total = time.perf_counter() - start
+    handler.close()
+
+    print(f'{name:>14}: loop {PAYLOADS / loop:10,.0f} payloads/s   total {PAYLOADS / total:10,.0f} payloads/s')
+
+
+def main() -> None:
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, level, queued in CASES:
+            measure(name, level, queued, directory)
+
+
+if __name__ == '__main__':
+    main()
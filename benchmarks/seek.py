@@ -0,0 +1,74 @@
+"""Measures seek-to-audio latency, the time from spawning ffmpeg at an offset until the first PCM frame is read.
+
+Input seeking (`-ss` before `-i`, as used by the native player) is compared against output seeking (`-ss` after `-i`),
+which decodes and discards everything before the offset. Requires ffmpeg on PATH, pass a file or url to seek in,
+otherwise a 30 minute test track is generated.
+
+Run from the repository root with `python -m benchmarks.seek [source]`.
+"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from .common import generate_track
+
+
+ITERATIONS: int = 5
+OFFSETS: tuple[int, ...] = (0, 60_000, 600_000, 1_500_000)
+
+# 20ms of 16-bit stereo 48kHz audio, one frame as read by FFmpegPCMAudio.
+FRAME_SIZE: int = 3840
+
+DECODE_ARGS: tuple[str, ...] = ('-f', 's16le', '-ar', '48000', '-ac', '2', '-loglevel', 'panic', 'pipe:1')
+
+
+def first_frame(source: str, offset: int, input_seeking: bool) -> float:
+
+    seek = ('-ss', f'{offset // 1000}.{offset % 1000:03}') if offset else ()
+    args = ['ffmpeg', *(seek if input_seeking else ()), '-i', source, *(() if input_seeking else seek), *DECODE_ARGS]
+
+    start = time.perf_counter()
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    try:
+        assert process.stdout is not None
+        data = process.stdout.read(FRAME_SIZE)
+        elapsed = time.perf_counter() - start
+    finally:
+        process.kill()
+        process.wait()
+
+    if len(data) != FRAME_SIZE:
+        raise RuntimeError(f'ffmpeg produced no audio at offset {offset}ms.')
+
+    return elapsed
+
+
+def measure(source: str, offset: int, input_seeking: bool) -> float:
+    return min(first_frame(source, offset, input_seeking) for _ in range(ITERATIONS))
+
+
+def main() -> None:
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        if len(sys.argv) > 1:
+            source = sys.argv[1]
+        else:
+            source = os.path.join(directory, 'track.webm')
+            generate_track(source, 1800)
+
+        print(f'{"offset":>10} {"input seek":>12} {"output seek":>12}')
+        for offset in OFFSETS:
+            fast = measure(source, offset, True)
+            slow = measure(source, offset, False)
+            print(f'{offset / 1000:>9.0f}s {fast * 1000:>10.1f}ms {slow * 1000:>10.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
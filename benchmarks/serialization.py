@@ -0,0 +1,84 @@
+"""Compares websocket frame decode + validate + encode throughput of the stdlib json module and swish.serialization.
+
+Run from the repository root with `python -m benchmarks.serialization`, the result depends on whether orjson,
+msgspec or msgpack are installed.
+"""
+
+from __future__ import annotations
+
+import json
+from collections.abc import Callable
+from typing import Any
+
+from swish import serialization
+
+from .common import timed
+
+
+ITERATIONS: int = 200_000
+
+RECEIVED: str = json.dumps(
+    {
+        'op': 'play',
+        'd':  {
+            'guild_id':   '490948346773635102',
+            'track_id':   'AQEfAAs5SERFSGoyeXpldwADuSAAJER1YSBMaXBhIC0gUGh5c2ljYWwgKE9mZmljaWFsIFZpZGVvKQ',
+            'start_time': 0,
+            'replace':    True,
+        }
+    }
+)
+RECEIVED_MSGPACK: bytes = b''
+if 'swish.msgpack' in serialization.SUBPROTOCOLS:
+    RECEIVED_MSGPACK = serialization.msgpack_dumps(json.loads(RECEIVED))
+
+SENT: dict[str, Any] = {
+    'op': 'event',
+    'd':  {
+        'guild_id': '490948346773635102',
+        'type':     'track_update',
+        'position': 123456,
+    }
+}
+
+
+def stdlib_frame() -> None:
+
+    # mirrors the previous message.json() + manual key checks + send_json path.
+    payload = json.loads(RECEIVED)
+    assert 'op' in payload and 'd' in payload and payload['d'].get('guild_id')
+    json.dumps(SENT)
+
+
+def serialization_frame() -> None:
+    serialization.decode_payload(RECEIVED)
+    serialization.dumps(SENT)
+
+
+def msgpack_frame() -> None:
+    serialization.decode_payload(RECEIVED_MSGPACK, 'msgpack')
+    serialization.msgpack_dumps(SENT)
+
+
+def measure(name: str, function: Callable[[], None]) -> float:
+
+    elapsed = timed(function, ITERATIONS)
+    print(f'{name:>24}: {ITERATIONS / elapsed:12,.0f} frames/s')
+    return elapsed
+
+
+def main() -> None:
+
+    before = measure('json', stdlib_frame)
+    after = measure(f'serialization ({serialization.BACKEND})', serialization_frame)
+
+    print(f'{"speedup":>24}: {before / after:12.2f}x')
+
+    if 'swish.msgpack' in serialization.SUBPROTOCOLS:
+        measure('msgpack', msgpack_frame)
+        print(f'{"json sent bytes":>24}: {len(serialization.dumps_bytes(SENT)):12}')
+        print(f'{"msgpack sent bytes":>24}: {len(serialization.msgpack_dumps(SENT)):12}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Checks that decoders are stopped once the players using them are.
+
+Players on one connection all start the same track, first as a shared stream and then each with a decoder of its own.
+Once every player is playing they're all stopped, and the number of running ffmpeg processes is followed until it's back
+to what it was before. Unshared decoders are stopped straight away, a shared decoder keeps running for
+`playback.shared.idle_timeout` seconds after its last player stopped in case another player joins.
+
+Uses the stub extractor and fake voice server of `benchmarks.load`. Requires ffmpeg on PATH and the native_voice
+extension to be built. Run from the repository root with `python -m benchmarks.shared_streams [--players 10]`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import multiprocessing
+import tempfile
+import time
+
+import aiohttp
+from discord.ext.native_voice import native_voice  # type: ignore
+
+from . import fake_voice
+from .common import free_ports
+from .load import PASSWORD, Client, StubExtractor, generate_tracks
+
+
+TRACK_LENGTH: int = 300
+
+
+async def wait_for_processes(count: int, timeout: float) -> float | None:
+
+    start = time.perf_counter()
+    while native_voice.ffmpeg_processes() != count:
+        if time.perf_counter() - start > timeout:
+            return None
+        await asyncio.sleep(0.05)
+
+    return time.perf_counter() - start
+
+
+async def measure(name: str, client: Client, track_id: str, players: int, shared: bool, timeout: float) -> None:
+
+    before = native_voice.ffmpeg_processes()
+
+    guild_ids = [f'{int(shared)}{index:05}' for index in range(players)]
+    started = await asyncio.gather(*(client.start_player(guild_id, [track_id], shared) for guild_id in guild_ids))
+    playing = native_voice.ffmpeg_processes() - before
+
+    for guild_id in guild_ids:
+        await client.send('stop', {'guild_id': guild_id})
+
+    if (elapsed := await wait_for_processes(before, timeout)) is not None:
+        result = f'back to {before} after {elapsed:.2f}s'
+    else:
+        result = f'still {native_voice.ffmpeg_processes() - before} more than before after {timeout:.0f}s'
+
+    print(f'{name:>10}: {sum(started)} players, {playing} ffmpeg processes while playing, {result}')
+
+    for guild_id in guild_ids:
+        await client.send('destroy', {'guild_id': guild_id})
+
+
+async def run(arguments: argparse.Namespace, directory: str) -> None:
+
+    context = multiprocessing.get_context('spawn')
+    tracks = generate_tracks(directory, TRACK_LENGTH)
+
+    voice, voice_child = context.Pipe()
+    voice_process = context.Process(target=fake_voice.serve, args=(voice_child,), daemon=True)
+    voice_process.start()
+    endpoint = voice.recv()
+
+    # swish is only imported here, the spawned process doesn't need it.
+    from swish.config import CONFIG
+
+    CONFIG.server.port = free_ports(1)[0]
+    CONFIG.server.password = PASSWORD
+    CONFIG.server.allow_plaintext_voice = True
+    CONFIG.server.track_update_interval = 0
+    CONFIG.extractor.mode = 'thread'
+
+    from swish.app import App
+
+    app = App()
+    app._ytdl_pool = StubExtractor(tracks, TRACK_LENGTH, 0.0)  # type: ignore
+    await app.run()
+
+    options = {'port': CONFIG.server.port, 'endpoint': endpoint}
+    timeout = CONFIG.playback.shared.idle_timeout + 10
+
+    async with aiohttp.ClientSession() as session:
+
+        client = Client(0, options, session)
+        await client.connect()
+        track_id = (await client.search())[0]
+
+        await measure('shared', client, track_id, arguments.players, True, timeout)
+        await measure('unshared', client, track_id, arguments.players, False, timeout)
+
+        assert client.websocket is not None
+        await client.websocket.close()
+
+    voice.send('stop')
+    voice.recv()
+    voice_process.join(timeout=5)
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.shared_streams')
+    parser.add_argument('--players', type=int, default=10, help='players to start, all playing the same track')
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(arguments, directory))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Compares encode/decode throughput and payload size of legacy (base64 json) and compact track ids.
+
+Run from the repository root with `python -m benchmarks.track_ids`.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+from collections.abc import Callable
+from typing import Any
+
+from swish.tracks import decode_track_id, encode_track_id
+
+from .common import timed
+
+
+ITERATIONS: int = 100_000
+
+INFO: dict[str, Any] = {
+    'title':      'Dua Lipa - Physical (Official Video)',
+    'identifier': '9HDEHj2yzew',
+    'url':        'https://www.youtube.com/watch?v=9HDEHj2yzew',
+    'length':     244000,
+    'author':     'Dua Lipa',
+    'author_id':  'UC-J-KZfRV8c13fOCkhXdLiQ',
+    'thumbnail':  {'url': 'https://i.ytimg.com/vi/9HDEHj2yzew/hqdefault.jpg', 'height': 360, 'width': 480},
+    'is_live':    None,
+}
+
+
+def legacy_encode(info: dict[str, Any]) -> str:
+    return base64.b64encode(json.dumps(info).encode()).decode()
+
+
+def legacy_decode(_id: str) -> dict[str, Any]:
+    return json.loads(base64.b64decode(_id).decode())
+
+
+def measure(name: str, function: Callable[[Any], Any], argument: Any) -> float:
+
+    elapsed = timed(function, ITERATIONS, argument)
+    print(f'{name:>16}: {ITERATIONS / elapsed:12,.0f} ops/s')
+    return elapsed
+
+
+def main() -> None:
+
+    legacy_id = legacy_encode(INFO)
+    compact_id = encode_track_id(INFO, 'Youtube')
+
+    print(f'{"legacy size":>16}: {len(legacy_id):12} bytes')
+    print(f'{"compact size":>16}: {len(compact_id):12} bytes')
+
+    measure('legacy encode', legacy_encode, INFO)
+    measure('compact encode', lambda info: encode_track_id(info, 'Youtube'), INFO)
+    measure('legacy decode', legacy_decode, legacy_id)
+    measure('compact decode', decode_track_id, compact_id)
+
+
+if __name__ == '__main__':
+    main()
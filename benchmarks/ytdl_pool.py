@@ -0,0 +1,68 @@
+"""Compares the per-call setup cost of constructing a YoutubeDL against checking one out of a YTDLPool.
+
+Run from the repository root with `python -m benchmarks.ytdl_pool`.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import os
+from typing import Any
+
+import yt_dlp
+
+from swish.extractor import YTDLPool
+
+from .common import timed
+
+
+ITERATIONS: int = 200
+
+OPTIONS: dict[str, Any] = {
+    'quiet':              True,
+    'no_warnings':        True,
+    'format':             'bestaudio[ext=webm][acodec=opus]/'
+                          'bestaudio[ext=mp4][acodec=aac]/'
+                          'bestvideo[ext=mp4][acodec=aac]/'
+                          'best',
+    'restrictfilenames':  False,
+    'ignoreerrors':       True,
+    'logtostderr':        False,
+    'noplaylist':         False,
+    'nocheckcertificate': True,
+    'default_search':     'auto',
+    'source_address':     '0.0.0.0',
+}
+
+
+def construct() -> None:
+
+    # mirrors the previous per-call behaviour of App._ytdl_search.
+    with yt_dlp.YoutubeDL({**OPTIONS, 'extract_flat': True}) as ytdl:  # type: ignore
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            ytdl.get_info_extractor('Youtube')
+
+
+def pooled(pool: YTDLPool) -> None:
+
+    with pool.acquire(True, '0.0.0.0') as ytdl:
+        ytdl.get_info_extractor('Youtube')
+
+
+def measure(name: str, function: Any, *args: Any) -> float:
+
+    elapsed = timed(function, ITERATIONS, *args)
+    print(f'{name:>12}: {elapsed / ITERATIONS * 1_000_000:10.1f} µs/call ({ITERATIONS} calls)')
+    return elapsed
+
+
+def main() -> None:
+
+    before = measure('construct', construct)
+    after = measure('pooled', pooled, YTDLPool(OPTIONS, max_idle=4))
+
+    print(f'{"speedup":>12}: {before / after:10.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -31,23 +31,56 @@ banner: str = """
 ## VERSION: 0.0.1alpha0 - BUILD: N/A                ##
 ###################################################### 
 """
-print(banner)
 
 
-import asyncio
-loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+# extractor worker processes are spawned and re-import this module, they must not start another server.
+if __name__ == '__main__':
 
+    import argparse
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(prog='launcher.py')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='number of worker processes sharing the server port, each with its own event loop and players.'
+    )
+    args: argparse.Namespace = parser.parse_args()
 
-from swish.logging import setup_logging
-setup_logging()
 
+    print(banner)
 
-from swish.app import App
-app: App = App()
 
+    from swish.logging import setup_logging
+    setup_logging()
 
-try:
-    loop.create_task(app.run())
-    loop.run_forever()
-except KeyboardInterrupt:
-    pass
+
+    # workers bind the port with SO_REUSEPORT and the kernel hands each new connection to one of them, a websocket
+    # connection and its players stay on that worker until it closes.
+    if args.workers > 1:
+
+        import socket
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise SystemExit('--workers requires SO_REUSEPORT, which is not supported on this platform.')
+
+        from swish.workers import Supervisor
+        Supervisor(args.workers).run()
+
+    else:
+
+        import asyncio
+        loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+
+
+        from swish.app import App
+        app: App = App()
+
+
+        try:
+            loop.create_task(app.run())
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # runs the app's cleanup hooks, which stop the extractor threads and processes.
+            if app._runner is not None:
+                loop.run_until_complete(app._runner.cleanup())
@@ -0,0 +1,157 @@
+use crate::player::SAMPLING_RATE;
+
+use parking_lot::Mutex;
+use std::sync::atomic::{AtomicBool, AtomicU64, Ordering};
+use std::sync::Arc;
+
+/// Centre frequencies of the equalizer bands.
+pub const EQUALIZER_BANDS: [f32; 15] = [
+    25.0, 40.0, 63.0, 100.0, 160.0, 250.0, 400.0, 630.0, 1000.0, 1600.0, 2500.0, 4000.0, 6300.0,
+    10000.0, 16000.0,
+];
+
+// Roughly the bandwidth of the 2/3 octave spacing between bands.
+const EQUALIZER_Q: f32 = 2.0;
+
+#[derive(Clone)]
+pub struct FilterSettings {
+    /// Linear volume multiplier.
+    pub volume: f32,
+    /// Gain per equalizer band, 0.0 leaves a band unchanged, -0.25 cuts it by
+    /// a quarter and 1.0 doubles it.
+    pub gains: [f32; 15],
+}
+
+impl Default for FilterSettings {
+    fn default() -> Self {
+        Self {
+            volume: 1.0,
+            gains: [0.0; 15],
+        }
+    }
+}
+
+impl FilterSettings {
+    pub fn is_active(&self) -> bool {
+        self.volume != 1.0 || self.gains.iter().any(|&gain| gain != 0.0)
+    }
+}
+
+/// Filter settings shared between a connection and whichever player it is
+/// running, so that changes apply to the playing track straight away.
+#[derive(Default)]
+pub struct SharedFilters {
+    settings: Mutex<FilterSettings>,
+    active: AtomicBool,
+    version: AtomicU64,
+}
+
+impl SharedFilters {
+    pub fn set(&self, settings: FilterSettings) {
+        let active = settings.is_active();
+        *self.settings.lock() = settings;
+        self.active.store(active, Ordering::Release);
+        self.version.fetch_add(1, Ordering::Release);
+    }
+
+    pub fn is_active(&self) -> bool {
+        self.active.load(Ordering::Acquire)
+    }
+}
+
+/// A peaking EQ biquad (RBJ audio EQ cookbook) in transposed direct form II.
+struct Biquad {
+    b0: f32,
+    b1: f32,
+    b2: f32,
+    a1: f32,
+    a2: f32,
+    // Per channel delay state.
+    state: [[f32; 2]; 2],
+}
+
+impl Biquad {
+    fn peaking(frequency: f32, gain: f32) -> Self {
+        // A is the square root of the linear amplitude at the centre frequency.
+        let a = (1.0 + gain).max(0.0).sqrt();
+        let w0 = 2.0 * std::f32::consts::PI * frequency / SAMPLING_RATE as f32;
+        let alpha = w0.sin() / (2.0 * EQUALIZER_Q);
+        let cos = w0.cos();
+        let a0 = 1.0 + alpha / a;
+
+        Self {
+            b0: (1.0 + alpha * a) / a0,
+            b1: -2.0 * cos / a0,
+            b2: (1.0 - alpha * a) / a0,
+            a1: -2.0 * cos / a0,
+            a2: (1.0 - alpha / a) / a0,
+            state: [[0.0; 2]; 2],
+        }
+    }
+
+    #[inline]
+    fn process(&mut self, channel: usize, x: f32) -> f32 {
+        let state = &mut self.state[channel];
+        let y = self.b0 * x + state[0];
+        state[0] = self.b1 * x - self.a1 * y + state[1];
+        state[1] = self.b2 * x - self.a2 * y;
+        y
+    }
+}
+
+/// The per player half of the filters, holding the filter state of the
+/// stream being played.
+pub struct FilterChain {
+    filters: Arc<SharedFilters>,
+    version: u64,
+    volume: f32,
+    // Only the bands with a non-zero gain.
+    bands: Vec<Biquad>,
+}
+
+impl FilterChain {
+    pub fn new(filters: Arc<SharedFilters>) -> Self {
+        Self {
+            filters,
+            version: u64::MAX,
+            volume: 1.0,
+            bands: Vec::new(),
+        }
+    }
+
+    fn rebuild(&mut self, version: u64) {
+        let settings = self.filters.settings.lock().clone();
+        self.volume = settings.volume;
+        self.bands = EQUALIZER_BANDS
+            .iter()
+            .zip(settings.gains.iter())
+            .filter(|&(_, &gain)| gain != 0.0)
+            .map(|(&frequency, &gain)| Biquad::peaking(frequency, gain))
+            .collect();
+        self.version = version;
+    }
+
+    /// Applies the filters to an interleaved stereo frame in place. Frames are
+    /// left untouched, without any copying, while no filters are active.
+    pub fn process(&mut self, pcm: &mut [i16]) {
+        if !self.filters.is_active() {
+            return;
+        }
+
+        let version = self.filters.version.load(Ordering::Acquire);
+        if version != self.version {
+            self.rebuild(version);
+        }
+
+        for frame in pcm.chunks_exact_mut(2) {
+            for (channel, sample) in frame.iter_mut().enumerate() {
+                let mut value = *sample as f32;
+                for band in self.bands.iter_mut() {
+                    value = band.process(channel, value);
+                }
+                value *= self.volume;
+                *sample = value.max(i16::MIN as f32).min(i16::MAX as f32) as i16;
+            }
+        }
+    }
+}
@@ -1,6 +1,7 @@
 use pyo3::create_exception;
 use pyo3::prelude::*;
 use pyo3::types::{PyBytes, PyDict};
+use pyo3::wrap_pyfunction;
 
 use std::sync::Arc;
 use std::thread;
@@ -8,9 +9,13 @@ use std::thread;
 use parking_lot::Mutex;
 
 pub mod error;
+pub mod filters;
+pub mod pacing;
 pub mod payloads;
 pub mod player;
 pub mod protocol;
+pub mod scheduler;
+pub mod shared;
 pub(crate) mod state;
 
 create_exception!(_native_voice, ReconnectError, pyo3::exceptions::PyException);
@@ -49,10 +54,143 @@ fn set_exception(py: Python, loop_: PyObject, future: PyObject, exception: PyErr
     Ok(())
 }
 
+/// Opus sources are passed through to discord as-is, everything else is decoded and re-encoded.
+/// The ffmpeg `filter` graph only applies to decoded sources.
+fn create_source(
+    input: &str,
+    start: u64,
+    opus: bool,
+    filter: Option<&str>,
+) -> Result<Box<dyn player::AudioSource>, error::ProtocolError> {
+    Ok(if opus {
+        Box::new(player::FFmpegOpusAudio::new(input, start)?)
+    } else {
+        Box::new(player::FFmpegPCMAudio::new(input, start, filter)?)
+    })
+}
+
+fn filter_settings(volume: f32, equalizer: Vec<f32>) -> PyResult<filters::FilterSettings> {
+    if volume < 0.0 || volume > 5.0 {
+        return Err(pyo3::exceptions::PyValueError::new_err(
+            "volume must be between 0.0 and 5.0",
+        ));
+    }
+    let mut settings = filters::FilterSettings {
+        volume,
+        ..Default::default()
+    };
+    if equalizer.len() > settings.gains.len() {
+        return Err(pyo3::exceptions::PyValueError::new_err(
+            "equalizer can have at most 15 bands",
+        ));
+    }
+    for (index, gain) in equalizer.into_iter().enumerate() {
+        if gain < -0.25 || gain > 1.0 {
+            return Err(pyo3::exceptions::PyValueError::new_err(
+                "equalizer gains must be between -0.25 and 1.0",
+            ));
+        }
+        settings.gains[index] = gain;
+    }
+    Ok(settings)
+}
+
+/// Opus encoder settings that can be applied to connections and shared streams.
+#[pyclass]
+#[derive(Clone)]
+struct EncoderProfile {
+    settings: player::EncoderSettings,
+}
+
+#[pymethods]
+impl EncoderProfile {
+    #[new]
+    #[args(
+        bitrate = "128000",
+        complexity = "10",
+        fec = "true",
+        packet_loss = "15",
+        bandwidth = "\"fullband\""
+    )]
+    fn new(
+        bitrate: i32,
+        complexity: u8,
+        fec: bool,
+        packet_loss: u8,
+        bandwidth: &str,
+    ) -> PyResult<Self> {
+        if bitrate < 500 || bitrate > 512000 {
+            return Err(pyo3::exceptions::PyValueError::new_err(
+                "bitrate must be between 500 and 512000",
+            ));
+        }
+        if complexity > 10 {
+            return Err(pyo3::exceptions::PyValueError::new_err(
+                "complexity must be between 0 and 10",
+            ));
+        }
+        if packet_loss > 100 {
+            return Err(pyo3::exceptions::PyValueError::new_err(
+                "packet_loss must be between 0 and 100",
+            ));
+        }
+        let bandwidth = match bandwidth {
+            "auto" => audiopus::Bandwidth::Auto,
+            "narrowband" => audiopus::Bandwidth::Narrowband,
+            "mediumband" => audiopus::Bandwidth::Mediumband,
+            "wideband" => audiopus::Bandwidth::Wideband,
+            "superwideband" => audiopus::Bandwidth::Superwideband,
+            "fullband" => audiopus::Bandwidth::Fullband,
+            _ => {
+                return Err(pyo3::exceptions::PyValueError::new_err(
+                    "unknown bandwidth",
+                ))
+            }
+        };
+        Ok(Self {
+            settings: player::EncoderSettings {
+                bitrate,
+                complexity,
+                fec,
+                packet_loss,
+                bandwidth,
+            },
+        })
+    }
+
+    #[getter]
+    fn bitrate(&self) -> i32 {
+        self.settings.bitrate
+    }
+
+    #[getter]
+    fn complexity(&self) -> u8 {
+        self.settings.complexity
+    }
+
+    #[getter]
+    fn fec(&self) -> bool {
+        self.settings.fec
+    }
+
+    #[getter]
+    fn packet_loss(&self) -> u8 {
+        self.settings.packet_loss
+    }
+}
+
 #[pyclass]
 struct VoiceConnection {
     protocol: Arc<Mutex<protocol::DiscordVoiceProtocol>>,
     player: Option<player::AudioPlayer>,
+    // The encoder settings used by players started on this connection.
+    encoder: player::EncoderSettings,
+    // An already spawned source for the input that is expected to be played next.
+    prefetched: Option<(String, Box<dyn player::AudioSource>)>,
+    // Volume and equalizer, applied live to whichever player is running.
+    filters: Arc<filters::SharedFilters>,
+    // Send timing of every player that ran on this connection.
+    pacing: Arc<pacing::PacingStats>,
 }
 
 #[pymethods]
@@ -103,24 +241,114 @@ impl VoiceConnection {
         }
     }
 
-    fn play(&mut self, input: String) -> PyResult<()> {
-        if let Some(player) = &self.player {
-            player.stop();
+    #[args(start = "0", end = "None", opus = "false", filter = "None", rate = "1.0")]
+    #[text_signature = "(input, start=0, end=None, opus=False, filter=None, rate=1.0)"]
+    fn play(
+        &mut self,
+        input: String,
+        start: u64,
+        end: Option<u64>,
+        opus: bool,
+        filter: Option<String>,
+        rate: f64,
+    ) -> PyResult<()> {
+        if let Some(player) = self.player.take() {
+            player.cancel();
+        }
+
+        // Re-use the warmed up source if it was prefetched for this input, otherwise it's
+        // kept around as seeking replays the current input and the next track is unchanged.
+        let source: Box<dyn player::AudioSource> = match self.prefetched.take() {
+            Some((prefetched_input, source))
+                if prefetched_input == input
+                    && start == 0
+                    && filter.is_none()
+                    && matches!(source.get_type(), player::AudioType::Opus) == opus =>
+            {
+                source
+            }
+            prefetched => {
+                self.prefetched = prefetched;
+                create_source(input.as_str(), start, opus, filter.as_deref())?
+            }
+        };
+        let player = player::AudioPlayer::new(
+            |error| {
+                // println!("Audio Player Error: {:?}", error);
+            },
+            Arc::clone(&self.protocol),
+            Arc::new(Mutex::new(source)),
+            player::PlayOptions {
+                start,
+                end,
+                rate,
+                settings: self.encoder,
+                filters: Arc::clone(&self.filters),
+                pacing: Arc::clone(&self.pacing),
+            },
+        );
+
+        self.player = Some(player);
+        Ok(())
+    }
+
+    /// Takes effect for tracks played afterwards.
+    #[text_signature = "(profile, /)"]
+    fn set_encoder_profile(&mut self, profile: PyRef<EncoderProfile>) {
+        self.encoder = profile.settings;
+    }
+
+    /// Applies straight away to decoded sources, Opus sources are sent as-is.
+    #[args(volume = "1.0", equalizer = "Vec::new()")]
+    #[text_signature = "(volume=1.0, equalizer=[])"]
+    fn set_filters(&mut self, volume: f32, equalizer: Vec<f32>) -> PyResult<()> {
+        self.filters.set(filter_settings(volume, equalizer)?);
+        Ok(())
+    }
+
+    #[args(end = "None")]
+    #[text_signature = "(stream, end=None)"]
+    fn play_shared(&mut self, stream: PyRef<SharedStream>, end: Option<u64>) -> PyResult<()> {
+        if let Some(player) = self.player.take() {
+            player.cancel();
         }
 
-        let source = Box::new(player::FFmpegPCMAudio::new(input.as_str())?);
+        let source = shared::BroadcastSource::new(Arc::clone(&stream.broadcast));
+        let start = source.position();
+        let source: Box<dyn player::AudioSource> = Box::new(source);
         let player = player::AudioPlayer::new(
             |error| {
                 // println!("Audio Player Error: {:?}", error);
             },
             Arc::clone(&self.protocol),
             Arc::new(Mutex::new(source)),
+            player::PlayOptions {
+                start,
+                end,
+                rate: 1.0,
+                // Shared frames arrive already encoded with the stream's profile.
+                settings: self.encoder,
+                filters: Arc::clone(&self.filters),
+                pacing: Arc::clone(&self.pacing),
+            },
         );
 
         self.player = Some(player);
         Ok(())
     }
 
+    #[args(opus = "false")]
+    #[text_signature = "(input, opus=False)"]
+    fn prefetch(&mut self, input: String, opus: bool) -> PyResult<()> {
+        let source = create_source(input.as_str(), 0, opus, None)?;
+        self.prefetched = Some((input, source));
+        Ok(())
+    }
+
+    fn discard_prefetch(&mut self) {
+        self.prefetched = None;
+    }
+
     fn pause(&mut self) {
         if let Some(player) = &self.player {
             player.pause();
@@ -149,6 +377,26 @@ impl VoiceConnection {
         }
     }
 
+    fn position(&self) -> u64 {
+        if let Some(player) = &self.player {
+            player.position()
+        } else {
+            0
+        }
+    }
+
+    /// Durations are in milliseconds.
+    fn pacing_stats<'py>(&self, py: Python<'py>) -> PyResult<&'py PyDict> {
+        let result = PyDict::new(py);
+        let pacing = &self.pacing;
+        result.set_item("frames", pacing.frames())?;
+        result.set_item("late_frames", pacing.late_frames())?;
+        result.set_item("jitter", pacing.jitter().as_secs_f64() * 1000.0)?;
+        result.set_item("max_lateness", pacing.max_lateness().as_secs_f64() * 1000.0)?;
+        result.set_item("drift", pacing.drift().as_secs_f64() * 1000.0)?;
+        Ok(result)
+    }
+
     #[getter]
     fn encryption_mode(&self) -> PyResult<String> {
         let encryption = {
@@ -188,10 +436,57 @@ impl VoiceConnection {
             proto.last_heartbeat.elapsed().as_secs_f32(),
         )?;
         result.set_item("player_connected", self.player.is_some())?;
+        result.set_item("prefetched", self.prefetched.is_some())?;
+        result.set_item("pacing", self.pacing_stats(py)?)?;
         Ok(result)
     }
 }
 
+/// One decoding pipeline that any number of connections can play through play_shared.
+#[pyclass]
+struct SharedStream {
+    broadcast: Arc<shared::Broadcast>,
+}
+
+#[pymethods]
+impl SharedStream {
+    #[new]
+    #[args(
+        start = "0",
+        opus = "false",
+        buffer_frames = "50",
+        idle_timeout = "5.0",
+        profile = "None"
+    )]
+    fn new(
+        input: String,
+        start: u64,
+        opus: bool,
+        buffer_frames: usize,
+        idle_timeout: f64,
+        profile: Option<PyRef<EncoderProfile>>,
+    ) -> PyResult<Self> {
+        let source = create_source(input.as_str(), start, opus, None)?;
+        let broadcast = shared::Broadcast::spawn(
+            source,
+            start,
+            buffer_frames,
+            std::time::Duration::from_secs_f64(idle_timeout),
+            profile.map_or_else(Default::default, |profile| profile.settings),
+        );
+        Ok(Self { broadcast })
+    }
+
+    #[getter]
+    fn subscribers(&self) -> usize {
+        self.broadcast.subscribers()
+    }
+
+    fn is_finished(&self) -> bool {
+        self.broadcast.is_finished()
+    }
+}
+
 #[pyclass]
 struct VoiceConnector {
     #[pyo3(get, set)]
@@ -264,6 +559,10 @@ impl VoiceConnector {
                     let object = VoiceConnection {
                         protocol: Arc::new(Mutex::new(protocol)),
                         player: None,
+                        encoder: Default::default(),
+                        prefetched: None,
+                        filters: Default::default(),
+                        pacing: Default::default(),
                     };
                     set_result(py, loop_, future, object.into_py(py))
                 }
@@ -285,30 +584,20 @@ struct Debugger {
     #[pyo3(get, set)]
     ssrc: u32,
     lite_nonce: u32,
-}
-
-fn get_encoder() -> Result<audiopus::coder::Encoder, error::ProtocolError> {
-    let mut encoder = audiopus::coder::Encoder::new(
-        audiopus::SampleRate::Hz48000,
-        audiopus::Channels::Stereo,
-        audiopus::Application::Audio,
-    )?;
-
-    encoder.set_bitrate(audiopus::Bitrate::BitsPerSecond(128 * 1024))?;
-    encoder.enable_inband_fec()?;
-    encoder.set_packet_loss_perc(15)?;
-    encoder.set_bandwidth(audiopus::Bandwidth::Fullband)?;
-    encoder.set_signal(audiopus::Signal::Auto)?;
-    Ok(encoder)
+    filters: Arc<filters::SharedFilters>,
+    chain: filters::FilterChain,
 }
 
 #[pymethods]
 impl Debugger {
     #[new]
-    fn new(secret_key: Vec<u8>) -> PyResult<Self> {
-        let encoder = get_encoder()?;
+    #[args(profile = "None")]
+    fn new(secret_key: Vec<u8>, profile: Option<PyRef<EncoderProfile>>) -> PyResult<Self> {
+        let settings = profile.map_or_else(Default::default, |profile| profile.settings);
+        let encoder = player::create_opus_encoder(&settings)?;
         let key = GenericArray::clone_from_slice(secret_key.as_ref());
         let cipher = XSalsa20Poly1305::new(&key);
+        let filters: Arc<filters::SharedFilters> = Default::default();
         Ok(Self {
             opus: encoder,
             cipher,
@@ -316,9 +605,37 @@ impl Debugger {
             timestamp: 0,
             ssrc: 0,
             lite_nonce: 0,
+            chain: filters::FilterChain::new(Arc::clone(&filters)),
+            filters,
         })
     }
 
+    #[args(volume = "1.0", equalizer = "Vec::new()")]
+    #[text_signature = "(volume=1.0, equalizer=[])"]
+    fn set_filters(&mut self, volume: f32, equalizer: Vec<f32>) -> PyResult<()> {
+        self.filters.set(filter_settings(volume, equalizer)?);
+        Ok(())
+    }
+
+    fn filter_pcm<'py>(&mut self, py: Python<'py>, buffer: &PyBytes) -> PyResult<&'py PyBytes> {
+        let bytes = buffer.as_bytes();
+        if bytes.len() != 3840 {
+            return Err(pyo3::exceptions::PyValueError::new_err(
+                "byte length must be 3840 bytes",
+            ));
+        }
+
+        let mut pcm = [0i16; 1920];
+        for (sample, chunk) in pcm.iter_mut().zip(bytes.chunks_exact(2)) {
+            *sample = i16::from_ne_bytes([chunk[0], chunk[1]]);
+        }
+        self.chain.process(&mut pcm);
+
+        let output: &[u8] =
+            unsafe { std::slice::from_raw_parts(pcm.as_ptr() as *const u8, bytes.len()) };
+        Ok(PyBytes::new(py, output))
+    }
+
     fn encode_opus<'py>(&self, py: Python<'py>, buffer: &PyBytes) -> PyResult<&'py PyBytes> {
         let bytes = buffer.as_bytes();
         if bytes.len() != 3840 {
@@ -397,11 +714,45 @@ impl Debugger {
     }
 }
 
+/// Makes every player started afterwards share `threads` sender threads instead
+/// of each running its own. Returns false if the scheduler was already started.
+#[pyfunction]
+#[text_signature = "(threads, /)"]
+fn start_scheduler(threads: usize) -> bool {
+    scheduler::start(threads)
+}
+
+/// The number of players driven by the scheduler, or None if it isn't running.
+#[pyfunction]
+fn scheduler_players() -> Option<usize> {
+    scheduler::get().map(|scheduler| scheduler.players())
+}
+
+/// The number of running ffmpeg processes, including prefetched and shared sources.
+#[pyfunction]
+fn ffmpeg_processes() -> usize {
+    player::ffmpeg_processes()
+}
+
+/// Makes players started afterwards spin for the last `microseconds` before each
+/// frame instead of sleeping, for tighter send timing at the cost of CPU time.
+#[pyfunction]
+#[text_signature = "(microseconds, /)"]
+fn set_spin_margin(microseconds: u64) {
+    pacing::set_spin_margin(std::time::Duration::from_micros(microseconds))
+}
+
 #[pymodule]
 fn native_voice(py: Python, m: &PyModule) -> PyResult<()> {
     m.add_class::<VoiceConnection>()?;
     m.add_class::<VoiceConnector>()?;
+    m.add_class::<SharedStream>()?;
+    m.add_class::<EncoderProfile>()?;
     m.add_class::<Debugger>()?;
+    m.add_wrapped(wrap_pyfunction!(start_scheduler))?;
+    m.add_wrapped(wrap_pyfunction!(scheduler_players))?;
+    m.add_wrapped(wrap_pyfunction!(set_spin_margin))?;
+    m.add_wrapped(wrap_pyfunction!(ffmpeg_processes))?;
     m.add("ReconnectError", py.get_type::<ReconnectError>())?;
     m.add("ConnectionError", py.get_type::<ConnectionError>())?;
     m.add("ConnectionClosed", py.get_type::<ConnectionClosed>())?;
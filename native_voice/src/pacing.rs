@@ -0,0 +1,161 @@
+use crate::player::FRAME_LENGTH;
+
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::thread;
+use std::time::{Duration, Instant};
+
+// Frames sent later than this after their deadline are counted as late.
+const LATE_THRESHOLD: Duration = Duration::from_millis(5);
+
+static SPIN_MARGIN: AtomicU64 = AtomicU64::new(0);
+
+/// Sets how long before each deadline pacers stop sleeping and spin instead.
+/// Sleeps can overshoot by a scheduler timeslice, spinning trades CPU time for
+/// tighter timing. Applies to pacers created afterwards, zero disables spinning.
+pub fn set_spin_margin(margin: Duration) {
+    SPIN_MARGIN.store(margin.as_nanos() as u64, Ordering::Relaxed);
+}
+
+fn frame_length() -> Duration {
+    Duration::from_millis(FRAME_LENGTH as u64)
+}
+
+/// Keeps frames on a fixed timeline of 20ms deadlines. A frame sent late is
+/// followed by the next one straight away instead of shifting every following
+/// deadline, only when more than a whole frame behind is the timeline moved
+/// forward, which is reported as drift.
+pub struct Pacer {
+    // Pacers sharing an epoch wake on the same ticks.
+    epoch: Option<Instant>,
+    deadline: Instant,
+    spin: Duration,
+}
+
+impl Pacer {
+    pub fn new() -> Self {
+        Self {
+            epoch: None,
+            deadline: Instant::now(),
+            spin: Duration::from_nanos(SPIN_MARGIN.load(Ordering::Relaxed)),
+        }
+    }
+
+    /// A pacer whose deadlines are aligned to multiples of 20ms from `epoch`.
+    pub fn aligned(epoch: Instant) -> Self {
+        let mut pacer = Self::new();
+        pacer.epoch = Some(epoch);
+        pacer.reset();
+        pacer
+    }
+
+    /// The deadline of the current frame.
+    pub fn deadline(&self) -> Instant {
+        self.deadline
+    }
+
+    /// Restarts the timeline after a pause, so that the time spent waiting isn't
+    /// counted against the frames sent afterwards.
+    pub fn reset(&mut self) {
+        let now = Instant::now();
+        self.deadline = match self.epoch {
+            Some(epoch) => {
+                let frame = frame_length().as_nanos();
+                let into_tick = (now - epoch).as_nanos() % frame;
+                now - Duration::from_nanos(into_tick as u64)
+            }
+            None => now,
+        };
+    }
+
+    /// Moves on to the next deadline and waits for it. Returns how far the
+    /// timeline was moved forward to catch up.
+    pub fn wait(&mut self) -> Duration {
+        let frame = frame_length();
+        let mut next = self.deadline + frame;
+        let mut skipped = Duration::from_secs(0);
+
+        let now = Instant::now();
+        if now >= next + frame {
+            let behind = ((now - next).as_nanos() / frame.as_nanos()) as u32;
+            skipped = frame * behind;
+            next += skipped;
+        }
+
+        self.deadline = next;
+        sleep_until(next, self.spin);
+        skipped
+    }
+}
+
+fn sleep_until(deadline: Instant, spin: Duration) {
+    let now = Instant::now();
+    if deadline <= now {
+        return;
+    }
+    let remaining = deadline - now;
+    if remaining > spin {
+        thread::sleep(remaining - spin);
+    }
+    while Instant::now() < deadline {
+        std::hint::spin_loop();
+    }
+}
+
+/// Send timing of a connection. Written by whichever thread sends its frames
+/// and read from python, so everything is a relaxed atomic.
+#[derive(Default)]
+pub struct PacingStats {
+    frames: AtomicU64,
+    late_frames: AtomicU64,
+    // Nanoseconds.
+    jitter: AtomicU64,
+    last_lateness: AtomicU64,
+    max_lateness: AtomicU64,
+    drift: AtomicU64,
+}
+
+impl PacingStats {
+    /// Records a frame sent `lateness` after its deadline, after the timeline
+    /// was moved forward by `skipped` to reach that deadline.
+    pub fn record(&self, lateness: Duration, skipped: Duration) {
+        let lateness = lateness.as_nanos() as u64;
+
+        self.frames.fetch_add(1, Ordering::Relaxed);
+        if lateness > LATE_THRESHOLD.as_nanos() as u64 {
+            self.late_frames.fetch_add(1, Ordering::Relaxed);
+        }
+        self.max_lateness.fetch_max(lateness, Ordering::Relaxed);
+        self.drift
+            .fetch_add(skipped.as_nanos() as u64, Ordering::Relaxed);
+
+        // Smoothed like RTP interarrival jitter (RFC 3550), from the change in
+        // lateness between consecutive frames.
+        let last = self.last_lateness.swap(lateness, Ordering::Relaxed);
+        let jitter = self.jitter.load(Ordering::Relaxed) as i64;
+        let difference = (lateness as i64 - last as i64).abs();
+        self.jitter
+            .store((jitter + (difference - jitter) / 16) as u64, Ordering::Relaxed);
+    }
+
+    pub fn frames(&self) -> u64 {
+        self.frames.load(Ordering::Relaxed)
+    }
+
+    pub fn late_frames(&self) -> u64 {
+        self.late_frames.load(Ordering::Relaxed)
+    }
+
+    pub fn jitter(&self) -> Duration {
+        Duration::from_nanos(self.jitter.load(Ordering::Relaxed))
+    }
+
+    pub fn max_lateness(&self) -> Duration {
+        Duration::from_nanos(self.max_lateness.load(Ordering::Relaxed))
+    }
+
+    /// How far the timeline has been moved forward in total, audio that was
+    /// due but never sent on time.
+    pub fn drift(&self) -> Duration {
+        Duration::from_nanos(self.drift.load(Ordering::Relaxed))
+    }
+}
@@ -1,17 +1,26 @@
 use crate::error::ProtocolError;
+use crate::filters::{FilterChain, SharedFilters};
+use crate::pacing::{Pacer, PacingStats};
 use crate::payloads::{EncryptionMode, SpeakingFlags};
 use crate::protocol::DiscordVoiceProtocol;
+use crate::scheduler;
 use crate::state::PlayingState;
 
 use parking_lot::Mutex;
 use std::io::ErrorKind;
 use std::io::Read;
 use std::net::UdpSocket;
+use std::sync::atomic::{AtomicBool, AtomicU64, AtomicUsize, Ordering};
 use std::sync::Arc;
 use std::thread;
 use std::time::{Duration, Instant};
 
-use std::process::{Child, Command, Stdio};
+use std::process::{Child, ChildStdout, Command, Stdio};
+
+#[cfg(unix)]
+use std::os::unix::io::AsRawFd;
+#[cfg(windows)]
+use std::os::windows::io::AsRawHandle;
 
 use rand::RngCore;
 use xsalsa20poly1305::aead::Buffer;
@@ -49,59 +58,412 @@ pub trait AudioSource: Send {
     fn read_opus_frame(&mut self, _buffer: &mut [u8]) -> Option<usize> {
         unimplemented!()
     }
+
+    /// Whether reading a frame would return without waiting on the producer of
+    /// the audio. The scheduler skips sources that aren't ready for a tick instead
+    /// of stalling every other player on the same sender thread.
+    fn is_ready(&mut self) -> bool {
+        true
+    }
+}
+
+static FFMPEG_PROCESSES: AtomicUsize = AtomicUsize::new(0);
+
+/// The number of ffmpeg processes spawned by sources that are still alive.
+pub fn ffmpeg_processes() -> usize {
+    FFMPEG_PROCESSES.load(Ordering::Relaxed)
+}
+
+/// Spawns ffmpeg reading `input` from `start` milliseconds in, writing to stdout.
+/// The source owning the process has to call `kill_ffmpeg` once it's dropped.
+fn spawn_ffmpeg(input: &str, start: u64, output: &[&str]) -> Result<Child, ProtocolError> {
+    let mut command = Command::new("ffmpeg");
+    command.args(&[
+        "-reconnect",
+        "1",
+        "-reconnect_streamed",
+        "1",
+        "-reconnect_delay_max",
+        "5",
+    ]);
+    if start > 0 {
+        // -ss before -i seeks the input (by keyframe/byte range for remote streams)
+        // rather than decoding and discarding everything up to the offset.
+        command
+            .arg("-ss")
+            .arg(format!("{}.{:03}", start / 1000, start % 1000));
+    }
+    let process = command
+        .arg("-i")
+        .arg(&input)
+        .args(output)
+        .args(&["-loglevel", "panic", "pipe:1"])
+        .stdout(Stdio::piped())
+        .stderr(Stdio::null()) // no output lol
+        .spawn()?;
+    FFMPEG_PROCESSES.fetch_add(1, Ordering::Relaxed);
+    Ok(process)
+}
+
+fn kill_ffmpeg(process: &mut Child) {
+    FFMPEG_PROCESSES.fetch_sub(1, Ordering::Relaxed);
+    if let Err(e) = process.kill() {
+        println!("Could not kill ffmpeg process: {:?}", e);
+    }
+}
+
+/// ffmpeg's stdout, read without ever waiting on ffmpeg. Sources keep the part
+/// of a frame read so far and fill it from the thread sending their audio, a
+/// stalled ffmpeg then holds up its own player rather than every player on the
+/// same sender thread, without each source needing a reader thread of its own.
+struct PipeReader {
+    stdout: ChildStdout,
+    finished: bool,
+}
+
+impl PipeReader {
+    fn new(stdout: ChildStdout) -> Self {
+        #[cfg(unix)]
+        unsafe {
+            let fd = stdout.as_raw_fd();
+            let flags = libc::fcntl(fd, libc::F_GETFL);
+            libc::fcntl(fd, libc::F_SETFL, flags | libc::O_NONBLOCK);
+        }
+        Self {
+            stdout,
+            finished: false,
+        }
+    }
+
+    #[cfg(unix)]
+    fn read_available(&mut self, buffer: &mut [u8]) -> std::io::Result<usize> {
+        self.stdout.read(buffer)
+    }
+
+    // Anonymous pipes can't be made non-blocking on Windows, so only the bytes
+    // already in the pipe are read.
+    #[cfg(windows)]
+    fn read_available(&mut self, buffer: &mut [u8]) -> std::io::Result<usize> {
+        let mut available = 0u32;
+        let peeked = unsafe {
+            PeekNamedPipe(
+                self.stdout.as_raw_handle(),
+                std::ptr::null_mut(),
+                0,
+                std::ptr::null_mut(),
+                &mut available,
+                std::ptr::null_mut(),
+            )
+        };
+        if peeked == 0 {
+            // The pipe is broken once ffmpeg exited and everything was read.
+            return Ok(0);
+        }
+        if available == 0 {
+            return Err(ErrorKind::WouldBlock.into());
+        }
+        let length = buffer.len().min(available as usize);
+        self.stdout.read(&mut buffer[..length])
+    }
+
+    /// Reads whatever is available into `buffer` after the `filled` bytes it
+    /// already holds, returns whether it is full.
+    fn fill(&mut self, buffer: &mut [u8], filled: &mut usize) -> bool {
+        while *filled < buffer.len() && !self.finished {
+            match self.read_available(&mut buffer[*filled..]) {
+                Ok(0) => self.finished = true,
+                Ok(size) => *filled += size,
+                Err(ref e) if e.kind() == ErrorKind::WouldBlock => break,
+                Err(ref e) if e.kind() == ErrorKind::Interrupted => {}
+                Err(_) => self.finished = true,
+            }
+        }
+        *filled == buffer.len()
+    }
+
+    /// Waits up to a frame for ffmpeg to write more, for blocking reads.
+    fn wait(&self) {
+        #[cfg(unix)]
+        unsafe {
+            let mut fd = libc::pollfd {
+                fd: self.stdout.as_raw_fd(),
+                events: libc::POLLIN,
+                revents: 0,
+            };
+            libc::poll(&mut fd, 1, FRAME_LENGTH as libc::c_int);
+        }
+        #[cfg(windows)]
+        thread::sleep(Duration::from_millis(1));
+    }
+}
+
+#[cfg(windows)]
+extern "system" {
+    fn PeekNamedPipe(
+        pipe: std::os::windows::io::RawHandle,
+        buffer: *mut std::ffi::c_void,
+        size: u32,
+        read: *mut u32,
+        available: *mut u32,
+        left: *mut u32,
+    ) -> i32;
 }
 
 pub struct FFmpegPCMAudio {
     process: Child,
+    stdout: PipeReader,
+    // The frame being read and how much of it has been.
+    frame: Vec<u8>,
+    filled: usize,
 }
 
 impl FFmpegPCMAudio {
-    pub fn new(input: &str) -> Result<Self, ProtocolError> {
-        let process = Command::new("ffmpeg")
-            .args(&[
-                "-reconnect",
-                "1",
-                "-reconnect_streamed",
-                "1",
-                "-reconnect_delay_max",
-                "5",
-            ])
-            .arg("-i")
-            .arg(&input)
-            .args(&[
-                "-f",
-                "s16le",
-                "-ar",
-                "48000",
-                "-ac",
-                "2",
-                "-loglevel",
-                "panic",
-                "pipe:1",
-            ])
-            .stdout(Stdio::piped())
-            .stderr(Stdio::null()) // no output lol
-            .spawn()?;
-        Ok(Self { process })
+    /// Spawns ffmpeg decoding `input`, starting `start` milliseconds in and
+    /// running the decoded audio through the `filter` graph if given.
+    pub fn new(input: &str, start: u64, filter: Option<&str>) -> Result<Self, ProtocolError> {
+        let mut output = vec!["-f", "s16le", "-ar", "48000", "-ac", "2"];
+        if let Some(filter) = filter {
+            output.extend_from_slice(&["-af", filter]);
+        }
+        let mut process = spawn_ffmpeg(input, start, &output)?;
+        let stdout = PipeReader::new(process.stdout.take().unwrap());
+        Ok(Self {
+            process,
+            stdout,
+            frame: vec![0u8; FRAME_SIZE as usize],
+            filled: 0,
+        })
+    }
+
+    /// Reads what's available of the current frame, returns whether all of it is.
+    fn fill(&mut self) -> bool {
+        self.stdout.fill(&mut self.frame, &mut self.filled)
     }
 }
 
 impl AudioSource for FFmpegPCMAudio {
     fn read_pcm_frame(&mut self, buffer: &mut [i16]) -> Option<usize> {
-        let stdout = self.process.stdout.as_mut().unwrap();
+        while !self.fill() {
+            // A partial frame at the end of the stream is dropped.
+            if self.stdout.finished {
+                return None;
+            }
+            self.stdout.wait();
+        }
+        self.filled = 0;
         let bytes = unsafe {
             std::slice::from_raw_parts_mut(buffer.as_mut_ptr() as *mut u8, buffer.len() * 2)
         };
-        stdout.read_exact(bytes).map(|_| buffer.len()).ok()
+        bytes.copy_from_slice(&self.frame);
+        Some(buffer.len())
+    }
+
+    fn is_ready(&mut self) -> bool {
+        self.fill() || self.stdout.finished
     }
 }
 
 impl Drop for FFmpegPCMAudio {
     fn drop(&mut self) {
-        if let Err(e) = self.process.kill() {
-            println!("Could not kill ffmpeg process: {:?}", e);
+        kill_ffmpeg(&mut self.process);
+    }
+}
+
+/// The maximum size of a single Opus packet.
+pub const MAX_OPUS_PACKET_SIZE: usize = 1275;
+
+/// The parts of an Ogg page, read one after the other.
+enum PageStage {
+    // Capture pattern, version, header type, granule position, serial,
+    // sequence number, checksum and finally the number of segments.
+    Header,
+    Lacing,
+    Body,
+}
+
+/// Splits an Ogg stream back into the packets it contains. Pages are read as
+/// ffmpeg writes them, a packet is only returned once all of it has been.
+struct OggPacketReader {
+    stdout: PipeReader,
+    stage: PageStage,
+    // How much of the current stage has been read.
+    filled: usize,
+    header: [u8; 27],
+    lacing: [u8; 255],
+    lacing_count: usize,
+    lacing_index: usize,
+    page: Vec<u8>,
+    page_offset: usize,
+    // The most recently read packet, complete once returned.
+    packet: Vec<u8>,
+    packet_complete: bool,
+    invalid: bool,
+}
+
+impl OggPacketReader {
+    fn new(stdout: PipeReader) -> Self {
+        Self {
+            stdout,
+            stage: PageStage::Header,
+            filled: 0,
+            header: [0; 27],
+            lacing: [0; 255],
+            lacing_count: 0,
+            lacing_index: 0,
+            page: Vec::with_capacity(u16::MAX as usize),
+            page_offset: 0,
+            packet: Vec::with_capacity(MAX_OPUS_PACKET_SIZE),
+            packet_complete: false,
+            invalid: false,
+        }
+    }
+
+    /// Whether no more packets will be read.
+    fn is_finished(&self) -> bool {
+        self.stdout.finished || self.invalid
+    }
+
+    /// Reads what's available of the next page, returns true once all of it is.
+    fn read_page(&mut self) -> bool {
+        loop {
+            match self.stage {
+                PageStage::Header => {
+                    if !self.stdout.fill(&mut self.header, &mut self.filled) {
+                        return false;
+                    }
+                    if &self.header[0..4] != b"OggS" {
+                        self.invalid = true;
+                        return false;
+                    }
+                    self.stage = PageStage::Lacing;
+                }
+                PageStage::Lacing => {
+                    let count = self.header[26] as usize;
+                    if !self.stdout.fill(&mut self.lacing[..count], &mut self.filled) {
+                        return false;
+                    }
+                    let size = self.lacing[..count]
+                        .iter()
+                        .map(|&value| value as usize)
+                        .sum();
+                    self.page.resize(size, 0);
+                    self.stage = PageStage::Body;
+                }
+                PageStage::Body => {
+                    if !self.stdout.fill(&mut self.page, &mut self.filled) {
+                        return false;
+                    }
+                    self.lacing_count = self.header[26] as usize;
+                    self.lacing_index = 0;
+                    self.page_offset = 0;
+                    self.stage = PageStage::Header;
+                    self.filled = 0;
+                    return true;
+                }
+            }
+            self.filled = 0;
         }
     }
+
+    /// Reads the next packet, returns None until all of it has been read.
+    fn next_packet(&mut self) -> Option<&[u8]> {
+        if self.packet_complete {
+            self.packet.clear();
+            self.packet_complete = false;
+        }
+        loop {
+            if self.lacing_index == self.lacing_count {
+                if !self.read_page() {
+                    return None;
+                }
+                continue;
+            }
+
+            // A segment shorter than 255 bytes terminates the packet, otherwise
+            // the packet continues in the next segment (possibly on the next page).
+            let length = self.lacing[self.lacing_index] as usize;
+            self.lacing_index += 1;
+            self.packet
+                .extend_from_slice(&self.page[self.page_offset..self.page_offset + length]);
+            self.page_offset += length;
+
+            if length < 255 {
+                self.packet_complete = true;
+                return Some(&self.packet);
+            }
+        }
+    }
+}
+
+/// Passes Opus packets from the source through as-is, ffmpeg only remuxes them
+/// into Ogg so there is no decoding or re-encoding. The source has to be
+/// 48kHz Opus with 20ms frames, which is what webm/opus streams contain.
+pub struct FFmpegOpusAudio {
+    process: Child,
+    reader: OggPacketReader,
+    // Whether the reader holds an audio packet that hasn't been played yet.
+    ready: bool,
+}
+
+impl FFmpegOpusAudio {
+    pub fn new(input: &str, start: u64) -> Result<Self, ProtocolError> {
+        let mut process = spawn_ffmpeg(
+            input,
+            start,
+            // Flushing a page per packet keeps ffmpeg from buffering a second of audio.
+            &["-vn", "-c:a", "copy", "-f", "ogg", "-page_duration", "20000"],
+        )?;
+        let reader = OggPacketReader::new(PipeReader::new(process.stdout.take().unwrap()));
+        Ok(Self {
+            process,
+            reader,
+            ready: false,
+        })
+    }
+
+    /// Reads what's available up to the next audio packet, returns whether all
+    /// of it is.
+    fn fill(&mut self) -> bool {
+        while !self.ready {
+            let packet = match self.reader.next_packet() {
+                Some(packet) => packet,
+                None => return false,
+            };
+            // Skip the identification and comment header packets.
+            let header = packet.starts_with(b"OpusHead") || packet.starts_with(b"OpusTags");
+            self.ready = !header && packet.len() <= MAX_OPUS_PACKET_SIZE;
+        }
+        true
+    }
+}
+
+impl AudioSource for FFmpegOpusAudio {
+    fn get_type(&self) -> AudioType {
+        AudioType::Opus
+    }
+
+    fn read_opus_frame(&mut self, buffer: &mut [u8]) -> Option<usize> {
+        while !self.fill() {
+            if self.reader.is_finished() {
+                return None;
+            }
+            self.reader.stdout.wait();
+        }
+        self.ready = false;
+        let packet = &self.reader.packet;
+        buffer[..packet.len()].copy_from_slice(packet);
+        Some(packet.len())
+    }
+
+    fn is_ready(&mut self) -> bool {
+        self.fill() || self.reader.is_finished()
+    }
+}
+
+impl Drop for FFmpegOpusAudio {
+    fn drop(&mut self) {
+        kill_ffmpeg(&mut self.process);
+    }
 }
 
 /// In order to efficiently manage a buffer we need to prepend some bytes during
@@ -175,6 +537,56 @@ pub const MAX_BUFFER_SIZE: usize = 1275 + 24 + 12 + 24 + 16 + 12;
 pub const BUFFER_OFFSET: usize = 12;
 type PacketBuffer = [u8; MAX_BUFFER_SIZE];
 
+/// The Opus encoder settings used for PCM sources.
+#[derive(Clone, Copy)]
+pub struct EncoderSettings {
+    pub bitrate: i32,
+    /// 0 (fastest) to 10 (best quality).
+    pub complexity: u8,
+    /// Whether in-band forward error correction is enabled.
+    pub fec: bool,
+    /// The expected packet loss percentage, used to size the FEC data.
+    pub packet_loss: u8,
+    pub bandwidth: audiopus::Bandwidth,
+}
+
+impl Default for EncoderSettings {
+    fn default() -> Self {
+        Self {
+            bitrate: 128000,
+            complexity: 10,
+            fec: true,
+            packet_loss: 15,
+            bandwidth: audiopus::Bandwidth::Fullband,
+        }
+    }
+}
+
+pub fn create_opus_encoder(
+    settings: &EncoderSettings,
+) -> Result<audiopus::coder::Encoder, ProtocolError> {
+    let mut encoder = audiopus::coder::Encoder::new(
+        audiopus::SampleRate::Hz48000,
+        audiopus::Channels::Stereo,
+        audiopus::Application::Audio,
+    )?;
+
+    encoder.set_bitrate(audiopus::Bitrate::BitsPerSecond(settings.bitrate))?;
+    encoder.set_encoder_ctl_request(
+        audiopus::ffi::OPUS_SET_COMPLEXITY_REQUEST,
+        settings.complexity as i32,
+    )?;
+    if settings.fec {
+        encoder.enable_inband_fec()?;
+        encoder.set_packet_loss_perc(settings.packet_loss)?;
+    } else {
+        encoder.disable_inband_fec()?;
+    }
+    encoder.set_bandwidth(settings.bandwidth)?;
+    encoder.set_signal(audiopus::Signal::Auto)?;
+    Ok(encoder)
+}
+
 struct AudioEncoder {
     opus: audiopus::coder::Encoder,
     cipher: XSalsa20Poly1305,
@@ -239,18 +651,11 @@ fn encrypt_xsalsa20_poly1305_lite(
 }
 
 impl AudioEncoder {
-    fn from_protocol(protocol: &DiscordVoiceProtocol) -> Result<Self, ProtocolError> {
-        let mut encoder = audiopus::coder::Encoder::new(
-            audiopus::SampleRate::Hz48000,
-            audiopus::Channels::Stereo,
-            audiopus::Application::Audio,
-        )?;
-
-        encoder.set_bitrate(audiopus::Bitrate::BitsPerSecond(128000))?;
-        encoder.enable_inband_fec()?;
-        encoder.set_packet_loss_perc(15)?;
-        encoder.set_bandwidth(audiopus::Bandwidth::Fullband)?;
-        encoder.set_signal(audiopus::Signal::Auto)?;
+    fn from_protocol(
+        protocol: &DiscordVoiceProtocol,
+        settings: &EncoderSettings,
+    ) -> Result<Self, ProtocolError> {
+        let encoder = create_opus_encoder(settings)?;
 
         let key = GenericArray::clone_from_slice(&protocol.secret_key);
         let cipher = XSalsa20Poly1305::new(&key);
@@ -326,60 +731,118 @@ impl AudioEncoder {
 
 type Protocol = Arc<Mutex<DiscordVoiceProtocol>>;
 type Source = Arc<Mutex<Box<dyn AudioSource>>>;
+type AfterCallback = Box<dyn FnOnce(Option<ProtocolError>) + Send>;
 
-#[allow(dead_code)]
-pub struct AudioPlayer {
-    thread: thread::JoinHandle<()>,
+/// The outcome of a single iteration of a PlayTask.
+pub enum Step {
+    /// A frame was sent.
+    Sent,
+    /// Nothing was sent, e.g. while paused or while the source has no frame ready.
+    Idle,
+    /// The connection was re-established and the output has to be reset.
+    Reset,
+    /// The source ended or the player was stopped.
+    Finished,
+}
+
+struct Output {
+    encoder: AudioEncoder,
+    socket: UdpSocket,
+    addr: std::net::SocketAddr,
+}
+
+/// Everything a player needs to send audio, driven either by its own thread
+/// or by one of the scheduler's sender threads.
+pub struct PlayTask {
     protocol: Protocol,
     state: Arc<PlayingState>,
     source: Source,
+    frames: Arc<AtomicU64>,
+    end_frame: Option<u64>,
+    cancelled: Arc<AtomicBool>,
+    settings: EncoderSettings,
+    filters: FilterChain,
+    pacing: Arc<PacingStats>,
+    output: Option<Output>,
+    after: AfterCallback,
 }
 
-fn audio_play_loop(
-    protocol: &Protocol,
-    state: &Arc<PlayingState>,
-    source: &Source,
-) -> Result<(), ProtocolError> {
-    let mut next_iteration = Instant::now();
-
-    let (mut encoder, mut socket) = {
-        let mut proto = protocol.lock();
-        proto.speaking(SpeakingFlags::microphone())?;
-        (AudioEncoder::from_protocol(&*proto)?, proto.clone_socket()?)
-    };
+impl PlayTask {
+    /// Creates the encoder and socket, this locks the protocol so it can block.
+    pub fn connect(&mut self, speaking: bool) -> Result<(), ProtocolError> {
+        let mut proto = self.protocol.lock();
+        if speaking {
+            proto.speaking(SpeakingFlags::microphone())?;
+        }
+        let socket = proto.clone_socket()?;
+        self.output = Some(Output {
+            encoder: AudioEncoder::from_protocol(&*proto, &self.settings)?,
+            addr: socket.peer_addr()?,
+            socket,
+        });
+        Ok(())
+    }
 
-    let addr = socket.peer_addr()?;
+    /// Runs a single iteration. When `blocking` is false this never waits on the
+    /// playing state or on a source that has no frame ready.
+    pub fn step(&mut self, blocking: bool) -> Result<Step, ProtocolError> {
+        if self.state.is_finished() || self.cancelled.load(Ordering::Relaxed) {
+            return Ok(Step::Finished);
+        }
 
-    loop {
-        if state.is_finished() {
-            break;
+        if let Some(end) = self.end_frame {
+            if self.frames.load(Ordering::Relaxed) >= end {
+                self.state.finished();
+                return Ok(Step::Finished);
+            }
         }
 
-        if state.is_paused() {
+        if self.state.is_paused() {
             // Wait until we're no longer paused
-            state.wait_until_not_paused();
-            continue;
+            if blocking {
+                self.state.wait_until_not_paused();
+            }
+            return Ok(Step::Idle);
         }
 
-        if state.is_disconnected() {
+        if self.state.is_disconnected() {
+            if !blocking {
+                return Ok(Step::Idle);
+            }
             // Wait until we're connected again to reset our state
-            state.wait_until_connected();
-            next_iteration = Instant::now();
+            self.state.wait_until_connected_or_finished();
+            if self.state.is_finished() {
+                return Ok(Step::Finished);
+            }
+        }
 
-            let proto = protocol.lock();
-            encoder = AudioEncoder::from_protocol(&*proto)?;
-            socket = proto.clone_socket()?;
+        // Players keep the state at playing, so being connected means the
+        // connection came back while this player was still active.
+        if self.state.is_connected() {
+            if self.cancelled.load(Ordering::Relaxed) {
+                return Ok(Step::Finished);
+            }
+            self.state.playing();
+            return Ok(Step::Reset);
         }
 
-        next_iteration += Duration::from_millis(20);
+        let output = match &mut self.output {
+            Some(output) => output,
+            None => return Ok(Step::Reset),
+        };
+
         let buffer_size = {
-            let mut aud = source.lock();
+            let mut aud = self.source.lock();
+            if !blocking && !aud.is_ready() {
+                return Ok(Step::Idle);
+            }
             match aud.get_type() {
-                AudioType::Opus => aud.read_opus_frame(&mut encoder.buffer[BUFFER_OFFSET..]),
+                AudioType::Opus => aud.read_opus_frame(&mut output.encoder.buffer[BUFFER_OFFSET..]),
                 AudioType::Pcm => {
-                    if let Some(_) = aud.read_pcm_frame(&mut encoder.pcm_buffer) {
+                    if let Some(_) = aud.read_pcm_frame(&mut output.encoder.pcm_buffer) {
                         // println!("Read {} bytes", &num);
-                        match encoder.encode_pcm_buffer() {
+                        self.filters.process(&mut output.encoder.pcm_buffer);
+                        match output.encoder.encode_pcm_buffer() {
                             Ok(bytes) => {
                                 // println!("Encoded {} bytes", &bytes);
                                 Some(bytes)
@@ -396,23 +859,100 @@ fn audio_play_loop(
             }
         };
 
-        if let Some(size) = buffer_size {
-            if size != 0 {
-                encoder.send_opus_packet(&socket, &addr, size)?;
-                let now = Instant::now();
-                next_iteration = next_iteration.max(now);
-                thread::sleep(next_iteration - now);
+        match buffer_size {
+            Some(0) => Ok(Step::Idle),
+            Some(size) => {
+                output
+                    .encoder
+                    .send_opus_packet(&output.socket, &output.addr, size)?;
+                self.frames.fetch_add(1, Ordering::Relaxed);
+                Ok(Step::Sent)
+            }
+            None => {
+                self.state.finished();
+                Ok(Step::Finished)
             }
-        } else {
-            state.finished();
         }
     }
 
-    Ok(())
+    /// Records the timing of a frame that was just sent for `deadline`.
+    pub fn record_pacing(&self, deadline: Instant, skipped: Duration) {
+        self.pacing
+            .record(Instant::now().saturating_duration_since(deadline), skipped);
+    }
+
+    /// Plays until finished on the current thread.
+    fn run(&mut self) -> Result<(), ProtocolError> {
+        self.connect(true)?;
+        let mut pacer = Pacer::new();
+        let mut skipped = Duration::from_secs(0);
+        // The timeline starts at the first frame sent, so that waiting on the
+        // source to start or on a pause isn't counted as lateness.
+        let mut started = false;
+
+        loop {
+            match self.step(true)? {
+                Step::Finished => return Ok(()),
+                // Blocking steps are only idle after waiting on a pause.
+                Step::Idle => started = false,
+                Step::Reset => {
+                    self.connect(false)?;
+                    started = false;
+                }
+                Step::Sent => {
+                    if started {
+                        self.record_pacing(pacer.deadline(), skipped);
+                    } else {
+                        pacer.reset();
+                        started = true;
+                    }
+                    skipped = pacer.wait();
+                }
+            }
+        }
+    }
+
+    /// Releases the speaking state and calls the after callback, this locks the protocol so it can block.
+    pub fn finish(self, error: Option<ProtocolError>) {
+        // The replacing player owns the speaking state now.
+        if !self.cancelled.load(Ordering::Relaxed) {
+            let mut proto = self.protocol.lock();
+            // ignore the error
+            let _ = proto.speaking(SpeakingFlags::off());
+        }
+        (self.after)(error);
+    }
+}
+
+#[allow(dead_code)]
+pub struct AudioPlayer {
+    protocol: Protocol,
+    state: Arc<PlayingState>,
+    // Number of frames sent, used to report the playback position.
+    frames: Arc<AtomicU64>,
+    start: u64,
+    rate: f64,
+    // Set when this player is replaced by another one sharing the same state.
+    cancelled: Arc<AtomicBool>,
+}
+
+/// How an AudioPlayer plays its source.
+pub struct PlayOptions {
+    /// The position (in milliseconds) the source starts at.
+    pub start: u64,
+    /// The position (in milliseconds) to stop at.
+    pub end: Option<u64>,
+    /// Milliseconds of the track covered per millisecond of audio sent, this
+    /// differs from 1.0 when the source was sped up or slowed down.
+    pub rate: f64,
+    pub settings: EncoderSettings,
+    pub filters: Arc<SharedFilters>,
+    pub pacing: Arc<PacingStats>,
 }
 
 impl AudioPlayer {
-    pub fn new<After>(after: After, protocol: Protocol, source: Source) -> Self
+    /// Starts playing `source`, the source itself is expected to already begin at `options.start`.
+    pub fn new<After>(after: After, protocol: Protocol, source: Source, options: PlayOptions) -> Self
     where
         After: FnOnce(Option<ProtocolError>) -> (),
         After: Send + 'static,
@@ -421,24 +961,58 @@ impl AudioPlayer {
             let guard = protocol.lock();
             guard.clone_state()
         };
-        state.connected();
+        state.playing();
 
-        Self {
+        let PlayOptions {
+            start,
+            end,
+            rate,
+            settings,
+            filters,
+            pacing,
+        } = options;
+
+        let frames = Arc::new(AtomicU64::new(0));
+        let cancelled = Arc::new(AtomicBool::new(false));
+
+        let mut task = PlayTask {
             protocol: Arc::clone(&protocol),
             state: Arc::clone(&state),
-            source: Arc::clone(&source),
-            thread: thread::spawn(move || {
-                let mut current_error = None;
-                if let Err(e) = audio_play_loop(&protocol, &state, &source) {
-                    current_error = Some(e);
-                }
-                {
-                    let mut proto = protocol.lock();
-                    // ignore the error
-                    let _ = proto.speaking(SpeakingFlags::off());
-                }
-                after(current_error);
+            // Only the task holds the source, so that it's dropped (killing ffmpeg or
+            // leaving a shared stream) as soon as the task ends, not once this player
+            // is replaced by the next one.
+            source,
+            frames: Arc::clone(&frames),
+            end_frame: end.map(|end| {
+                (end.saturating_sub(start) as f64 / (FRAME_LENGTH as f64 * rate)) as u64
             }),
+            cancelled: Arc::clone(&cancelled),
+            settings,
+            filters: FilterChain::new(filters),
+            pacing,
+            output: None,
+            after: Box::new(after),
+        };
+
+        match scheduler::get() {
+            // The thread only lives until the task is handed over to the scheduler.
+            Some(scheduler) => thread::spawn(move || match task.connect(true) {
+                Ok(_) => scheduler.submit(task),
+                Err(e) => task.finish(Some(e)),
+            }),
+            None => thread::spawn(move || {
+                let error = task.run().err();
+                task.finish(error);
+            }),
+        };
+
+        Self {
+            protocol,
+            state,
+            frames,
+            start,
+            rate,
+            cancelled,
         }
     }
 
@@ -454,6 +1028,12 @@ impl AudioPlayer {
         self.state.finished()
     }
 
+    /// Stops this player's thread without touching the shared state, for when
+    /// another player is about to take over the connection.
+    pub fn cancel(&self) {
+        self.cancelled.store(true, Ordering::Relaxed);
+    }
+
     pub fn is_paused(&self) -> bool {
         self.state.is_paused()
     }
@@ -461,4 +1041,10 @@ impl AudioPlayer {
     pub fn is_playing(&self) -> bool {
         self.state.is_playing()
     }
+
+    /// The playback position in milliseconds.
+    pub fn position(&self) -> u64 {
+        let sent = self.frames.load(Ordering::Relaxed) * FRAME_LENGTH as u64;
+        self.start + (sent as f64 * self.rate) as u64
+    }
 }
@@ -9,7 +9,7 @@ use std::str::FromStr;
 use std::sync::Arc;
 use std::time::Instant;
 
-use std::io::ErrorKind;
+use std::io::{ErrorKind, Read, Write};
 
 use native_tls::{TlsConnector, TlsStream};
 
@@ -17,6 +17,47 @@ use crate::error::*;
 use crate::payloads::*;
 use crate::state::PlayingState;
 
+/// The websocket transport, plain TCP is only used for `ws://` endpoints such
+/// as a local stand-in for the voice gateway.
+pub enum VoiceStream {
+    Plain(TcpStream),
+    Tls(TlsStream<TcpStream>),
+}
+
+impl VoiceStream {
+    fn tcp(&self) -> &TcpStream {
+        match self {
+            VoiceStream::Plain(stream) => stream,
+            VoiceStream::Tls(stream) => stream.get_ref(),
+        }
+    }
+}
+
+impl Read for VoiceStream {
+    fn read(&mut self, buf: &mut [u8]) -> std::io::Result<usize> {
+        match self {
+            VoiceStream::Plain(stream) => stream.read(buf),
+            VoiceStream::Tls(stream) => stream.read(buf),
+        }
+    }
+}
+
+impl Write for VoiceStream {
+    fn write(&mut self, buf: &[u8]) -> std::io::Result<usize> {
+        match self {
+            VoiceStream::Plain(stream) => stream.write(buf),
+            VoiceStream::Tls(stream) => stream.write(buf),
+        }
+    }
+
+    fn flush(&mut self) -> std::io::Result<()> {
+        match self {
+            VoiceStream::Plain(stream) => stream.flush(),
+            VoiceStream::Tls(stream) => stream.flush(),
+        }
+    }
+}
+
 pub struct DiscordVoiceProtocol {
     pub endpoint: String,
     pub endpoint_ip: String,
@@ -25,7 +66,7 @@ pub struct DiscordVoiceProtocol {
     pub session_id: String,
     pub token: String,
     pub recent_acks: std::collections::VecDeque<f64>,
-    ws: WebSocket<TlsStream<TcpStream>>,
+    ws: WebSocket<VoiceStream>,
     close_code: u16,
     state: Arc<PlayingState>,
     socket: Option<UdpSocket>,
@@ -78,12 +119,19 @@ impl ProtocolBuilder {
 
     pub fn connect(self) -> Result<DiscordVoiceProtocol, ProtocolError> {
         let ws = {
-            let connector = TlsConnector::new()?;
-            let stream = TcpStream::connect((self.endpoint.as_str(), 443))?;
-            let stream = connector.connect(&self.endpoint, stream)?;
-            let mut url = String::from("wss://");
-            url.push_str(self.endpoint.as_str());
-            url.push_str("/?v=4");
+            // `ws://host:port` endpoints are connected to as given without TLS.
+            let (url, stream) = match self.endpoint.strip_prefix("ws://") {
+                Some(address) => {
+                    let stream = TcpStream::connect(address)?;
+                    (format!("ws://{}/?v=4", address), VoiceStream::Plain(stream))
+                }
+                None => {
+                    let connector = TlsConnector::new()?;
+                    let stream = TcpStream::connect((self.endpoint.as_str(), 443))?;
+                    let stream = connector.connect(&self.endpoint, stream)?;
+                    (format!("wss://{}/?v=4", self.endpoint), VoiceStream::Tls(stream))
+                }
+            };
             match tungstenite::client::client(&url, stream) {
                 Ok((ws, _)) => ws,
                 Err(e) => return Err(custom_error(e.to_string().as_str())),
@@ -177,7 +225,7 @@ impl DiscordVoiceProtocol {
                         let interval = payload.heartbeat_interval as u64;
                         self.heartbeat_interval = interval.min(5000);
                         // Get the original stream
-                        let socket = self.ws.get_ref().get_ref();
+                        let socket = self.ws.get_ref().tcp();
                         socket.set_read_timeout(Some(std::time::Duration::from_millis(1000)))?;
                         self.last_heartbeat = Instant::now();
                     }
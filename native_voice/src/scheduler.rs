@@ -0,0 +1,132 @@
+use crate::pacing::Pacer;
+use crate::player::{PlayTask, Step};
+
+use crossbeam_channel::{unbounded, Receiver, Sender};
+use parking_lot::Mutex;
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::sync::Arc;
+use std::thread;
+use std::time::Instant;
+
+static SCHEDULER: Mutex<Option<Arc<Scheduler>>> = parking_lot::const_mutex(None);
+
+/// Drives every player from a fixed number of sender threads instead of one
+/// thread per player. All sender threads wake on the same 20ms tick and send at
+/// most one frame per player on each tick.
+///
+/// Sends can't be batched with sendmmsg as every voice connection has its own
+/// socket (discord ties the ssrc to the address found through ip discovery).
+pub struct Scheduler {
+    senders: Vec<Sender<PlayTask>>,
+    // Number of players assigned to each sender thread.
+    loads: Vec<Arc<AtomicUsize>>,
+}
+
+/// Starts the global scheduler, players started afterwards are driven by it.
+/// Returns false if it was already running.
+pub fn start(threads: usize) -> bool {
+    let mut guard = SCHEDULER.lock();
+    if guard.is_some() {
+        return false;
+    }
+
+    let epoch = Instant::now();
+    let mut senders = Vec::with_capacity(threads);
+    let mut loads = Vec::with_capacity(threads);
+
+    for index in 0..threads.max(1) {
+        let (sender, receiver) = unbounded();
+        let load = Arc::new(AtomicUsize::new(0));
+        let thread_load = Arc::clone(&load);
+        thread::Builder::new()
+            .name(format!("native-voice-sender-{}", index))
+            .spawn(move || run_sender(receiver, thread_load, epoch))
+            .expect("could not spawn sender thread");
+        senders.push(sender);
+        loads.push(load);
+    }
+
+    *guard = Some(Arc::new(Scheduler { senders, loads }));
+    true
+}
+
+pub fn get() -> Option<Arc<Scheduler>> {
+    SCHEDULER.lock().as_ref().map(Arc::clone)
+}
+
+impl Scheduler {
+    /// Hands a connected task to the least loaded sender thread.
+    pub fn submit(&self, task: PlayTask) {
+        let index = (0..self.loads.len())
+            .min_by_key(|&index| self.loads[index].load(Ordering::Relaxed))
+            .unwrap_or(0);
+        self.loads[index].fetch_add(1, Ordering::Relaxed);
+        // The receivers live as long as the process.
+        let _ = self.senders[index].send(task);
+    }
+
+    pub fn players(&self) -> usize {
+        self.loads
+            .iter()
+            .map(|load| load.load(Ordering::Relaxed))
+            .sum()
+    }
+}
+
+fn run_sender(receiver: Receiver<PlayTask>, load: Arc<AtomicUsize>, epoch: Instant) {
+    let mut pacer = Pacer::aligned(epoch);
+    let mut tasks: Vec<PlayTask> = Vec::new();
+
+    loop {
+        if tasks.is_empty() {
+            match receiver.recv() {
+                Ok(task) => tasks.push(task),
+                Err(_) => return,
+            }
+            pacer.reset();
+        }
+
+        // Wait for the next tick boundary shared by all sender threads.
+        let skipped = pacer.wait();
+        tasks.extend(receiver.try_iter());
+
+        let mut index = 0;
+        while index < tasks.len() {
+            let step = tasks[index].step(false);
+            match step {
+                Ok(Step::Sent) => {
+                    tasks[index].record_pacing(pacer.deadline(), skipped);
+                    index += 1;
+                    continue;
+                }
+                Ok(Step::Idle) => {
+                    index += 1;
+                    continue;
+                }
+                _ => {}
+            }
+
+            // Anything that needs the protocol lock is done off the sender thread,
+            // as the lock can be held for up to a second while the websocket is read.
+            let mut task = tasks.swap_remove(index);
+            load.fetch_sub(1, Ordering::Relaxed);
+            match step {
+                Ok(Step::Reset) => {
+                    thread::spawn(move || match task.connect(false) {
+                        Ok(_) => match get() {
+                            Some(scheduler) => scheduler.submit(task),
+                            None => task.finish(None),
+                        },
+                        Err(e) => task.finish(Some(e)),
+                    });
+                }
+                Err(e) => {
+                    thread::spawn(move || task.finish(Some(e)));
+                }
+                _ => {
+                    thread::spawn(move || task.finish(None));
+                }
+            }
+        }
+    }
+}
@@ -0,0 +1,204 @@
+use crate::error::ProtocolError;
+use crate::pacing::Pacer;
+use crate::player::{
+    create_opus_encoder, AudioSource, AudioType, EncoderSettings, FRAME_LENGTH,
+    MAX_OPUS_PACKET_SIZE,
+};
+
+use parking_lot::{Condvar, Mutex};
+use std::collections::VecDeque;
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::sync::Arc;
+use std::thread;
+use std::time::{Duration, Instant};
+
+struct Frames {
+    ring: VecDeque<Vec<u8>>,
+    // Sequence number of the first frame in the ring.
+    first: u64,
+    finished: bool,
+}
+
+/// A single decode/encode pipeline whose Opus frames are shared by any number of
+/// players. The producer runs in real time and keeps the last `capacity` frames,
+/// subscribers only have to encrypt and send them.
+pub struct Broadcast {
+    frames: Mutex<Frames>,
+    cond: Condvar,
+    capacity: usize,
+    subscribers: AtomicUsize,
+    /// The offset (in milliseconds) the source was started at.
+    pub start: u64,
+}
+
+impl Broadcast {
+    /// Spawns the producer thread for `source`. It stops once the source ends or
+    /// nobody has been subscribed for `idle_timeout`.
+    pub fn spawn(
+        source: Box<dyn AudioSource>,
+        start: u64,
+        capacity: usize,
+        idle_timeout: Duration,
+        settings: EncoderSettings,
+    ) -> Arc<Self> {
+        let broadcast = Arc::new(Self {
+            frames: Mutex::new(Frames {
+                ring: VecDeque::with_capacity(capacity),
+                first: 0,
+                finished: false,
+            }),
+            cond: Condvar::new(),
+            capacity: capacity.max(1),
+            subscribers: AtomicUsize::new(0),
+            start,
+        });
+
+        let producer = Arc::clone(&broadcast);
+        thread::spawn(move || {
+            if let Err(e) = producer.produce(source, idle_timeout, &settings) {
+                println!("Shared audio source error: {:?}", e);
+            }
+            producer.finish();
+        });
+
+        broadcast
+    }
+
+    fn produce(
+        &self,
+        mut source: Box<dyn AudioSource>,
+        idle_timeout: Duration,
+        settings: &EncoderSettings,
+    ) -> Result<(), ProtocolError> {
+        let encoder = match source.get_type() {
+            AudioType::Pcm => Some(create_opus_encoder(settings)?),
+            AudioType::Opus => None,
+        };
+        let mut pcm = [0i16; 1920];
+        let mut packet = [0u8; MAX_OPUS_PACKET_SIZE];
+
+        // Subscribers all follow the producer, so it keeps to a fixed timeline
+        // rather than letting every late frame delay all of them.
+        let mut pacer = Pacer::new();
+        let mut idle_since: Option<Instant> = None;
+
+        loop {
+            if self.subscribers() == 0 {
+                if idle_since.get_or_insert_with(Instant::now).elapsed() >= idle_timeout {
+                    break;
+                }
+            } else {
+                idle_since = None;
+            }
+
+            let size = match &encoder {
+                None => source.read_opus_frame(&mut packet),
+                Some(encoder) => match source.read_pcm_frame(&mut pcm) {
+                    Some(_) => Some(encoder.encode(&pcm, &mut packet)?),
+                    None => None,
+                },
+            };
+
+            match size {
+                None => break,
+                Some(0) => continue,
+                Some(size) => self.push(&packet[..size]),
+            }
+
+            pacer.wait();
+        }
+
+        Ok(())
+    }
+
+    fn push(&self, packet: &[u8]) {
+        let mut frames = self.frames.lock();
+        // Re-use the allocation of the frame falling out of the ring.
+        let mut frame = if frames.ring.len() >= self.capacity {
+            frames.first += 1;
+            frames.ring.pop_front().unwrap()
+        } else {
+            Vec::with_capacity(MAX_OPUS_PACKET_SIZE)
+        };
+        frame.clear();
+        frame.extend_from_slice(packet);
+        frames.ring.push_back(frame);
+        self.cond.notify_all();
+    }
+
+    fn finish(&self) {
+        let mut frames = self.frames.lock();
+        frames.finished = true;
+        self.cond.notify_all();
+    }
+
+    pub fn is_finished(&self) -> bool {
+        self.frames.lock().finished
+    }
+
+    pub fn subscribers(&self) -> usize {
+        self.subscribers.load(Ordering::Relaxed)
+    }
+
+    /// The sequence number of the newest frame, where late subscribers join.
+    fn live_edge(&self) -> u64 {
+        let frames = self.frames.lock();
+        frames.first + (frames.ring.len() as u64).saturating_sub(1)
+    }
+}
+
+/// A subscription to a Broadcast, played like any other Opus source.
+pub struct BroadcastSource {
+    broadcast: Arc<Broadcast>,
+    next: u64,
+}
+
+impl BroadcastSource {
+    pub fn new(broadcast: Arc<Broadcast>) -> Self {
+        broadcast.subscribers.fetch_add(1, Ordering::Relaxed);
+        let next = broadcast.live_edge();
+        Self { broadcast, next }
+    }
+
+    /// The position (in milliseconds) of the next frame within the source.
+    pub fn position(&self) -> u64 {
+        self.broadcast.start + self.next * FRAME_LENGTH as u64
+    }
+}
+
+impl AudioSource for BroadcastSource {
+    fn get_type(&self) -> AudioType {
+        AudioType::Opus
+    }
+
+    fn is_ready(&mut self) -> bool {
+        let frames = self.broadcast.frames.lock();
+        frames.finished || self.next.max(frames.first) < frames.first + frames.ring.len() as u64
+    }
+
+    fn read_opus_frame(&mut self, buffer: &mut [u8]) -> Option<usize> {
+        let broadcast = &self.broadcast;
+        let mut frames = broadcast.frames.lock();
+        loop {
+            // A subscriber that fell further behind than the ring holds skips ahead.
+            self.next = self.next.max(frames.first);
+
+            let index = (self.next - frames.first) as usize;
+            if let Some(frame) = frames.ring.get(index) {
+                buffer[..frame.len()].copy_from_slice(frame);
+                self.next += 1;
+                return Some(frame.len());
+            }
+            if frames.finished {
+                return None;
+            }
+            broadcast.cond.wait(&mut frames);
+        }
+    }
+}
+
+impl Drop for BroadcastSource {
+    fn drop(&mut self) {
+        self.broadcast.subscribers.fetch_sub(1, Ordering::Relaxed);
+    }
+}
@@ -92,6 +92,14 @@ impl PlayingState {
         }
     }
 
+    /// Also returns once the player is stopped while waiting to reconnect.
+    pub fn wait_until_connected_or_finished(&self) {
+        let mut guard = self.state.lock();
+        while *guard != CONNECTED && *guard != FINISHED {
+            self.cond.wait(&mut guard);
+        }
+    }
+
     pub fn wait_until_disconnected(&self) {
         self.wait_until_state(DISCONNECTED);
     }
@@ -18,23 +18,37 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import annotations
 
-import base64
-import contextlib
-import functools
-import json
+import asyncio
+import dataclasses
 import logging
-import os
+import threading
+import time
 from typing import Any
 
 import aiohttp
 import aiohttp.web
 import yarl
-import yt_dlp
+from discord.ext.native_voice import native_voice  # type: ignore
 
+from . import metrics
+from .cache import SingleFlight, TTLCache
+from .cluster import Coordinator, aggregate, place
 from .config import CONFIG
+from .extractor import ExtractionExecutor, ExtractorBusy, Priority, YTDLPool, YTDLProcessPool
 from .player import Player
 from .rotator import BanRotator, NanosecondRotator
-from .types.payloads import ReceivedPayload
+from .serialization import (
+    SUBPROTOCOLS,
+    DecodeError,
+    PayloadError,
+    decode_payload,
+    dumps,
+    dumps_bytes,
+    encode_payload,
+    loads,
+)
+from .tracks import decode_track_id, encode_track_id
+from .types.payloads import AggregateStatsData, ReceivedPayload, SentPayloadOp, TrackUpdateData
 
 
 __all__ = (
@@ -45,6 +59,12 @@ __all__ = (
 LOG: logging.Logger = logging.getLogger('swish.app')
 
 
+SearchKey = tuple[str, str, int, int, int | None]
+
+# a resolved stream url and whether its opus packets can be passed through without re-encoding.
+PlaybackSource = tuple[str, bool]
+
+
 class App(aiohttp.web.Application):
 
     def __init__(self) -> None:
@@ -52,39 +72,103 @@ class App(aiohttp.web.Application):
 
         self._connections: list[aiohttp.web.WebSocketResponse] = []
 
+        self._playback_cache: TTLCache[str, PlaybackSource] = TTLCache(
+            max_size=CONFIG.playback.cache.max_size,
+            ttl=CONFIG.playback.cache.ttl,
+        )
+        self._search_cache: TTLCache[SearchKey, list[dict[str, Any]]] = TTLCache(
+            max_size=CONFIG.search.cache.max_size,
+            ttl=CONFIG.search.cache.ttl,
+        )
+        self._search_flights: SingleFlight[SearchKey, list[dict[str, Any]]] = SingleFlight()
+
+        # shared decoding pipelines keyed by track url and start offset.
+        self._shared_streams: dict[tuple[str, int, str, bool], native_voice.SharedStream] = {}
+
+        self._encoder_profiles: dict[str, native_voice.EncoderProfile] = {
+            name: native_voice.EncoderProfile(**dataclasses.asdict(profile))
+            for name, profile in CONFIG.encoder.profiles.items()
+        }
+
+        # must be set before the scheduler starts, its sender threads only read it once.
+        native_voice.set_spin_margin(CONFIG.playback.pacing.spin_margin)
+
+        # players started from here on are driven by a fixed pool of native sender threads.
+        if CONFIG.playback.scheduler.enabled:
+            native_voice.start_scheduler(CONFIG.playback.scheduler.threads)
+
+        self._ytdl_pool: YTDLPool | YTDLProcessPool
+        if CONFIG.extractor.mode == 'process':
+            self._ytdl_pool = YTDLProcessPool(
+                self._SEARCH_OPTIONS,
+                max_idle=CONFIG.extractor.pool_size,
+                workers=CONFIG.extractor.workers,
+            )
+        else:
+            self._ytdl_pool = YTDLPool(self._SEARCH_OPTIONS, max_idle=CONFIG.extractor.pool_size)
+        self._extractor: ExtractionExecutor = ExtractionExecutor(
+            workers=CONFIG.extractor.workers,
+            max_queue=CONFIG.extractor.max_queue,
+        )
+
+        self._runner: aiohttp.web.AppRunner | None = None
+
+        self._coordinator: Coordinator = Coordinator(self)
+        self.on_cleanup.append(self._close_coordinator)
+        self.on_cleanup.append(self._close_extractor)
+
         self.add_routes(
             [
                 aiohttp.web.get('/', self.websocket_handler),
                 aiohttp.web.get('/search', self.search_tracks),
+                aiohttp.web.post('/search/batch', self.search_tracks_batch),
+                aiohttp.web.get('/metrics', self.get_metrics),
+                aiohttp.web.get('/stats', self.get_stats),
             ]
         )
+        if CONFIG.cluster.enabled:
+            self.add_routes(
+                [
+                    aiohttp.web.get('/cluster', self.get_cluster),
+                    aiohttp.web.get('/cluster/place', self.place_player),
+                    aiohttp.web.post('/cluster/drain', self.drain),
+                    aiohttp.web.delete('/cluster/drain', self.undrain),
+                ]
+            )
 
-    async def run(self) -> None:
+    async def run(self, reuse_port: bool = False) -> None:
 
         runner = aiohttp.web.AppRunner(
             app=self
         )
         await runner.setup()
+        self._runner = runner
 
         host = CONFIG.server.host
         port = CONFIG.server.port
 
+        # worker processes each bind the same port, the kernel spreads new connections between them.
         site = aiohttp.web.TCPSite(
             runner=runner,
             host=host,
-            port=port
+            port=port,
+            reuse_port=reuse_port
         )
         await site.start()
 
         LOG.info(f'Swish server started on {host}:{port}')
 
+        if CONFIG.cluster.enabled:
+            await self._coordinator.start()
+
     # websocket handling
 
     async def websocket_handler(self, request: aiohttp.web.Request) -> aiohttp.web.WebSocketResponse:
 
         LOG.info(f'<{request.remote}> - Incoming websocket connection request.')
 
-        websocket = aiohttp.web.WebSocketResponse()
+        # clients can opt into binary MessagePack frames with the 'swish.msgpack' subprotocol.
+        websocket = aiohttp.web.WebSocketResponse(protocols=tuple(SUBPROTOCOLS))
         await websocket.prepare(request)
 
         user_agent: str | None = request.headers.get('User-Agent')
@@ -113,32 +197,35 @@ class App(aiohttp.web.Application):
         websocket['user_id'] = user_id
         websocket['app'] = self
         websocket['players'] = {}
+        websocket['encoding'] = SUBPROTOCOLS.get(websocket.ws_protocol or '', 'json')
         self._connections.append(websocket)
 
         LOG.info(f'{client_name} - Websocket connection established.')
 
+        updater: asyncio.Task[None] | None = None
+        if CONFIG.server.track_update_interval > 0:
+            updater = asyncio.create_task(self._track_update_loop(websocket))
+
         message: aiohttp.WSMessage
         async for message in websocket:
 
             try:
-                payload: ReceivedPayload = message.json()
-            except json.JSONDecodeError:
-                LOG.error(f'{client_name} - Received payload with invalid JSON format.\nPayload: {message.data}')
+                payload: ReceivedPayload = decode_payload(
+                    message.data,
+                    'msgpack' if message.type is aiohttp.WSMsgType.BINARY else 'json'
+                )
+            except PayloadError as error:
+                metrics.INVALID_PAYLOADS.inc()
+                LOG.error('%s - Received invalid payload, %s.\nPayload: %s', client_name, error, message.data)
                 continue
 
-            if 'op' not in payload:
-                LOG.error(f'{client_name} - Received payload with missing \'op\' key.\nPayload: {payload}')
-                continue
-            if 'd' not in payload:
-                LOG.error(f'{client_name} - Received payload with missing \'d\' key.\nPayload: {payload}')
-                continue
+            metrics.PAYLOADS_RECEIVED.inc(payload['op'])
 
             # op codes that don't require player should be handled here.
-            # TODO: handle debug op
 
-            guild_id: str | None = payload['d'].get('guild_id')
+            guild_id: str = payload['d']['guild_id']
             if not guild_id:
-                LOG.error(f'{client_name} - Received payload with missing \'guild_id\' data key. Payload: {payload}')
+                LOG.error('%s - Received payload with empty \'guild_id\' data key. Payload: %s', client_name, payload)
                 continue
 
             player: Player | None = websocket['players'].get(guild_id)
@@ -146,23 +233,59 @@ class App(aiohttp.web.Application):
                 player = Player(websocket, guild_id)
                 websocket['players'][guild_id] = player
 
-            await player.handle_payload(payload)
+            player.enqueue_payload(payload)
 
         LOG.info(f'{client_name} - Websocket connection closed.')
 
+        if updater is not None:
+            updater.cancel()
+
         # TODO: destroy/disconnect all players
+        for player in websocket['players'].values():
+            player.cancel_payloads()
+
         self._connections.remove(websocket)
         return websocket
 
+    async def send_payload(self, websocket: aiohttp.web.WebSocketResponse, op: SentPayloadOp, data: Any) -> None:
+
+        frame = encode_payload({'op': op, 'd': data}, websocket['encoding'])
+        metrics.PAYLOADS_SENT.inc(op)
+
+        if isinstance(frame, bytes):
+            await websocket.send_bytes(frame)
+        else:
+            await websocket.send_str(frame)
+
+    async def _track_update_loop(self, websocket: aiohttp.web.WebSocketResponse) -> None:
+
+        # updates for every player on a connection are sent as a single batched frame per tick,
+        # which keeps the event rate proportional to connections rather than players.
+        while not websocket.closed:
+
+            await asyncio.sleep(CONFIG.server.track_update_interval / 1000)
+
+            updates: list[TrackUpdateData] = [
+                update for player in websocket['players'].values()
+                if (update := player.get_track_update()) is not None
+            ]
+            if not updates:
+                continue
+
+            try:
+                await self.send_payload(websocket, 'event', {'type': 'track_update', 'updates': updates})
+            except ConnectionResetError:
+                return
+
     # search handling
 
     @staticmethod
-    def _encode_track_info(info: dict[str, Any], /) -> str:
-        return base64.b64encode(json.dumps(info).encode()).decode()
+    def _encode_track_info(info: dict[str, Any], /, extractor: str | None = None) -> str:
+        return encode_track_id(info, extractor)
 
     @staticmethod
     def _decode_track_id(_id: str, /) -> dict[str, Any]:
-        return json.loads(base64.b64decode(_id).decode())
+        return decode_track_id(_id)
 
     _SEARCH_OPTIONS: dict[str, Any] = {
         'quiet':              True,
@@ -193,53 +316,108 @@ class App(aiohttp.web.Application):
         'ban-rotator':        BanRotator
     }
 
-    async def _ytdl_search(self, query: str, internal: bool) -> Any:
+    def _get_source_address(self) -> str:
 
-        self._SEARCH_OPTIONS['extract_flat'] = not internal
         if CONFIG.rotation.enabled:
-            self._SEARCH_OPTIONS['source_address'] = self._ROTATOR_MAPPING[CONFIG.rotation.method].rotate()
-
-        with yt_dlp.YoutubeDL(self._SEARCH_OPTIONS) as YTDL:
-            with contextlib.redirect_stdout(open(os.devnull, 'w')):
-                assert self._loop is not None
-                _search: Any = await self._loop.run_in_executor(
-                    None,
-                    functools.partial(YTDL.extract_info, query, download=False)
-                )
+            return self._ROTATOR_MAPPING[CONFIG.rotation.method].rotate()
+
+        return self._SEARCH_OPTIONS['source_address']
 
-        return YTDL.sanitize_info(_search)  # type: ignore
+    async def _ytdl_search(self, query: str, internal: bool, playlist_items: str | None = None) -> Any:
 
-    async def _get_playback_url(self, url: str) -> str:
+        start = time.perf_counter()
+        try:
+            return await self._extractor.run(
+                Priority.PLAYBACK if internal else Priority.SEARCH,
+                self._ytdl_pool.extract, query, not internal, self._get_source_address(), playlist_items
+            )
+        finally:
+            metrics.EXTRACTION_SECONDS.observe(time.perf_counter() - start, 'playback' if internal else 'search')
+
+    @staticmethod
+    def _get_playback_url_ttl(url: str) -> float | None:
+
+        # googlevideo urls embed the unix timestamp they stop being valid at.
+        expire = yarl.URL(url).query.get('expire')
+        if expire is None or not expire.isdigit():
+            return None
+
+        return int(expire) - time.time() - CONFIG.playback.cache.expiry_margin
+
+    async def _get_playback_url(self, url: str) -> PlaybackSource:
+
+        if CONFIG.playback.cache.enabled and (cached := self._playback_cache.get(url)):
+            LOG.debug('Playback url cache hit for \'%s\'.', url)
+            return cached
 
         search = await self._ytdl_search(url, internal=True)
-        return search['url']
+        playback_url: str = search['url']
+        source = (playback_url, CONFIG.playback.opus_passthrough and search.get('acodec') == 'opus')
 
-    async def _get_tracks(self, query: str) -> list[dict[str, Any]]:
+        if CONFIG.playback.cache.enabled:
+            self._playback_cache.set(url, source, ttl=self._get_playback_url_ttl(playback_url))
 
-        search = await self._ytdl_search(query, internal=False)
+        return source
 
-        entries = search.get('entries', [search])
-        tracks: list[dict[str, Any]] = []
+    async def _get_tracks(self, query: str, playlist_items: str | None = None) -> list[dict[str, Any]]:
 
-        for entry in entries:
-            info: dict[str, Any] = {
-                'title':      entry['title'],
-                'identifier': entry['id'],
-                'url':        entry['url'],
-                'length':     int(entry.get('duration') or 0 * 1000),
-                'author':     entry.get('uploader', 'Unknown'),
-                'author_id':  entry.get('channel_id', None),
-                'thumbnail':  entry.get('thumbnails', [None])[0],
-                'is_live':    entry.get('live_status', False),
-            }
-            tracks.append(
-                {
-                    'id':   self._encode_track_info(info),
-                    'info': info
-                }
-            )
+        search = await self._ytdl_search(query, internal=False, playlist_items=playlist_items)
+        if not search:
+            return []
+
+        return [self._get_track(entry) for entry in search.get('entries', [search])]
+
+    def _get_track(self, entry: dict[str, Any]) -> dict[str, Any]:
+
+        info: dict[str, Any] = {
+            'title':      entry['title'],
+            'identifier': entry['id'],
+            'url':        entry['url'],
+            'length':     int(entry.get('duration') or 0 * 1000),
+            'author':     entry.get('uploader', 'Unknown'),
+            'author_id':  entry.get('channel_id', None),
+            'thumbnail':  entry.get('thumbnails', [None])[0],
+            'is_live':    entry.get('live_status', False),
+        }
+        return {
+            'id':   self._encode_track_info(info, extractor=entry.get('ie_key') or entry.get('extractor_key')),
+            'info': info
+        }
+
+    async def _get_cached_tracks(
+        self,
+        source: str,
+        prefix: str,
+        query: str,
+        offset: int = 0,
+        limit: int | None = None,
+    ) -> list[dict[str, Any]]:
+
+        key = (source, query, CONFIG.search.max_results, offset, limit)
+
+        if CONFIG.search.cache.enabled and (cached := self._search_cache.get(key)) is not None:
+            return cached
+
+        async def search() -> list[dict[str, Any]]:
+
+            playlist_items = None
+            if offset or limit is not None:
+                playlist_items = f'{offset + 1}:{offset + limit if limit is not None else ""}'
+
+            tracks = await self._get_tracks(f'{prefix}{query}', playlist_items)
+            if CONFIG.search.cache.enabled:
+                self._search_cache.set(key, tracks)
+
+            return tracks
+
+        return await self._search_flights.run(key, search)
+
+    def _get_search_prefix(self, query: str, source: str) -> tuple[str, str | None]:
+
+        if (url := yarl.URL(query)) and url.host and url.scheme:
+            source = 'none'
 
-        return tracks
+        return source, self._SOURCE_MAPPING.get(source)
 
     async def search_tracks(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
 
@@ -247,14 +425,336 @@ class App(aiohttp.web.Application):
         if not query:
             return aiohttp.web.json_response({'error': 'Missing \'query\' query parameter.'}, status=400)
 
-        source = request.query.get('source', 'youtube')
-        if (url := yarl.URL(query)) and url.host and url.scheme:
-            source = 'none'
-
-        prefix = self._SOURCE_MAPPING.get(source)
+        source, prefix = self._get_search_prefix(query, request.query.get('source', 'youtube'))
         if prefix is None:
             return aiohttp.web.json_response({'error': 'Invalid \'source\' query parameter.'}, status=400)
 
-        tracks = await self._get_tracks(f'{prefix}{query}')
+        try:
+            offset = int(request.query.get('offset', 0))
+            limit = int(_limit) if (_limit := request.query.get('limit')) else None
+        except ValueError:
+            offset, limit = -1, None
+        if offset < 0 or (limit is not None and limit < 1):
+            return aiohttp.web.json_response({'error': 'Invalid \'offset\' or \'limit\' query parameter.'}, status=400)
+
+        if request.query.get('stream') == 'true':
+            return await self._stream_tracks(request, source, prefix, query, offset, limit)
+
+        try:
+            tracks = await self._get_cached_tracks(source, prefix, query, offset, limit)
+        except ExtractorBusy:
+            return aiohttp.web.json_response({'error': 'Search is currently overloaded, try again later.'}, status=503)
+
+        return aiohttp.web.json_response(tracks, dumps=dumps)
+
+    async def _stream_tracks(
+        self,
+        request: aiohttp.web.Request,
+        source: str,
+        prefix: str,
+        query: str,
+        offset: int,
+        limit: int | None,
+    ) -> aiohttp.web.StreamResponse:
+
+        # tracks are streamed as newline delimited json, a chunk at a time, so that the time
+        # to the first track doesn't depend on the size of the playlist being expanded.
+        response = aiohttp.web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+
+        key = (source, query, CONFIG.search.max_results, offset, limit)
+
+        if CONFIG.search.cache.enabled and (cached := self._search_cache.get(key)) is not None:
+            await response.write(b''.join(dumps_bytes(track) + b'\n' for track in cached))
+        elif isinstance(self._ytdl_pool, YTDLProcessPool):
+            await self._stream_track_pages(response, source, prefix, query, offset, limit)
+        else:
+            await self._stream_track_chunks(response, key, prefix, query, offset, limit)
+
+        await response.write_eof()
+        return response
+
+    async def _stream_track_chunks(
+        self,
+        response: aiohttp.web.StreamResponse,
+        key: SearchKey,
+        prefix: str,
+        query: str,
+        offset: int,
+        limit: int | None,
+    ) -> None:
+
+        assert isinstance(self._ytdl_pool, YTDLPool)
+
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue[list[dict[str, Any]] | None] = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def push(chunk: list[dict[str, Any]] | None) -> None:
+            loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+
+        # a single extraction iterates the playlist on an extractor thread, handing entries over a chunk at a time.
+        start = time.perf_counter()
+        try:
+            future = self._extractor.submit(
+                Priority.SEARCH,
+                self._ytdl_pool.extract_chunks,
+                f'{prefix}{query}', self._get_source_address(), offset, limit, CONFIG.search.stream_chunk_size,
+                push, cancelled,
+            )
+        except ExtractorBusy:
+            await response.write(dumps_bytes({'error': 'Search is currently overloaded, try again later.'}) + b'\n')
+            return
+
+        # queued behind the extraction's last chunk.
+        future.add_done_callback(lambda _: push(None))
+
+        tracks: list[dict[str, Any]] = []
+        try:
+            while (chunk := await chunks.get()) is not None:
+                page = [self._get_track(entry) for entry in chunk]
+                tracks.extend(page)
+                await response.write(b''.join(dumps_bytes(track) + b'\n' for track in page))
+        finally:
+            # stops the extraction early if the client went away.
+            cancelled.set()
+
+        metrics.EXTRACTION_SECONDS.observe(time.perf_counter() - start, 'search')
+        future.result()
+
+        if CONFIG.search.cache.enabled:
+            self._search_cache.set(key, tracks)
+
+    async def _stream_track_pages(
+        self,
+        response: aiohttp.web.StreamResponse,
+        source: str,
+        prefix: str,
+        query: str,
+        offset: int,
+        limit: int | None,
+    ) -> None:
+
+        # results from the process pool can't be iterated lazily, so each chunk is a ranged extraction of its own.
+        remaining = limit
+        while remaining is None or remaining > 0:
+
+            size = CONFIG.search.stream_chunk_size if remaining is None else min(CONFIG.search.stream_chunk_size, remaining)
+
+            try:
+                tracks = await self._get_cached_tracks(source, prefix, query, offset, size)
+            except ExtractorBusy:
+                await response.write(dumps_bytes({'error': 'Search is currently overloaded, try again later.'}) + b'\n')
+                break
+
+            if tracks:
+                await response.write(b''.join(dumps_bytes(track) + b'\n' for track in tracks))
+
+            if len(tracks) < size:
+                break
+
+            offset += size
+            if remaining is not None:
+                remaining -= size
+
+    async def _search_batch_item(self, index: int, item: Any, semaphore: asyncio.Semaphore) -> dict[str, Any]:
+
+        if isinstance(item, str):
+            query, source = item, 'youtube'
+        elif isinstance(item, dict):
+            query, source = item.get('query'), item.get('source', 'youtube')
+        else:
+            return {'index': index, 'error': 'Invalid query, expected a string or an object.'}
+
+        if not query or not isinstance(query, str):
+            return {'index': index, 'error': 'Missing \'query\' key.'}
+        if not isinstance(source, str):
+            return {'index': index, 'error': 'Invalid \'source\' key.'}
+
+        source, prefix = self._get_search_prefix(query, source)
+        if prefix is None:
+            return {'index': index, 'error': 'Invalid \'source\' key.'}
+
+        async with semaphore:
+            try:
+                tracks = await self._get_cached_tracks(source, prefix, query)
+            except ExtractorBusy:
+                return {'index': index, 'error': 'Search is currently overloaded, try again later.'}
+            except Exception as error:
+                LOG.error('Batch search for query \'%s\' failed.', query, exc_info=error)
+                return {'index': index, 'error': 'Search failed.'}
+
+        return {'index': index, 'tracks': tracks}
+
+    async def search_tracks_batch(self, request: aiohttp.web.Request) -> aiohttp.web.StreamResponse:
+
+        try:
+            data: Any = loads(await request.read())
+        except DecodeError:
+            return aiohttp.web.json_response({'error': 'Request body is not valid JSON.'}, status=400)
+
+        queries: Any = data.get('queries') if isinstance(data, dict) else None
+        if not queries or not isinstance(queries, list):
+            return aiohttp.web.json_response({'error': 'Missing \'queries\' key.'}, status=400)
+        if len(queries) > CONFIG.search.batch.max_queries:
+            return aiohttp.web.json_response(
+                {'error': f'Too many queries, a maximum of {CONFIG.search.batch.max_queries} are allowed.'},
+                status=400
+            )
+
+        semaphore = asyncio.Semaphore(CONFIG.search.batch.max_concurrency)
+        tasks = [
+            asyncio.create_task(self._search_batch_item(index, item, semaphore))
+            for index, item in enumerate(queries)
+        ]
+
+        # results are streamed back as newline delimited json in the order they complete.
+        response = aiohttp.web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+
+        try:
+            for future in asyncio.as_completed(tasks):
+                result = await future
+                await response.write(dumps_bytes(result) + b'\n')
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        await response.write_eof()
+        return response
+
+    async def _close_extractor(self, _: aiohttp.web.Application) -> None:
+
+        self._extractor.shutdown()
+        if isinstance(self._ytdl_pool, YTDLProcessPool):
+            self._ytdl_pool.shutdown()
+
+    # metrics
+
+    def _update_metrics(self) -> None:
+
+        players = [player for websocket in self._connections for player in websocket['players'].values()]
+        metrics.WEBSOCKET_CONNECTIONS.set(len(self._connections))
+        metrics.PLAYERS.set(len(players))
+
+        for lane, stats in self._extractor.stats()['lanes'].items():
+            metrics.EXTRACTOR_QUEUE_DEPTH.set(stats['depth'], lane)
+            metrics.EXTRACTOR_STARTED.set_total(stats['started'], lane)
+            metrics.EXTRACTOR_COMPLETED.set_total(stats['completed'], lane)
+            metrics.EXTRACTOR_CANCELLED.set_total(stats['cancelled'], lane)
+            metrics.EXTRACTOR_REJECTED.set_total(stats['rejected'], lane)
+            metrics.EXTRACTOR_AVG_WAIT_SECONDS.set(stats['avg_wait'], lane)
+            metrics.EXTRACTOR_MAX_WAIT_SECONDS.set(stats['max_wait'], lane)
+
+        for name, cache in (('playback', self._playback_cache), ('search', self._search_cache)):
+            cache_stats = cache.stats()
+            metrics.CACHE_ENTRIES.set(cache_stats['size'], name)
+            metrics.CACHE_HITS.set_total(cache_stats['hits'], name)
+            metrics.CACHE_MISSES.set_total(cache_stats['misses'], name)
+            metrics.CACHE_EVICTIONS.set_total(cache_stats['evictions'], name)
+        metrics.SEARCHES_COALESCED.set_total(self._search_flights.coalesced)
+
+        metrics.FFMPEG_PROCESSES.set(native_voice.ffmpeg_processes())
+        if (scheduled := native_voice.scheduler_players()) is not None:
+            metrics.SCHEDULER_PLAYERS.set(scheduled)
+
+        # pacing stats are read without locking, unlike get_state which waits on each connection's protocol lock.
+        pacing = [stats for player in players if (stats := player.get_pacing_stats()) is not None]
+        metrics.VOICE_CONNECTIONS.set(len(pacing))
+        metrics.VOICE_FRAMES.set(sum(stats['frames'] for stats in pacing))
+        metrics.VOICE_LATE_FRAMES.set(sum(stats['late_frames'] for stats in pacing))
+        metrics.VOICE_DRIFT_SECONDS.set(sum(stats['drift'] for stats in pacing) / 1000)
+        metrics.VOICE_MAX_JITTER_SECONDS.set(max((stats['jitter'] for stats in pacing), default=0) / 1000)
+        metrics.VOICE_MAX_LATENESS_SECONDS.set(max((stats['max_lateness'] for stats in pacing), default=0) / 1000)
+
+    async def get_metrics(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+
+        self._update_metrics()
+
+        if (worker := self._coordinator.worker) is None:
+            return aiohttp.web.Response(text=metrics.render(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+        # every worker process has metrics of its own, whichever worker is scraped returns all of them labelled with
+        # the worker they came from.
+        text = metrics.render((('worker', str(worker)),))
+        if not request.query.get('local'):
+            text = metrics.merge([text, *await self._coordinator.forward('GET', '/metrics?local=1', text=True)])
+
+        return aiohttp.web.Response(text=text, headers={'Content-Type': metrics.CONTENT_TYPE})
+
+    # cluster
+
+    async def _close_coordinator(self, _: aiohttp.web.Application) -> None:
+        await self._coordinator.close()
+
+    async def get_stats(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+
+        if request.query.get('aggregate') not in ('1', 'true'):
+            return aiohttp.web.json_response(self._coordinator.local_stats(), dumps=dumps)
+
+        # the totals of every worker process of this node, followed by each worker's own stats.
+        workers = self._coordinator.worker_stats()
+        stats: AggregateStatsData = {**aggregate(workers), 'workers': workers}  # type: ignore
+        return aiohttp.web.json_response(stats, dumps=dumps)
+
+    async def get_cluster(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+        return aiohttp.web.json_response(self._coordinator.nodes(), dumps=dumps)
+
+    async def place_player(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+
+        guild_id = request.query.get('guild_id')
+        if not guild_id:
+            return aiohttp.web.json_response({'error': 'Missing \'guild_id\' query parameter.'}, status=400)
+
+        if (node := self._coordinator.place(guild_id)) is None:
+            return aiohttp.web.json_response({'error': 'No cluster nodes are available.'}, status=503)
+
+        return aiohttp.web.json_response({'guild_id': guild_id, 'node': node}, dumps=dumps)
+
+    async def drain(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+
+        if request.headers.get('Authorization') != CONFIG.server.password:
+            return aiohttp.web.json_response({'error': 'Authorization failed.'}, status=401)
+
+        # new players are placed elsewhere from now on, and clients are asked to move the existing ones.
+        self._coordinator.draining = True
+        LOG.info(f'Cluster node \'{self._coordinator.url}\' is draining.')
+
+        nodes = self._coordinator.nodes()[1:]
+        migrating = 0
+
+        for websocket in list(self._connections):
+            for guild_id, player in list(websocket['players'].items()):
+
+                if (node := place(guild_id, nodes)) is None:
+                    LOG.warning(
+                        f'{websocket["client_name"]} - Player \'{guild_id}\' could not be migrated as no other '
+                        f'cluster nodes are available.'
+                    )
+                    continue
+
+                try:
+                    await player.send_payload('event', player.get_migration(node['node']))
+                except ConnectionResetError:
+                    break
+                migrating += 1
+
+        # the other worker processes of this node drain their own players.
+        if not request.query.get('local'):
+            for result in await self._coordinator.forward('POST', '/cluster/drain?local=1'):
+                migrating += result['migrating']
+
+        return aiohttp.web.json_response({'draining': True, 'migrating': migrating}, dumps=dumps)
+
+    async def undrain(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+
+        if request.headers.get('Authorization') != CONFIG.server.password:
+            return aiohttp.web.json_response({'error': 'Authorization failed.'}, status=401)
+
+        self._coordinator.draining = False
+        LOG.info(f'Cluster node \'{self._coordinator.url}\' stopped draining.')
+
+        if not request.query.get('local'):
+            await self._coordinator.forward('DELETE', '/cluster/drain?local=1')
 
-        return aiohttp.web.json_response(tracks)
+        return aiohttp.web.json_response({'draining': False, 'migrating': 0}, dumps=dumps)
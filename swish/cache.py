@@ -0,0 +1,135 @@
+"""Swish. A standalone audio player and server for bots on Discord.
+
+Copyright (C) 2022 PythonistaGuild <https://github.com/PythonistaGuild>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import time
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any, Generic, TypeVar
+
+
+__all__ = (
+    'TTLCache',
+    'SingleFlight',
+)
+
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class TTLCache(Generic[K, V]):
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+
+        self.max_size: int = max_size
+        self.ttl: float = ttl
+
+        self._entries: collections.OrderedDict[K, tuple[V, float]] = collections.OrderedDict()
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> V | None:
+
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.max_size <= 0:
+            return
+
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: K) -> V | None:
+
+        entry = self._entries.pop(key, None)
+        return entry[0] if entry is not None else None
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            'size':      len(self._entries),
+            'max_size':  self.max_size,
+            'hits':      self.hits,
+            'misses':    self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class SingleFlight(Generic[K, V]):
+
+    def __init__(self) -> None:
+
+        self._flights: dict[K, asyncio.Task[V]] = {}
+
+        self.coalesced: int = 0
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def run(self, key: K, factory: Callable[[], Awaitable[V]]) -> V:
+
+        if (task := self._flights.get(key)) is not None:
+            self.coalesced += 1
+
+        else:
+
+            async def flight() -> V:
+                return await factory()
+
+            task = asyncio.create_task(flight())
+            task.add_done_callback(lambda _: self._flights.pop(key, None))
+            task.add_done_callback(self._retrieve_exception)
+            self._flights[key] = task
+
+        # shielded so that one caller cancelling doesn't cancel the flight for everyone else.
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _retrieve_exception(task: asyncio.Task[V]) -> None:
+        # a flight whose callers were all cancelled would otherwise log 'Task exception was never retrieved'.
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,280 @@
+"""Swish. A standalone audio player and server for bots on Discord.
+
+Copyright (C) 2022 PythonistaGuild <https://github.com/PythonistaGuild>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import time
+from collections.abc import Iterable
+from typing import Any, TYPE_CHECKING
+
+import aiohttp
+
+from .config import CONFIG
+from .types.payloads import NodeStatsData
+
+if TYPE_CHECKING:
+    from .app import App
+
+
+__all__ = (
+    'CPUSampler',
+    'Coordinator',
+    'aggregate',
+    'place',
+)
+
+
+LOG: logging.Logger = logging.getLogger('swish.cluster')
+
+
+def _hash(guild_id: str, node: str) -> float:
+
+    digest = hashlib.blake2b(f'{guild_id}:{node}'.encode(), digest_size=8).digest()
+    # mapped into (0, 1), never exactly 0 or 1 so that its logarithm is always negative.
+    return (int.from_bytes(digest, 'big') + 1) / (2 ** 64 + 1)
+
+
+def place(guild_id: str, nodes: Iterable[NodeStatsData]) -> NodeStatsData | None:
+
+    # weighted rendezvous hashing, every node scores each guild and the highest score wins. with equal loads a guild
+    # always lands on the same node, and adding or removing a node only moves the guilds it wins or loses. busier
+    # nodes get a lower weight and so win fewer guilds.
+    best: NodeStatsData | None = None
+    best_score = -math.inf
+
+    for node in nodes:
+        if node['draining']:
+            continue
+        score = (1 / (1 + node['load'])) / -math.log(_hash(guild_id, node['node']))
+        if score > best_score:
+            best, best_score = node, score
+
+    return best
+
+
+def _load(cpu: float, cpus: int, players: int, jitter: float) -> float:
+    weights = CONFIG.cluster.weights
+    return round(weights.cpu * cpu / cpus + weights.players * players + weights.jitter * jitter, 4)
+
+
+def _fresh(stats: dict[str, tuple[NodeStatsData, float]]) -> list[NodeStatsData]:
+    # stats that haven't been updated for a few polls are left out until they are again.
+    expiry = time.monotonic() - CONFIG.cluster.poll_interval * 3 / 1000
+    return [data for data, fetched in stats.values() if fetched >= expiry]
+
+
+def aggregate(stats: list[NodeStatsData]) -> NodeStatsData:
+
+    # the totals of several workers of one node, the first one's node url and core count are used.
+    players = sum(data['players'] for data in stats)
+    cpu = sum(data['cpu'] for data in stats)
+    jitter = max(data['jitter'] for data in stats)
+
+    return {
+        'node':              stats[0]['node'],
+        'players':           players,
+        'voice_connections': sum(data['voice_connections'] for data in stats),
+        'cpu':               round(cpu, 3),
+        'cpus':              stats[0]['cpus'],
+        'jitter':            jitter,
+        'draining':          any(data['draining'] for data in stats),
+        'load':              _load(cpu, stats[0]['cpus'], players, jitter),
+    }
+
+
+class CPUSampler:
+
+    def __init__(self, interval: float = 1.0) -> None:
+
+        self.interval: float = interval
+
+        self._wall: float = time.monotonic()
+        self._cpu: float = time.process_time()
+        self._usage: float = 0.0
+
+    def sample(self) -> float:
+
+        # cores used by this process, including native voice and scheduler threads but not ffmpeg. samples taken
+        # within `interval` of the last one return it again, so frequent polling doesn't shorten the window.
+        wall = time.monotonic()
+        if wall - self._wall >= self.interval:
+            cpu = time.process_time()
+            self._usage = (cpu - self._cpu) / (wall - self._wall)
+            self._wall, self._cpu = wall, cpu
+
+        return self._usage
+
+
+class Coordinator:
+
+    def __init__(self, app: App) -> None:
+
+        self._app: App = app
+
+        self.url: str = (CONFIG.cluster.url or f'http://{CONFIG.server.host}:{CONFIG.server.port}').rstrip('/')
+        self.peers: list[str] = [
+            url.rstrip('/') for url in CONFIG.cluster.nodes if url.rstrip('/') != self.url
+        ] if CONFIG.cluster.enabled else []
+        self.draining: bool = False
+
+        # set when running as one of several worker processes sharing a port, workers are the private urls of the
+        # other worker processes on this machine.
+        self.worker: int | None = None
+        self.workers: list[str] = []
+
+        self._cpu: CPUSampler = CPUSampler()
+
+        # the latest stats of each peer and worker and when they were fetched.
+        self._stats: dict[str, tuple[NodeStatsData, float]] = {}
+        self._worker_stats: dict[str, tuple[NodeStatsData, float]] = {}
+
+        self._session: aiohttp.ClientSession | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    def local_stats(self) -> NodeStatsData:
+
+        players = [player for websocket in self._app._connections for player in websocket['players'].values()]
+        pacing = [stats for player in players if (stats := player.get_pacing_stats()) is not None]
+
+        cpus = os.cpu_count() or 1
+        cpu = self._cpu.sample()
+        jitter = max((stats['jitter'] for stats in pacing), default=0.0)
+
+        stats: NodeStatsData = {
+            'node':              self.url,
+            'players':           len(players),
+            'voice_connections': len(pacing),
+            'cpu':               round(cpu, 3),
+            'cpus':              cpus,
+            'jitter':            jitter,
+            'draining':          self.draining,
+            'load':              _load(cpu, cpus, len(players), jitter),
+        }
+        if self.worker is not None:
+            stats['worker'] = self.worker
+
+        return stats
+
+    def worker_stats(self) -> list[NodeStatsData]:
+        # this worker first.
+        return [self.local_stats(), *_fresh(self._worker_stats)]
+
+    def node_stats(self) -> NodeStatsData:
+        return aggregate(self.worker_stats())
+
+    def nodes(self) -> list[NodeStatsData]:
+        return [self.node_stats(), *_fresh(self._stats)]
+
+    def place(self, guild_id: str, exclude_local: bool = False) -> str | None:
+
+        nodes = self.nodes()
+        if exclude_local:
+            nodes = nodes[1:]
+
+        node = place(guild_id, nodes)
+        return node['node'] if node is not None else None
+
+    def set_workers(self, urls: list[str]) -> None:
+
+        self.workers = urls
+        for url in [url for url in self._worker_stats if url not in urls]:
+            del self._worker_stats[url]
+
+        self._start_polling()
+
+    async def forward(self, method: str, path: str, text: bool = False) -> list[Any]:
+
+        # sends a request on to every other worker, for requests that must apply to the whole node. responses are
+        # decoded as json unless `text` is set.
+        async def request(url: str) -> Any:
+            assert self._session is not None
+            headers = {'Authorization': CONFIG.server.password}
+            async with self._session.request(method, f'{url}{path}', headers=headers) as response:
+                response.raise_for_status()
+                return await (response.text() if text else response.json())
+
+        results = await asyncio.gather(*(request(url) for url in self.workers), return_exceptions=True)
+        for url, result in zip(self.workers, results):
+            if isinstance(result, Exception):
+                LOG.error(f'Could not forward \'{method} {path}\' to worker \'{url}\': {result!r}.')
+
+        return [result for result in results if not isinstance(result, Exception)]
+
+    # polling
+
+    async def start(self) -> None:
+
+        if not self.peers:
+            LOG.warning('Cluster mode is enabled but no other nodes are configured.')
+            return
+
+        self._start_polling()
+        LOG.info(f'Cluster node \'{self.url}\' started polling {len(self.peers)} other node(s).')
+
+    def _start_polling(self) -> None:
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=CONFIG.cluster.poll_interval / 1000)
+            )
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll_loop())
+
+    async def close(self) -> None:
+
+        if self._task is not None:
+            self._task.cancel()
+        if self._session is not None:
+            await self._session.close()
+
+    async def _poll_loop(self) -> None:
+
+        while True:
+            # other nodes report the totals of all their workers, workers report only their own.
+            await asyncio.gather(
+                *(self._poll(peer, '/stats?aggregate=1', self._stats, 'Cluster node') for peer in self.peers),
+                *(self._poll(worker, '/stats', self._worker_stats, 'Worker') for worker in self.workers),
+            )
+            await asyncio.sleep(CONFIG.cluster.poll_interval / 1000)
+
+    async def _poll(self, url: str, path: str, store: dict[str, tuple[NodeStatsData, float]], kind: str) -> None:
+
+        assert self._session is not None
+
+        try:
+            async with self._session.get(f'{url}{path}') as response:
+                response.raise_for_status()
+                stats: NodeStatsData = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            if store.pop(url, None) is not None:
+                LOG.warning(f'{kind} \'{url}\' became unavailable: {error!r}.')
+            return
+
+        if url not in store:
+            LOG.info(f'{kind} \'{url}\' is available.')
+
+        # peers are stored under their configured url, which is what placement hashes and what clients are told to
+        # connect to.
+        if store is self._stats:
+            stats['node'] = url
+        store[url] = (stats, time.monotonic())
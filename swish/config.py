@@ -31,9 +31,12 @@ __all__ = (
 
 DEFAULT_CONFIG: dict[str, Any] = {
     'server':   {
-        'host':     '127.0.0.1',
-        'port':     8000,
-        'password': 'helloworld!'
+        'host':                  '127.0.0.1',
+        'port':                  8000,
+        'password':              'helloworld!',
+        'payload_backlog':       64,
+        'track_update_interval': 5000,
+        'allow_plaintext_voice': False
     },
     'rotation': {
         'enabled': False,
@@ -41,7 +44,84 @@ DEFAULT_CONFIG: dict[str, Any] = {
         'blocks':  []
     },
     'search':   {
-        'max_results': 10
+        'max_results':       10,
+        'stream_chunk_size': 50,
+        'cache':       {
+            'enabled':  True,
+            'max_size': 512,
+            'ttl':      300
+        },
+        'batch':       {
+            'max_queries':     500,
+            'max_concurrency': 8
+        }
+    },
+    'extractor': {
+        'mode':      'thread',
+        'pool_size': 16,
+        'workers':   8,
+        'max_queue': 256
+    },
+    'playback': {
+        'opus_passthrough': True,
+        'cache': {
+            'enabled':       True,
+            'max_size':      1024,
+            'ttl':           3600,
+            'expiry_margin': 300
+        },
+        'prefetch': {
+            'ttl':          300,
+            'warm_decoder': True
+        },
+        'shared': {
+            'buffer_frames': 50,
+            'idle_timeout':  5
+        },
+        'scheduler': {
+            'enabled': False,
+            'threads': 4
+        },
+        'pacing':    {
+            'spin_margin': 0
+        }
+    },
+    'encoder':  {
+        'default_profile': 'default',
+        'profiles':        {
+            'default': {
+                'bitrate':     128000,
+                'complexity':  10,
+                'fec':         True,
+                'packet_loss': 15,
+                'bandwidth':   'fullband'
+            },
+            'low':     {
+                'bitrate':     64000,
+                'complexity':  3,
+                'fec':         False,
+                'packet_loss': 0,
+                'bandwidth':   'fullband'
+            },
+            'premium': {
+                'bitrate':     192000,
+                'complexity':  10,
+                'fec':         True,
+                'packet_loss': 10,
+                'bandwidth':   'fullband'
+            }
+        }
+    },
+    'cluster':  {
+        'enabled':       False,
+        'url':           '',
+        'nodes':         [],
+        'poll_interval': 5000,
+        'weights':       {
+            'cpu':     1.0,
+            'players': 0.01,
+            'jitter':  0.1
+        }
     },
     'logging':  {
         'path':         'logs/',
@@ -60,6 +140,9 @@ class Server:
     host: str
     port: int
     password: str
+    payload_backlog: int
+    track_update_interval: int
+    allow_plaintext_voice: bool
 
 
 @dataclasses.dataclass
@@ -69,9 +152,109 @@ class Rotation:
     blocks: list[str]
 
 
+@dataclasses.dataclass
+class SearchCache:
+    enabled: bool
+    max_size: int
+    ttl: int
+
+
+@dataclasses.dataclass
+class SearchBatch:
+    max_queries: int
+    max_concurrency: int
+
+
 @dataclasses.dataclass
 class Search:
     max_results: int
+    stream_chunk_size: int
+    cache: SearchCache
+    batch: SearchBatch
+
+
+@dataclasses.dataclass
+class Extractor:
+    mode: Literal['thread', 'process']
+    pool_size: int
+    workers: int
+    max_queue: int
+
+
+@dataclasses.dataclass
+class PlaybackCache:
+    enabled: bool
+    max_size: int
+    ttl: int
+    expiry_margin: int
+
+
+@dataclasses.dataclass
+class PlaybackPrefetch:
+    ttl: int
+    warm_decoder: bool
+
+
+@dataclasses.dataclass
+class PlaybackShared:
+    buffer_frames: int
+    idle_timeout: int
+
+
+@dataclasses.dataclass
+class PlaybackScheduler:
+    enabled: bool
+    threads: int
+
+
+@dataclasses.dataclass
+class PlaybackPacing:
+    spin_margin: int
+
+
+@dataclasses.dataclass
+class Playback:
+    opus_passthrough: bool
+    cache: PlaybackCache
+    prefetch: PlaybackPrefetch
+    shared: PlaybackShared
+    scheduler: PlaybackScheduler
+    pacing: PlaybackPacing
+
+
+@dataclasses.dataclass
+class EncoderProfile:
+    bitrate: int
+    complexity: int
+    fec: bool
+    packet_loss: int
+    bandwidth: Literal['auto', 'narrowband', 'mediumband', 'wideband', 'superwideband', 'fullband']
+
+
+@dataclasses.dataclass
+class Encoder:
+    default_profile: str
+    profiles: dict[str, EncoderProfile]
+
+    def __post_init__(self) -> None:
+        if self.default_profile not in self.profiles:
+            raise dacite.DaciteError(f'encoder profile "{self.default_profile}" is not defined')
+
+
+@dataclasses.dataclass
+class ClusterWeights:
+    cpu: float
+    players: float
+    jitter: float
+
+
+@dataclasses.dataclass
+class Cluster:
+    enabled: bool
+    url: str
+    nodes: list[str]
+    poll_interval: int
+    weights: ClusterWeights
 
 
 @dataclasses.dataclass
@@ -93,6 +276,10 @@ class Config:
     server: Server
     rotation: Rotation
     search: Search
+    extractor: Extractor
+    playback: Playback
+    encoder: Encoder
+    cluster: Cluster
     logging: Logging
 
 
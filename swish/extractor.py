@@ -0,0 +1,466 @@
+"""Swish. A standalone audio player and server for bots on Discord.
+
+Copyright (C) 2022 PythonistaGuild <https://github.com/PythonistaGuild>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import enum
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterator
+from typing import Any
+
+import yt_dlp
+
+
+__all__ = (
+    'YTDLPool',
+    'YTDLProcessPool',
+    'Priority',
+    'ExtractorBusy',
+    'ExtractionExecutor',
+)
+
+
+LOG: logging.Logger = logging.getLogger('swish.extractor')
+
+
+PoolKey = tuple[bool, str]
+
+
+COMPACT_KEYS: tuple[str, ...] = (
+    'id', 'title', 'url', 'duration', 'uploader', 'channel_id', 'live_status', 'ie_key', 'extractor_key', 'acodec',
+)
+
+
+def compact(info: dict[str, Any]) -> dict[str, Any]:
+
+    # only the keys swish actually reads are kept, full info dicts can be hundreds
+    # of kilobytes which is wasteful to keep around or to pickle between processes.
+    result = {key: info[key] for key in COMPACT_KEYS if key in info}
+
+    if thumbnails := info.get('thumbnails'):
+        result['thumbnails'] = thumbnails[:1]
+    if (entries := info.get('entries')) is not None:
+        # entries yt-dlp has already fetched are compacted straight away, ones it returns lazily (when a playlist is
+        # extracted without being processed) are compacted as they're iterated so that no pages are fetched here.
+        compacted = (compact(entry) for entry in entries if entry)
+        result['entries'] = list(compacted) if isinstance(entries, (list, tuple)) else compacted
+
+    return result
+
+
+class YTDLLogger:
+
+    # yt-dlp writes straight to stdout/stderr unless it's given a logger, routing
+    # everything through here avoids having to redirect the process-wide stdout.
+
+    def debug(self, message: str) -> None:
+        pass
+
+    def warning(self, message: str) -> None:
+        LOG.debug(message)
+
+    def error(self, message: str) -> None:
+        LOG.error(message)
+
+
+class YTDLPool:
+
+    def __init__(self, options: dict[str, Any], max_idle: int) -> None:
+
+        self._options: dict[str, Any] = options
+        self.max_idle: int = max_idle
+
+        self._idle: collections.OrderedDict[PoolKey, list[yt_dlp.YoutubeDL]] = collections.OrderedDict()
+        self._idle_count: int = 0
+        self._lock: threading.Lock = threading.Lock()
+        self._logger: YTDLLogger = YTDLLogger()
+
+        self.created: int = 0
+        self.reused: int = 0
+
+    def _create(self, key: PoolKey) -> yt_dlp.YoutubeDL:
+
+        extract_flat, source_address = key
+
+        options = {
+            **self._options,
+            'extract_flat':   extract_flat,
+            'source_address': source_address,
+            'logger':         self._logger,
+        }
+        with self._lock:
+            self.created += 1
+
+        return yt_dlp.YoutubeDL(options)  # type: ignore
+
+    def _checkout(self, key: PoolKey) -> yt_dlp.YoutubeDL | None:
+
+        with self._lock:
+
+            if not (idle := self._idle.get(key)):
+                return None
+
+            ytdl = idle.pop()
+            self._idle_count -= 1
+            if not idle:
+                del self._idle[key]
+
+            self.reused += 1
+
+        return ytdl
+
+    def _checkin(self, key: PoolKey, ytdl: yt_dlp.YoutubeDL) -> None:
+
+        with self._lock:
+
+            self._idle.setdefault(key, []).append(ytdl)
+            self._idle.move_to_end(key)
+            self._idle_count += 1
+
+            # drop instances for the least recently used keys first, this keeps the
+            # pool bounded when ip rotation produces a new source address per call.
+            while self._idle_count > self.max_idle:
+                oldest_key, oldest = next(iter(self._idle.items()))
+                oldest.pop(0)
+                self._idle_count -= 1
+                if not oldest:
+                    del self._idle[oldest_key]
+
+    @contextlib.contextmanager
+    def acquire(self, extract_flat: bool, source_address: str) -> Iterator[yt_dlp.YoutubeDL]:
+
+        key = (extract_flat, source_address)
+        ytdl = self._checkout(key) or self._create(key)
+
+        try:
+            yield ytdl
+        finally:
+            self._checkin(key, ytdl)
+
+    def extract(
+        self,
+        query: str,
+        extract_flat: bool,
+        source_address: str,
+        playlist_items: str | None = None,
+    ) -> dict[str, Any] | None:
+
+        with self.acquire(extract_flat, source_address) as ytdl:
+
+            # yt-dlp only fetches the playlist pages needed to cover the requested items.
+            ytdl.params['playlist_items'] = playlist_items
+            try:
+                info = ytdl.extract_info(query, download=False)
+            finally:
+                ytdl.params['playlist_items'] = None
+
+        return compact(info) if info else None
+
+    def extract_chunks(
+        self,
+        query: str,
+        source_address: str,
+        offset: int,
+        limit: int | None,
+        chunk_size: int,
+        callback: Callable[[list[dict[str, Any]]], None],
+        cancelled: threading.Event,
+    ) -> None:
+
+        with self.acquire(True, source_address) as ytdl:
+
+            # left unprocessed, yt-dlp returns a playlist's entries lazily and only fetches each page once iteration
+            # reaches it, so the whole playlist is expanded by this one extraction. entries are then processed one at a
+            # time like yt-dlp would, which leaves flat entries as they are.
+            info = ytdl.extract_info(query, download=False, process=False)
+            if info and info.get('_type') == 'playlist':
+                info['entries'] = (
+                    ytdl.process_ie_result(entry, download=False) for entry in info.get('entries') or () if entry
+                )
+            elif info:
+                info = ytdl.process_ie_result(info, download=False)
+            if not info:
+                return
+
+            result = compact(info)
+            stop = None if limit is None else offset + limit
+
+            chunk: list[dict[str, Any]] = []
+            for entry in itertools.islice(result.get('entries', [result]), offset, stop):
+                if cancelled.is_set():
+                    return
+                chunk.append(entry)
+                if len(chunk) >= chunk_size:
+                    callback(chunk)
+                    chunk = []
+
+            if chunk:
+                callback(chunk)
+
+    def stats(self) -> dict[str, Any]:
+
+        # counters are updated from several extractor threads at once, so they're only read and written under the lock.
+        with self._lock:
+            return {
+                'idle':    self._idle_count,
+                'created': self.created,
+                'reused':  self.reused,
+            }
+
+
+_WORKER_POOL: YTDLPool | None = None
+
+
+def _initialise_worker(options: dict[str, Any], max_idle: int) -> None:
+    global _WORKER_POOL
+    _WORKER_POOL = YTDLPool(options, max_idle=max_idle)
+
+
+def _extract_in_worker(
+    query: str,
+    extract_flat: bool,
+    source_address: str,
+    playlist_items: str | None,
+) -> dict[str, Any] | None:
+    assert _WORKER_POOL is not None
+    return _WORKER_POOL.extract(query, extract_flat, source_address, playlist_items)
+
+
+class YTDLProcessPool:
+
+    def __init__(self, options: dict[str, Any], max_idle: int, workers: int) -> None:
+
+        self._options: dict[str, Any] = options
+        self.max_idle: int = max_idle
+        self.workers: int = workers
+
+        self._lock: threading.Lock = threading.Lock()
+        self._executor: concurrent.futures.ProcessPoolExecutor = self._create_executor()
+        self._shutdown: bool = False
+
+        self.restarts: int = 0
+
+    def _create_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+
+        # 'spawn' is used as forking a process that has running threads is unsafe.
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_initialise_worker,
+            initargs=(self._options, self.max_idle),
+        )
+
+    def _restart(self, broken: concurrent.futures.ProcessPoolExecutor) -> None:
+
+        with self._lock:
+
+            # another thread could have already replaced the broken executor, and one that was shut down isn't.
+            if self._executor is not broken or self._shutdown:
+                return
+
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._create_executor()
+            self.restarts += 1
+
+        LOG.warning('An extractor worker process crashed, the process pool has been restarted.')
+
+    def extract(
+        self,
+        query: str,
+        extract_flat: bool,
+        source_address: str,
+        playlist_items: str | None = None,
+    ) -> dict[str, Any] | None:
+
+        executor = self._executor
+
+        try:
+            return executor.submit(_extract_in_worker, query, extract_flat, source_address, playlist_items).result()
+        except concurrent.futures.process.BrokenProcessPool:
+            self._restart(executor)
+            raise
+
+    def shutdown(self) -> None:
+
+        with self._lock:
+            self._shutdown = True
+            executor = self._executor
+
+        # extractions that are still running are abandoned rather than waited for, otherwise exiting would be held up
+        # until they finish or the processes would be left running after it.
+        processes = list((executor._processes or {}).values())  # type: ignore
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            'workers':  self.workers,
+            'restarts': self.restarts,
+        }
+
+
+class Priority(enum.IntEnum):
+    PLAYBACK = 0
+    SEARCH = 1
+
+
+class ExtractorBusy(Exception):
+    pass
+
+
+class LaneStats:
+
+    def __init__(self) -> None:
+        self.depth: int = 0
+        self.rejected: int = 0
+        self.cancelled: int = 0
+        self.started: int = 0
+        self.completed: int = 0
+        self.total_wait: float = 0.0
+        self.max_wait: float = 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'depth':     self.depth,
+            'rejected':  self.rejected,
+            'cancelled': self.cancelled,
+            'started':   self.started,
+            'completed': self.completed,
+            'avg_wait':  self.total_wait / self.started if self.started else 0.0,
+            'max_wait':  self.max_wait,
+        }
+
+
+WorkItem = tuple[int, int, float, concurrent.futures.Future[Any], Callable[..., Any], tuple[Any, ...]]
+
+# queued ahead of every extraction to stop a worker thread.
+_STOP: int = -1
+
+
+class ExtractionExecutor:
+
+    def __init__(self, workers: int, max_queue: int) -> None:
+
+        self.workers: int = workers
+        self.max_queue: int = max_queue
+
+        self._queue: queue.PriorityQueue[WorkItem] = queue.PriorityQueue()
+        self._counter: Iterator[int] = itertools.count()
+        self._lock: threading.Lock = threading.Lock()
+        self._lanes: dict[Priority, LaneStats] = {priority: LaneStats() for priority in Priority}
+        self._shutdown: bool = False
+
+        self._threads: list[threading.Thread] = []
+        for index in range(workers):
+            thread = threading.Thread(target=self._worker, name=f'swish-extractor-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self) -> None:
+
+        while True:
+
+            priority, _, enqueued_at, future, function, args = self._queue.get()
+            if priority == _STOP:
+                return
+
+            wait = time.perf_counter() - enqueued_at
+            lane = self._lanes[Priority(priority)]
+
+            # futures cancelled while queued are dropped without counting towards the wait times.
+            running = future.set_running_or_notify_cancel()
+
+            with self._lock:
+                lane.depth -= 1
+                if not running:
+                    lane.cancelled += 1
+                    continue
+                lane.started += 1
+                lane.total_wait += wait
+                lane.max_wait = max(lane.max_wait, wait)
+
+            try:
+                result = function(*args)
+            except BaseException as error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+            with self._lock:
+                lane.completed += 1
+
+    def submit(self, priority: Priority, function: Callable[..., Any], *args: Any) -> concurrent.futures.Future[Any]:
+
+        with self._lock:
+
+            if self._shutdown:
+                raise RuntimeError('Cannot submit extractions after the executor has been shut down.')
+
+            lane = self._lanes[priority]
+            if lane.depth >= self.max_queue:
+                lane.rejected += 1
+                raise ExtractorBusy(f'The {priority.name.lower()} extraction queue is full.')
+
+            lane.depth += 1
+
+            # queued under the lock so that nothing can be queued behind the stop items once shut down.
+            future: concurrent.futures.Future[Any] = concurrent.futures.Future()
+            self._queue.put((priority, next(self._counter), time.perf_counter(), future, function, args))
+
+        return future
+
+    async def run(self, priority: Priority, function: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.wrap_future(self.submit(priority, function, *args))
+
+    def shutdown(self) -> None:
+
+        with self._lock:
+
+            self._shutdown = True
+
+            # queued extractions are cancelled, ones that are already running are left to finish.
+            while True:
+                try:
+                    priority, _, _, future, _, _ = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                lane = self._lanes[Priority(priority)]
+                lane.depth -= 1
+                lane.cancelled += 1
+                future.cancel()
+
+        for _ in self._threads:
+            self._queue.put((_STOP, next(self._counter), 0.0, concurrent.futures.Future(), lambda: None, ()))
+
+    def stats(self) -> dict[str, Any]:
+
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'lanes':   {priority.name.lower(): lane.to_dict() for priority, lane in self._lanes.items()},
+            }
@@ -0,0 +1,123 @@
+"""Swish. A standalone audio player and server for bots on Discord.
+
+Copyright (C) 2022 PythonistaGuild <https://github.com/PythonistaGuild>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+from typing import Any
+
+from .types.payloads import FiltersData, SetFilterData
+
+
+__all__ = (
+    'EQUALIZER_BANDS',
+    'Filters',
+)
+
+
+# must match the bands of the native filter chain.
+EQUALIZER_BANDS: int = 15
+
+SAMPLE_RATE: int = 48000
+
+
+def _number(value: Any, key: str, minimum: float, maximum: float) -> float:
+
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not minimum <= value <= maximum:
+        raise ValueError(f'\'{key}\' key, expected a number between {minimum} and {maximum}')
+
+    return float(value)
+
+
+@dataclasses.dataclass(frozen=True)
+class Filters:
+    volume: float = 1.0
+    equalizer: tuple[float, ...] = (0.0,) * EQUALIZER_BANDS
+    speed: float = 1.0
+    pitch: float = 1.0
+    rate: float = 1.0
+
+    @classmethod
+    def from_payload(cls, data: SetFilterData) -> Filters:
+
+        volume = _number(data.get('volume', 1.0), 'volume', 0.0, 5.0)
+
+        equalizer = [0.0] * EQUALIZER_BANDS
+        bands = data.get('equalizer', [])
+        if not isinstance(bands, list):
+            raise ValueError('\'equalizer\' key, expected a list of bands')
+        for band in bands:
+            if not isinstance(band, dict):
+                raise ValueError('\'equalizer\' key, expected a list of bands')
+            index = band.get('band')
+            if isinstance(index, bool) or not isinstance(index, int) or not 0 <= index < EQUALIZER_BANDS:
+                raise ValueError(f'\'equalizer.band\' key, expected an integer between 0 and {EQUALIZER_BANDS - 1}')
+            equalizer[index] = _number(band.get('gain'), 'equalizer.gain', -0.25, 1.0)
+
+        timescale = data.get('timescale', {})
+        if not isinstance(timescale, dict):
+            raise ValueError('\'timescale\' key, expected an object')
+
+        return cls(
+            volume=volume,
+            equalizer=tuple(equalizer),
+            speed=_number(timescale.get('speed', 1.0), 'timescale.speed', 0.5, 2.0),
+            pitch=_number(timescale.get('pitch', 1.0), 'timescale.pitch', 0.5, 2.0),
+            rate=_number(timescale.get('rate', 1.0), 'timescale.rate', 0.5, 2.0),
+        )
+
+    def to_payload(self) -> FiltersData:
+
+        # the inverse of from_payload, unchanged equalizer bands are left out.
+        return {
+            'volume':    self.volume,
+            'equalizer': [{'band': band, 'gain': gain} for band, gain in enumerate(self.equalizer) if gain],
+            'timescale': {'speed': self.speed, 'pitch': self.pitch, 'rate': self.rate},
+        }
+
+    @property
+    def active(self) -> bool:
+        # any filter needs decoded audio, so Opus passthrough and shared streams can't be used.
+        return self != Filters()
+
+    @property
+    def tempo(self) -> float:
+        # milliseconds of the track played per millisecond of audio sent.
+        return self.speed * self.rate
+
+    @property
+    def graph(self) -> str | None:
+
+        if self.speed == self.pitch == self.rate == 1.0:
+            return None
+
+        # asetrate changes tempo and pitch together, atempo then corrects the tempo
+        # without touching the pitch. atempo only accepts factors between 0.5 and 2.0.
+        filters = [f'aresample={SAMPLE_RATE}', f'asetrate={SAMPLE_RATE * self.pitch * self.rate:.0f}', f'aresample={SAMPLE_RATE}']
+
+        tempo = self.speed / self.pitch
+        while tempo > 2.0:
+            filters.append('atempo=2.0')
+            tempo /= 2.0
+        while tempo < 0.5:
+            filters.append('atempo=0.5')
+            tempo /= 0.5
+        if tempo != 1.0:
+            filters.append(f'atempo={tempo:.6f}')
+
+        return ','.join(filters)
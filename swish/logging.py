@@ -18,9 +18,11 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import annotations
 
+import atexit
 import logging
 import logging.handlers
 import os
+import queue
 
 import colorama
 
@@ -28,6 +30,8 @@ from .config import CONFIG
 
 
 __all__ = (
+    'ColourFormatter',
+    'queue_handlers',
     'setup_logging',
 )
 
@@ -35,35 +39,82 @@ __all__ = (
 class ColourFormatter(logging.Formatter):
 
     COLOURS: dict[int, str] = {
-        logging.DEBUG:   colorama.Fore.MAGENTA,
-        logging.INFO:    colorama.Fore.GREEN,
-        logging.WARNING: colorama.Fore.YELLOW,
-        logging.ERROR:   colorama.Fore.RED,
+        logging.DEBUG:    colorama.Fore.MAGENTA,
+        logging.INFO:     colorama.Fore.GREEN,
+        logging.WARNING:  colorama.Fore.YELLOW,
+        logging.ERROR:    colorama.Fore.RED,
+        logging.CRITICAL: colorama.Fore.LIGHTRED_EX,
     }
 
+    DATEFMT: str = '%I:%M:%S %Y/%m/%d'
+
     def __init__(self, enabled: bool) -> None:
 
         self.enabled: bool = enabled
 
-        if self.enabled:
-            fmt = f'{colorama.Fore.CYAN}[%(asctime)s] {colorama.Style.RESET_ALL}' \
-                  f'{colorama.Fore.LIGHTCYAN_EX}[%(name) 16s] {colorama.Style.RESET_ALL}' \
-                  f'%(colour)s[%(levelname) 8s] {colorama.Style.RESET_ALL}' \
-                  f'%(message)s'
-        else:
-            fmt = '[%(asctime)s] [%(name) 16s] [%(levelname) 8s] %(message)s'
-
         super().__init__(
-            fmt=fmt,
-            datefmt='%I:%M:%S %Y/%m/%d'
+            fmt=self._get_format(None),
+            datefmt=self.DATEFMT
         )
 
+        # the coloured format of each level is built once, rather than patching every record before formatting it.
+        self._formatters: dict[int, logging.Formatter] = {
+            level: logging.Formatter(fmt=self._get_format(colour), datefmt=self.DATEFMT)
+            for level, colour in self.COLOURS.items()
+        } if self.enabled else {}
+
+    def _get_format(self, colour: str | None) -> str:
+
+        if colour is None:
+            return '[%(asctime)s] [%(name) 16s] [%(levelname) 8s] %(message)s'
+
+        return f'{colorama.Fore.CYAN}[%(asctime)s] {colorama.Style.RESET_ALL}' \
+               f'{colorama.Fore.LIGHTCYAN_EX}[%(name) 16s] {colorama.Style.RESET_ALL}' \
+               f'{colour}[%(levelname) 8s] {colorama.Style.RESET_ALL}' \
+               f'%(message)s'
+
     def format(self, record: logging.LogRecord) -> str:
-        record.colour = self.COLOURS[record.levelno]  # type: ignore
+
+        if (formatter := self._formatters.get(record.levelno)) is not None:
+            return formatter.format(record)
+
         return super().format(record)
 
 
-def setup_logging() -> None:
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+
+        # the message is rendered here, as its arguments are often payloads and player state that the event loop
+        # goes on to change, and so are tracebacks as they reference frames that are about to change. the rest of the
+        # formatting (timestamps, colours) and the writing out is left to the listener's thread.
+        record.msg = record.getMessage()
+        record.args = None
+
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+
+def queue_handlers(logger: logging.Logger, *handlers: logging.Handler) -> logging.handlers.QueueListener:
+
+    # records are only queued on the calling thread, formatting them and writing them out (including rotating
+    # log files) happens on the listener's thread so that it never blocks the event loop.
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    logger.addHandler(_LazyQueueHandler(records))
+
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+
+    # flushes any records that are still queued on exit.
+    atexit.register(listener.stop)
+
+    return listener
+
+
+def setup_logging(suffix: str = '') -> None:
 
     colorama.init(autoreset=True)
 
@@ -81,18 +132,18 @@ def setup_logging() -> None:
         if not os.path.exists(path):
             os.makedirs(path)
 
-        # file handler
+        # file handler, worker processes append as a restarted worker would otherwise lose the log of its crash.
         file_handler = logging.handlers.RotatingFileHandler(
-            filename=f'{path}{name}.log',
-            mode='w',
+            filename=f'{path}{name}{suffix}.log',
+            mode='a' if suffix else 'w',
             maxBytes=CONFIG.logging.max_bytes,
             backupCount=CONFIG.logging.backup_count,
             encoding='utf-8',
         )
         file_handler.setFormatter(ColourFormatter(enabled=False))
-        logger.addHandler(file_handler)
 
         # stdout handler
         stream_handler = logging.StreamHandler()
         stream_handler.setFormatter(ColourFormatter(enabled=True))
-        logger.addHandler(stream_handler)
+
+        queue_handlers(logger, file_handler, stream_handler)
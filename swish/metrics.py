@@ -0,0 +1,363 @@
+"""Swish. A standalone audio player and server for bots on Discord.
+
+Copyright (C) 2022 PythonistaGuild <https://github.com/PythonistaGuild>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import abc
+import bisect
+import math
+from collections.abc import Iterator
+
+
+__all__ = (
+    'CONTENT_TYPE',
+    'Metric',
+    'Counter',
+    'Gauge',
+    'Histogram',
+    'render',
+    'merge',
+    'PAYLOADS_RECEIVED',
+    'PAYLOADS_SENT',
+    'INVALID_PAYLOADS',
+    'PAYLOAD_HANDLE_SECONDS',
+    'EXTRACTION_SECONDS',
+    'EXTRACTOR_QUEUE_DEPTH',
+    'EXTRACTOR_STARTED',
+    'EXTRACTOR_COMPLETED',
+    'EXTRACTOR_CANCELLED',
+    'EXTRACTOR_REJECTED',
+    'EXTRACTOR_AVG_WAIT_SECONDS',
+    'EXTRACTOR_MAX_WAIT_SECONDS',
+    'CACHE_ENTRIES',
+    'CACHE_HITS',
+    'CACHE_MISSES',
+    'CACHE_EVICTIONS',
+    'SEARCHES_COALESCED',
+    'WEBSOCKET_CONNECTIONS',
+    'PLAYERS',
+    'VOICE_CONNECTIONS',
+    'FFMPEG_PROCESSES',
+    'SCHEDULER_PLAYERS',
+    'VOICE_FRAMES',
+    'VOICE_LATE_FRAMES',
+    'VOICE_DRIFT_SECONDS',
+    'VOICE_MAX_JITTER_SECONDS',
+    'VOICE_MAX_LATENESS_SECONDS',
+)
+
+
+CONTENT_TYPE: str = 'text/plain; version=0.0.4; charset=utf-8'
+
+Labels = tuple[str, ...]
+
+_REGISTRY: list[Metric] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+# metrics are only ever recorded from the event loop thread, so recording is a plain dict update without any locking.
+class Metric(abc.ABC):
+
+    TYPE: str
+
+    def __init__(self, name: str, documentation: str, labels: Labels = ()) -> None:
+
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labels: Labels = labels
+
+        _REGISTRY.append(self)
+
+    def _format_labels(self, values: Labels, extra: tuple[tuple[str, str], ...] = ()) -> str:
+
+        pairs = [*zip(self.labels, values), *extra]
+        if not pairs:
+            return ''
+
+        return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+    @abc.abstractmethod
+    def samples(self, extra: tuple[tuple[str, str], ...] = ()) -> Iterator[str]:
+        ...
+
+    def render(self, extra: tuple[tuple[str, str], ...] = ()) -> str:
+        return '\n'.join(
+            [
+                f'# HELP {self.name} {self.documentation}',
+                f'# TYPE {self.name} {self.TYPE}',
+                *self.samples(extra),
+            ]
+        )
+
+
+class Counter(Metric):
+
+    TYPE = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Labels = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set_total(self, value: float, *labels: str) -> None:
+        # for totals that are already counted elsewhere, such as by the extractor.
+        self._values[labels] = value
+
+    def samples(self, extra: tuple[tuple[str, str], ...] = ()) -> Iterator[str]:
+        for labels, value in self._values.items():
+            yield f'{self.name}{self._format_labels(labels, extra)} {_format_value(value)}'
+
+
+class Gauge(Metric):
+
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: Labels = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self._values: dict[Labels, float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def samples(self, extra: tuple[tuple[str, str], ...] = ()) -> Iterator[str]:
+        for labels, value in self._values.items():
+            yield f'{self.name}{self._format_labels(labels, extra)} {_format_value(value)}'
+
+
+class Histogram(Metric):
+
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: tuple[float, ...], labels: Labels = ()) -> None:
+        super().__init__(name, documentation, labels)
+
+        self.buckets: tuple[float, ...] = tuple(sorted(buckets))
+
+        # non-cumulative counts per bucket, the last one being +Inf. they're only summed up when rendered.
+        self._counts: dict[Labels, list[int]] = {}
+        self._sums: dict[Labels, float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+
+        if (counts := self._counts.get(labels)) is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+            self._sums[labels] = 0.0
+
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def samples(self, extra: tuple[tuple[str, str], ...] = ()) -> Iterator[str]:
+
+        for labels, counts in self._counts.items():
+
+            total = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                total += count
+                yield f'{self.name}_bucket{self._format_labels(labels, (*extra, ("le", _format_value(bound))))} {total}'
+
+            yield f'{self.name}_sum{self._format_labels(labels, extra)} {_format_value(self._sums[labels])}'
+            yield f'{self.name}_count{self._format_labels(labels, extra)} {total}'
+
+
+def render(extra: tuple[tuple[str, str], ...] = ()) -> str:
+    # extra labels are added to every sample, such as the worker process they came from.
+    return '\n'.join(metric.render(extra) for metric in _REGISTRY) + '\n'
+
+
+def merge(texts: list[str]) -> str:
+
+    # combines the output of several processes, the format requires every sample of a metric to follow its single HELP
+    # and TYPE lines, so they can't simply be concatenated.
+    headers: dict[str, list[str]] = {}
+    samples: dict[str, list[str]] = {}
+
+    for text in texts:
+        name = ''
+        for line in text.splitlines():
+            if line.startswith('# '):
+                name = line.split(' ', 3)[2]
+                if line not in (lines := headers.setdefault(name, [])):
+                    lines.append(line)
+            elif line:
+                samples.setdefault(name, []).append(line)
+
+    return '\n'.join(line for name, lines in headers.items() for line in (*lines, *samples.get(name, ()))) + '\n'
+
+
+###########
+# Metrics #
+###########
+
+_LATENCY_BUCKETS: tuple[float, ...] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0
+)
+_EXTRACTION_BUCKETS: tuple[float, ...] = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# websocket
+
+PAYLOADS_RECEIVED: Counter = Counter(
+    'swish_websocket_payloads_received_total',
+    'Payloads received from clients.',
+    ('op',),
+)
+PAYLOADS_SENT: Counter = Counter(
+    'swish_websocket_payloads_sent_total',
+    'Payloads sent to clients.',
+    ('op',),
+)
+INVALID_PAYLOADS: Counter = Counter(
+    'swish_websocket_invalid_payloads_total',
+    'Payloads received from clients that failed to decode or validate.',
+)
+PAYLOAD_HANDLE_SECONDS: Histogram = Histogram(
+    'swish_payload_handle_seconds',
+    'Time taken to handle a payload.',
+    _LATENCY_BUCKETS,
+    ('op',),
+)
+WEBSOCKET_CONNECTIONS: Gauge = Gauge(
+    'swish_websocket_connections',
+    'Open client websocket connections.',
+)
+
+# extractor
+
+EXTRACTION_SECONDS: Histogram = Histogram(
+    'swish_extraction_seconds',
+    'Time taken to extract a search or playback url with yt-dlp, including time spent queued.',
+    _EXTRACTION_BUCKETS,
+    ('kind',),
+)
+EXTRACTOR_QUEUE_DEPTH: Gauge = Gauge(
+    'swish_extractor_queue_depth',
+    'Extractions waiting for a worker.',
+    ('lane',),
+)
+EXTRACTOR_STARTED: Counter = Counter(
+    'swish_extractor_started_total',
+    'Extractions picked up by a worker.',
+    ('lane',),
+)
+EXTRACTOR_COMPLETED: Counter = Counter(
+    'swish_extractor_completed_total',
+    'Extractions finished by a worker, whether they succeeded or failed.',
+    ('lane',),
+)
+EXTRACTOR_CANCELLED: Counter = Counter(
+    'swish_extractor_cancelled_total',
+    'Extractions cancelled while waiting for a worker.',
+    ('lane',),
+)
+EXTRACTOR_REJECTED: Counter = Counter(
+    'swish_extractor_rejected_total',
+    'Extractions rejected because their queue was full.',
+    ('lane',),
+)
+EXTRACTOR_AVG_WAIT_SECONDS: Gauge = Gauge(
+    'swish_extractor_avg_wait_seconds',
+    'Average time extractions waited for a worker since the server started.',
+    ('lane',),
+)
+EXTRACTOR_MAX_WAIT_SECONDS: Gauge = Gauge(
+    'swish_extractor_max_wait_seconds',
+    'Longest time any extraction waited for a worker since the server started.',
+    ('lane',),
+)
+
+# caches
+
+CACHE_ENTRIES: Gauge = Gauge(
+    'swish_cache_entries',
+    'Entries held by a cache.',
+    ('cache',),
+)
+CACHE_HITS: Counter = Counter(
+    'swish_cache_hits_total',
+    'Lookups answered by a cache.',
+    ('cache',),
+)
+CACHE_MISSES: Counter = Counter(
+    'swish_cache_misses_total',
+    'Lookups that missed a cache, including expired entries.',
+    ('cache',),
+)
+CACHE_EVICTIONS: Counter = Counter(
+    'swish_cache_evictions_total',
+    'Entries evicted from a cache because it was full.',
+    ('cache',),
+)
+
+SEARCHES_COALESCED: Counter = Counter(
+    'swish_searches_coalesced_total',
+    'Searches that waited on an identical search already in progress instead of extracting again.',
+)
+
+# playback
+
+PLAYERS: Gauge = Gauge(
+    'swish_players',
+    'Players across all client connections.',
+)
+VOICE_CONNECTIONS: Gauge = Gauge(
+    'swish_voice_connections',
+    'Players connected to a discord voice server.',
+)
+FFMPEG_PROCESSES: Gauge = Gauge(
+    'swish_ffmpeg_processes',
+    'Running ffmpeg processes, including prefetched and shared decoders.',
+)
+SCHEDULER_PLAYERS: Gauge = Gauge(
+    'swish_scheduler_players',
+    'Players driven by the native scheduler.',
+)
+
+# native send timing, summed up over the current voice connections.
+
+VOICE_FRAMES: Gauge = Gauge(
+    'swish_voice_frames',
+    'Frames sent by the current voice connections.',
+)
+VOICE_LATE_FRAMES: Gauge = Gauge(
+    'swish_voice_late_frames',
+    'Frames sent more than 5ms after they were due by the current voice connections.',
+)
+VOICE_DRIFT_SECONDS: Gauge = Gauge(
+    'swish_voice_drift_seconds',
+    'Time the send timeline of the current voice connections was moved forward to catch up.',
+)
+VOICE_MAX_JITTER_SECONDS: Gauge = Gauge(
+    'swish_voice_max_jitter_seconds',
+    'Highest send jitter of any current voice connection.',
+)
+VOICE_MAX_LATENESS_SECONDS: Gauge = Gauge(
+    'swish_voice_max_lateness_seconds',
+    'Latest any frame of a current voice connection was sent.',
+)
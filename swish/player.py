@@ -20,6 +20,7 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import time
 from collections.abc import Callable
 from typing import Any, TYPE_CHECKING
 
@@ -28,19 +29,32 @@ import aiohttp.web
 import discord.backoff
 from discord.ext.native_voice import native_voice  # type: ignore
 
+from . import metrics
+from .config import CONFIG
+from .extractor import ExtractorBusy
+from .filters import Filters
 from .types.payloads import (
     PayloadHandlers,
     ReceivedPayload,
     SentPayloadOp,
     VoiceUpdateData,
+    DestroyData,
     PlayData,
+    PrefetchData,
+    StopData,
     SetPauseStateData,
     SetPositionData,
     SetFilterData,
+    DebugData,
+    MigrateData,
+    TrackUpdateData,
+    PlayerDebugData,
+    PlayerMigrateData,
+    PacingStatsData,
 )
 
 if TYPE_CHECKING:
-    from .app import App
+    from .app import App, PlaybackSource
 
 
 __all__ = (
@@ -69,14 +83,34 @@ class Player:
         self._connection: native_voice.VoiceConnection | None = None
         self._runner: asyncio.Task[None] | None = None
 
+        self._payloads: asyncio.Queue[ReceivedPayload] = asyncio.Queue(maxsize=CONFIG.server.payload_backlog)
+        self._consumer: asyncio.Task[None] | None = None
+
+        self._encoder_profile: str = CONFIG.encoder.default_profile
+
+        self._filters: Filters = Filters()
+
+        # the resolved source, end time and shared state of the current track, kept for seeking.
+        self._current: tuple[PlaybackSource, int | None, bool] | None = None
+        self._track_id: str | None = None
+
+        self._prefetched: tuple[str, PlaybackSource] | None = None
+        self._prefetch_expiry: asyncio.TimerHandle | None = None
+        self._prefetch_task: asyncio.Task[None] | None = None
+        # track ids with an extraction for a prefetch in progress.
+        self._prefetching: set[str] = set()
+
         self._PAYLOAD_HANDLERS: PayloadHandlers = {
             'voice_update':    self._voice_update,
             'destroy':         self._destroy,
             'play':            self._play,
+            'prefetch':        self._prefetch,
             'stop':            self._stop,
             'set_pause_state': self._set_pause_state,
             'set_position':    self._set_position,
             'set_filter':      self._set_filter,
+            'debug':           self._debug,
+            'migrate':         self._migrate,
         }
 
         self._LOG_PREFIX: str = f'{self._websocket["client_name"]} - Player \'{self._guild_id}\''
@@ -90,19 +124,109 @@ class Player:
 
     # websocket handlers
 
+    def enqueue_payload(self, payload: ReceivedPayload) -> None:
+
+        # payloads are handled in order per player, but players don't wait on each other.
+        try:
+            self._payloads.put_nowait(payload)
+        except asyncio.QueueFull:
+            LOG.warning(
+                f'{self._LOG_PREFIX} payload backlog is full ({self._payloads.maxsize} payloads), '
+                f'dropped payload with \'{payload["op"]}\' op.'
+            )
+            return
+
+        if self._consumer is None or self._consumer.done():
+            self._consumer = asyncio.create_task(self._consume_payloads())
+
+    async def _consume_payloads(self) -> None:
+
+        # exits once the backlog is drained so that idle players don't keep a task around.
+        while not self._payloads.empty():
+
+            payload = self._payloads.get_nowait()
+
+            try:
+                await self.handle_payload(payload)
+            except Exception as error:
+                LOG.error(
+                    '%s failed to handle payload with \'%s\' op.', self._LOG_PREFIX, payload['op'], exc_info=error
+                )
+
+    def cancel_payloads(self) -> None:
+
+        while not self._payloads.empty():
+            self._payloads.get_nowait()
+
+        if self._consumer is not None:
+            self._consumer.cancel()
+
     async def handle_payload(self, payload: ReceivedPayload) -> None:
 
         op = payload['op']
 
         if op not in self._PAYLOAD_HANDLERS:
-            LOG.error(f'{self._LOG_PREFIX} received payload with unknown \'op\' key.\nPayload: {payload}')
+            LOG.error('%s received payload with unknown \'op\' key.\nPayload: %s', self._LOG_PREFIX, payload)
             return
 
-        LOG.debug(f'{self._LOG_PREFIX} received payload with \'{op}\' op.\nPayload: {payload}')
-        await self._PAYLOAD_HANDLERS[op](payload['d'])
+        # this runs for every payload, so the payload is only formatted if it is actually logged.
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug('%s received payload with \'%s\' op.\nPayload: %s', self._LOG_PREFIX, op, payload)
+
+        start = time.perf_counter()
+        try:
+            await self._PAYLOAD_HANDLERS[op](payload['d'])
+        finally:
+            metrics.PAYLOAD_HANDLE_SECONDS.observe(time.perf_counter() - start, op)
 
     async def send_payload(self, op: SentPayloadOp, data: Any) -> None:
-        await self._websocket.send_json({'op': op, 'd': data})
+        await self._app.send_payload(self._websocket, op, data)
+
+    def get_track_update(self) -> TrackUpdateData | None:
+
+        if not self._connection:
+            return None
+
+        paused = self._connection.is_paused()
+        if not paused and not self._connection.is_playing():
+            return None
+
+        return {
+            'guild_id': self._guild_id,
+            'position': self._connection.position(),
+            'paused':   paused,
+        }
+
+    def get_pacing_stats(self) -> PacingStatsData | None:
+        return self._connection.pacing_stats() if self._connection else None
+
+    def get_migration(self, node: str) -> PlayerMigrateData:
+
+        # everything a client needs to recreate this player on another node and carry on where it left off.
+        event: PlayerMigrateData = {
+            'guild_id':        self._guild_id,
+            'type':            'player_migrate',
+            'node':            node,
+            'track_id':        None,
+            'position':        0,
+            'end_time':        None,
+            'paused':          False,
+            'shared':          False,
+            'encoder_profile': self._encoder_profile,
+            'filters':         self._filters.to_payload(),
+        }
+
+        if self._connection and self._current is not None:
+            paused = self._connection.is_paused()
+            if paused or self._connection.is_playing():
+                _, end_time, shared = self._current
+                event['track_id'] = self._track_id
+                event['position'] = self._connection.position()
+                event['end_time'] = end_time
+                event['paused'] = paused
+                event['shared'] = shared
+
+        return event
 
     # connection handlers
 
@@ -110,6 +234,8 @@ class Player:
 
         loop = asyncio.get_running_loop()
         self._connection = await self._connector.connect(loop)
+        self._connection.set_encoder_profile(self._app._encoder_profiles[self._encoder_profile])
+        self._connection.set_filters(self._filters.volume, list(self._filters.equalizer))
 
         if self._runner is not None:
             self._runner.cancel()
@@ -156,6 +282,105 @@ class Player:
         self._connection.disconnect()
         self._connection = None
 
+    # prefetch handlers
+
+    def _take_prefetched(self, track_id: str) -> PlaybackSource | None:
+
+        if self._prefetched is None or self._prefetched[0] != track_id:
+            return None
+
+        _, source = self._prefetched
+        self._prefetched = None
+
+        if self._prefetch_expiry is not None:
+            self._prefetch_expiry.cancel()
+            self._prefetch_expiry = None
+
+        return source
+
+    def _discard_prefetched(self) -> None:
+
+        if self._prefetch_expiry is not None:
+            self._prefetch_expiry.cancel()
+            self._prefetch_expiry = None
+
+        self._prefetched = None
+
+        if self._connection is not None:
+            self._connection.discard_prefetch()
+
+    def _background_prefetch_done(self, task: asyncio.Task[None]) -> None:
+
+        if self._prefetch_task is task:
+            self._prefetch_task = None
+
+        if task.cancelled() or (error := task.exception()) is None:
+            return
+
+        # background prefetches aren't awaited by anything, so their errors are logged here. a prefetch that failed
+        # part way through may have been stored already, in which case it's dropped.
+        LOG.error('%s failed to prefetch the next track.', self._LOG_PREFIX, exc_info=error)
+        self._discard_prefetched()
+
+    # encoder handlers
+
+    def _set_encoder_profile(self, op: str, profile: str) -> bool:
+
+        if profile not in self._app._encoder_profiles:
+            LOG.error(f'{self._LOG_PREFIX} received \'{op}\' op with unknown \'encoder_profile\' key \'{profile}\'.')
+            return False
+
+        # only applies to tracks started afterwards, the current track keeps its encoder.
+        self._encoder_profile = profile
+        if self._connection:
+            self._connection.set_encoder_profile(self._app._encoder_profiles[profile])
+
+        return True
+
+    # playback handlers
+
+    def _start_playback(self, source: PlaybackSource, position: int, end_time: int | None) -> None:
+
+        assert self._connection is not None
+
+        # filters need decoded audio, so opus streams are decoded instead of passed through while any are active.
+        url, opus = source
+        self._connection.play(
+            url,
+            position,
+            end_time,
+            opus and not self._filters.active,
+            self._filters.graph,
+            self._filters.tempo,
+        )
+        self._current = (source, end_time, False)
+
+    # shared stream handlers
+
+    def _get_shared_stream(self, track_url: str, source: PlaybackSource, start_time: int) -> native_voice.SharedStream:
+
+        streams = self._app._shared_streams
+
+        # streams stop by themselves once they end or have been unused for a while.
+        for key in [key for key, stream in streams.items() if stream.is_finished()]:
+            del streams[key]
+
+        # players only share a stream that they would otherwise have encoded the same way.
+        url, opus = source
+        key = (track_url, start_time, self._encoder_profile, opus)
+        if (stream := streams.get(key)) is None:
+            stream = native_voice.SharedStream(
+                url,
+                start_time,
+                opus,
+                CONFIG.playback.shared.buffer_frames,
+                CONFIG.playback.shared.idle_timeout,
+                self._app._encoder_profiles[self._encoder_profile],
+            )
+            streams[key] = stream
+
+        return stream
+
     # payload handlers
 
     async def _voice_update(self, data: VoiceUpdateData) -> None:
@@ -170,10 +395,19 @@ class Player:
             LOG.error(self._MISSING_KEY_MESSAGE('voice_update', 'endpoint'))
             return
 
-        self._connector.session_id = session_id
+        if (profile := data.get('encoder_profile')) is not None and not self._set_encoder_profile('voice_update', profile):
+            return
+
+        # plaintext endpoints are only used by local stand-ins for discord's voice servers, such as the load tests.
+        if endpoint.startswith('ws://'):
+            if not CONFIG.server.allow_plaintext_voice:
+                LOG.error(f'{self._LOG_PREFIX} received \'voice_update\' op with plaintext \'endpoint\' key.')
+                return
+        else:
+            endpoint, _, _ = endpoint.rpartition(':')
+            endpoint = endpoint.removeprefix('wss://')
 
-        endpoint, _, _ = endpoint.rpartition(':')
-        endpoint = endpoint.removeprefix('wss://')
+        self._connector.session_id = session_id
 
         self._connector.update_socket(
             token,
@@ -183,13 +417,24 @@ class Player:
         await self._connect()
         LOG.info(f'{self._LOG_PREFIX} connected to internal voice server \'{endpoint}\'.')
 
-    async def _destroy(self) -> None:
+    async def _destroy(self, data: DestroyData) -> None:
+
+        if self._prefetch_task is not None:
+            self._prefetch_task.cancel()
+        self._discard_prefetched()
 
         await self._disconnect()
         LOG.info(f'{self._LOG_PREFIX} has been disconnected.')
 
         del self._websocket['players'][self._guild_id]
 
+        # anything queued behind the destroy was meant for a new player.
+        if not self._payloads.empty():
+            player = Player(self._websocket, self._guild_id)
+            self._websocket['players'][self._guild_id] = player
+            while not self._payloads.empty():
+                player.enqueue_payload(self._payloads.get_nowait())
+
     async def _play(self, data: PlayData) -> None:
 
         if not self._connection:
@@ -200,17 +445,104 @@ class Player:
             LOG.error(self._MISSING_KEY_MESSAGE('play', 'track_id'))
             return
 
-        # TODO: handle start_time
-        # TODO: handle end_time
         # TODO: handle replace
 
-        track_info = self._app._decode_track_id(track_id)
-        url = await self._app._get_playback_url(track_info['url'])
+        if (profile := data.get('encoder_profile')) is not None and not self._set_encoder_profile('play', profile):
+            return
+
+        start_time = data.get('start_time', 0)
+        end_time = data.get('end_time') or None
+
+        if start_time < 0:
+            LOG.error(f'{self._LOG_PREFIX} received \'play\' op with invalid \'start_time\' key.')
+            return
+        if end_time is not None and end_time <= start_time:
+            LOG.error(f'{self._LOG_PREFIX} received \'play\' op with invalid \'end_time\' key.')
+            return
+
+        try:
+            track_info = self._app._decode_track_id(track_id)
+        except ValueError:
+            LOG.error(f'{self._LOG_PREFIX} received \'play\' op with invalid \'track_id\' key.')
+            return
+
+        # every player of a shared stream hears the same audio, so filtered players play on their own.
+        shared = data.get('shared', False) and not self._filters.active
+
+        # a background prefetch of this track is waited for rather than extracting the track a second time, explicit
+        # prefetch ops are handled in order with play ops and so are never still in progress here.
+        if track_id in self._prefetching and self._prefetch_task is not None:
+            await asyncio.wait([self._prefetch_task])
+
+        # shared streams are started by whichever player asks first, so a prefetched decoder isn't used for them.
+        if (source := None if shared else self._take_prefetched(track_id)) is None:
+            # a prefetch that wasn't used would otherwise keep its decoder around until it expired.
+            if self._prefetched is not None:
+                self._discard_prefetched()
+            try:
+                source = await self._app._get_playback_url(track_info['url'])
+            except ExtractorBusy:
+                LOG.error(f'{self._LOG_PREFIX} could not play track \'{track_info["title"]}\' as the extractor is overloaded.')
+                return
+
+        if shared:
+            stream = self._get_shared_stream(track_info['url'], source, start_time)
+            self._connection.play_shared(stream, end_time)
+            self._current = (source, end_time, True)
+        else:
+            self._start_playback(source, start_time, end_time)
+        self._track_id = track_id
 
-        self._connection.play(url)
         LOG.info(f'{self._LOG_PREFIX} started playing track \'{track_info["title"]}\' by \'{track_info["author"]}\'.')
 
-    async def _stop(self) -> None:
+        if (next_track_id := data.get('next_track_id')) and next_track_id not in self._prefetching:
+            if self._prefetch_task is not None:
+                self._prefetch_task.cancel()
+            self._prefetch_task = asyncio.create_task(
+                self._prefetch({'guild_id': self._guild_id, 'track_id': next_track_id})
+            )
+            self._prefetch_task.add_done_callback(self._background_prefetch_done)
+
+    async def _prefetch(self, data: PrefetchData) -> None:
+
+        if not (track_id := data.get('track_id')):
+            LOG.error(self._MISSING_KEY_MESSAGE('prefetch', 'track_id'))
+            return
+
+        try:
+            track_info = self._app._decode_track_id(track_id)
+        except ValueError:
+            LOG.error(f'{self._LOG_PREFIX} received \'prefetch\' op with invalid \'track_id\' key.')
+            return
+
+        if track_id in self._prefetching or (self._prefetched is not None and self._prefetched[0] == track_id):
+            if LOG.isEnabledFor(logging.DEBUG):
+                LOG.debug('%s track \'%s\' is already prefetched.', self._LOG_PREFIX, track_info['title'])
+            return
+
+        self._prefetching.add(track_id)
+        try:
+            source = await self._app._get_playback_url(track_info['url'])
+        except ExtractorBusy:
+            LOG.error(f'{self._LOG_PREFIX} could not prefetch track \'{track_info["title"]}\' as the extractor is overloaded.')
+            return
+        finally:
+            self._prefetching.discard(track_id)
+
+        self._discard_prefetched()
+        self._prefetched = (track_id, source)
+
+        if CONFIG.playback.prefetch.warm_decoder and self._connection:
+            url, opus = source
+            self._connection.prefetch(url, opus and not self._filters.active)
+
+        self._prefetch_expiry = asyncio.get_running_loop().call_later(
+            CONFIG.playback.prefetch.ttl,
+            self._discard_prefetched
+        )
+        LOG.info(f'{self._LOG_PREFIX} prefetched track \'{track_info["title"]}\' by \'{track_info["author"]}\'.')
+
+    async def _stop(self, data: StopData) -> None:
 
         if not self._connection:
             LOG.error(self._NO_CONNECTION_MESSAGE('stop'))
@@ -220,6 +552,8 @@ class Player:
             return
 
         self._connection.stop()
+        self._current = None
+        self._track_id = None
         LOG.info(f'{self._LOG_PREFIX} stopped the current track.')
 
     async def _set_pause_state(self, data: SetPauseStateData) -> None:
@@ -227,7 +561,7 @@ class Player:
         if not self._connection:
             LOG.error(self._NO_CONNECTION_MESSAGE('set_pause_state'))
             return
-        if not (state := data.get('state')):
+        if (state := data.get('state')) is None:
             LOG.error(self._MISSING_KEY_MESSAGE('set_pause_state', 'state'))
             return
 
@@ -241,16 +575,83 @@ class Player:
         if not self._connection:
             LOG.error(self._NO_CONNECTION_MESSAGE('set_position'))
             return
-        if not self._connection.is_playing():
+        paused = self._connection.is_paused()
+        if self._current is None or not (paused or self._connection.is_playing()):
             LOG.error(f'{self._LOG_PREFIX} attempted \'set_position\' op while no tracks are playing.')
             return
 
-        if not (position := data.get('position')):
+        if (position := data.get('position')) is None:
             LOG.error(self._MISSING_KEY_MESSAGE('set_position', 'position'))
             return
+        if position < 0:
+            LOG.error(f'{self._LOG_PREFIX} received \'set_position\' op with invalid \'position\' key.')
+            return
+
+        # the decoder is restarted at the new offset using the already resolved url,
+        # the track is never re-extracted.
+        source, end_time, _ = self._current
+        self._start_playback(source, position, end_time)
+        if paused:
+            self._connection.pause()
 
-        # TODO: implement
         LOG.info(f'{self._LOG_PREFIX} set its position to \'{position}\'.')
 
     async def _set_filter(self, data: SetFilterData) -> None:
-        LOG.error(f'{self._LOG_PREFIX} received \'set_filter\' op which is not yet implemented.')
+
+        try:
+            filters = Filters.from_payload(data)
+        except ValueError as error:
+            LOG.error(f'{self._LOG_PREFIX} received \'set_filter\' op with invalid {error}.')
+            return
+
+        previous = self._filters
+        self._filters = filters
+
+        if not self._connection:
+            LOG.info(f'{self._LOG_PREFIX} set its filters.')
+            return
+
+        # volume and equalizer are applied to the playing track straight away.
+        self._connection.set_filters(filters.volume, list(filters.equalizer))
+
+        # anything that changes how the track is decoded restarts it at the current position.
+        paused = self._connection.is_paused()
+        if self._current is not None and (paused or self._connection.is_playing()):
+            source, end_time, shared = self._current
+            _, opus = source
+            if filters.graph != previous.graph or (filters.active != previous.active and (opus or shared)):
+                self._start_playback(source, self._connection.position(), end_time)
+                if paused:
+                    self._connection.pause()
+
+        LOG.info(f'{self._LOG_PREFIX} set its filters.')
+
+    async def _debug(self, data: DebugData) -> None:
+
+        event: PlayerDebugData = {
+            'guild_id':  self._guild_id,
+            'type':      'player_debug',
+            'connected': self._connection is not None,
+            'playing':   False,
+            'paused':    False,
+            'position':  0,
+            'pacing':    None,
+        }
+
+        if self._connection:
+            event['playing'] = self._connection.is_playing()
+            event['paused'] = self._connection.is_paused()
+            event['position'] = self._connection.position()
+            event['pacing'] = self._connection.pacing_stats()
+
+        await self.send_payload('event', event)
+
+    async def _migrate(self, data: MigrateData) -> None:
+
+        if not (node := data.get('node') or self._app._coordinator.place(self._guild_id, exclude_local=True)):
+            LOG.error(f'{self._LOG_PREFIX} could not migrate as no other cluster nodes are available.')
+            return
+
+        # the player keeps playing here until the client has recreated it on the other node and destroys it.
+        await self.send_payload('event', self.get_migration(node))
+        LOG.info(f'{self._LOG_PREFIX} is migrating to cluster node \'{node}\'.')
@@ -0,0 +1,235 @@
+"""Swish. A standalone audio player and server for bots on Discord.
+
+Copyright (C) 2022 PythonistaGuild <https://github.com/PythonistaGuild>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from collections.abc import Callable
+from typing import Any, Literal
+
+import typing_extensions
+
+from .types.payloads import (
+    ReceivedPayload,
+    VoiceUpdateData,
+    DestroyData,
+    PlayData,
+    PrefetchData,
+    StopData,
+    SetPauseStateData,
+    SetPositionData,
+    SetFilterData,
+    DebugData,
+    MigrateData,
+)
+
+
+__all__ = (
+    'BACKEND',
+    'DecodeError',
+    'PayloadError',
+    'Encoding',
+    'SUBPROTOCOLS',
+    'dumps',
+    'dumps_bytes',
+    'loads',
+    'msgpack_dumps',
+    'msgpack_loads',
+    'encode_payload',
+    'decode_payload',
+    'validate_payload',
+)
+
+
+LOG: logging.Logger = logging.getLogger('swish.serialization')
+
+
+dumps: Callable[[Any], str]
+dumps_bytes: Callable[[Any], bytes]
+loads: Callable[[str | bytes], Any]
+DecodeError: tuple[type[Exception], ...]
+
+try:
+    import orjson
+
+except ImportError:
+
+    try:
+        import msgspec
+
+    except ImportError:
+        BACKEND = 'json'
+
+        dumps = json.dumps
+        dumps_bytes = lambda obj: json.dumps(obj).encode()
+        loads = json.loads
+        DecodeError = (json.JSONDecodeError, UnicodeDecodeError)
+
+    else:
+        BACKEND = 'msgspec'
+
+        _ENCODER = msgspec.json.Encoder()
+        _DECODER = msgspec.json.Decoder()
+
+        dumps = lambda obj: _ENCODER.encode(obj).decode()
+        dumps_bytes = _ENCODER.encode
+        loads = _DECODER.decode
+        DecodeError = (msgspec.DecodeError,)
+
+else:
+    BACKEND = 'orjson'
+
+    dumps = lambda obj: orjson.dumps(obj).decode()
+    dumps_bytes = orjson.dumps
+    loads = orjson.loads
+    DecodeError = (orjson.JSONDecodeError,)
+
+LOG.debug(f'Using \'{BACKEND}\' for JSON serialization.')
+
+
+###############
+# MessagePack #
+###############
+
+Encoding = Literal['json', 'msgpack']
+
+msgpack_dumps: Callable[[Any], bytes]
+msgpack_loads: Callable[[bytes], Any]
+
+# websocket subprotocols clients can request, in order of preference.
+SUBPROTOCOLS: dict[str, Encoding]
+
+try:
+    import msgpack
+
+except ImportError:
+    SUBPROTOCOLS = {'swish.json': 'json'}
+
+else:
+    msgpack_dumps = msgpack.packb  # type: ignore
+    msgpack_loads = msgpack.unpackb
+    SUBPROTOCOLS = {'swish.msgpack': 'msgpack', 'swish.json': 'json'}
+
+
+def encode_payload(payload: Any, encoding: Encoding) -> str | bytes:
+    return msgpack_dumps(payload) if encoding == 'msgpack' else dumps(payload)
+
+
+######################
+# Payload validation #
+######################
+
+class PayloadError(ValueError):
+    pass
+
+
+# (key, expected type, required)
+Schema = list[tuple[str, type | None, bool]]
+
+# schemas are derived from the received payload TypedDicts so that they can't drift apart.
+_PAYLOAD_DATA_TYPES: dict[str, type] = {
+    'voice_update':    VoiceUpdateData,
+    'destroy':         DestroyData,
+    'play':            PlayData,
+    'prefetch':        PrefetchData,
+    'stop':            StopData,
+    'set_pause_state': SetPauseStateData,
+    'set_position':    SetPositionData,
+    'set_filter':      SetFilterData,
+    'debug':           DebugData,
+    'migrate':         MigrateData,
+}
+
+
+def _build_schema(typed_dict: type) -> Schema:
+
+    schema: Schema = []
+
+    for key, hint in typing_extensions.get_type_hints(typed_dict, include_extras=True).items():
+
+        required = True
+        if typing_extensions.get_origin(hint) is typing_extensions.NotRequired:
+            required = False
+            (hint,) = typing_extensions.get_args(hint)
+
+        # only plain types are checked, anything more complex is left to the handlers.
+        schema.append((key, hint if hint in (str, int, bool, float) else None, required))
+
+    return schema
+
+
+SCHEMAS: dict[str, Schema] = {op: _build_schema(typed_dict) for op, typed_dict in _PAYLOAD_DATA_TYPES.items()}
+
+
+def validate_payload(payload: Any) -> ReceivedPayload:
+
+    if not isinstance(payload, dict):
+        raise PayloadError('payload is not a JSON object')
+    if 'op' not in payload:
+        raise PayloadError('missing \'op\' key')
+    if 'd' not in payload:
+        raise PayloadError('missing \'d\' key')
+
+    op: Any = payload['op']
+    data: Any = payload['d']
+
+    if not isinstance(op, str) or (schema := SCHEMAS.get(op)) is None:
+        raise PayloadError(f'unknown \'op\' value \'{op}\'')
+    if not isinstance(data, dict):
+        raise PayloadError('\'d\' key is not a JSON object')
+
+    for key, expected, required in schema:
+
+        if key not in data:
+            if required:
+                raise PayloadError(f'missing \'d.{key}\' key')
+            continue
+
+        if expected is None:
+            continue
+
+        value = data[key]
+        # bool is a subclass of int, but true/false are never valid integer values.
+        # whole numbers are valid floats as most JSON encoders drop their fraction.
+        if (
+            not isinstance(value, (int, float) if expected is float else expected)
+            or (expected is not bool and isinstance(value, bool))
+        ):
+            raise PayloadError(f'invalid type for \'d.{key}\' key, expected {expected.__name__}')
+
+    return payload  # type: ignore
+
+
+def decode_payload(data: str | bytes, encoding: Encoding = 'json') -> ReceivedPayload:
+
+    if encoding == 'msgpack':
+        if 'swish.msgpack' not in SUBPROTOCOLS:
+            raise PayloadError('MessagePack payloads are not supported')
+        try:
+            payload = msgpack_loads(data)  # type: ignore
+        except (ValueError, TypeError) as error:
+            raise PayloadError('invalid MessagePack format') from error
+
+    else:
+        try:
+            payload = loads(data)
+        except DecodeError as error:
+            raise PayloadError('invalid JSON format') from error
+
+    return validate_payload(payload)
@@ -0,0 +1,193 @@
+"""Swish. A standalone audio player and server for bots on Discord.
+
+Copyright (C) 2022 PythonistaGuild <https://github.com/PythonistaGuild>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+import struct
+from collections.abc import Callable
+from typing import Any
+
+
+__all__ = (
+    'encode_track_id',
+    'decode_track_id',
+)
+
+
+# Track id layout (version 1), url-safe base64 encoded without padding:
+#
+#   B   version
+#   B   source tag, see SOURCES
+#   B   flags, see the FLAG_* constants
+#   H+s identifier
+#   I   length                  (FLAG_LENGTH)
+#   H+s title                   (FLAG_TITLE)
+#   H+s author                  (FLAG_AUTHOR)
+#   H+s author id               (FLAG_AUTHOR_ID)
+#   H+s thumbnail url           (FLAG_THUMBNAIL)
+#   H+s url                     (FLAG_URL, omitted when it can be rebuilt from the identifier)
+#
+# strings are utf-8 prefixed with their byte length, all integers are big-endian.
+
+VERSION: int = 1
+
+FLAG_LENGTH: int = 1 << 0
+FLAG_TITLE: int = 1 << 1
+FLAG_AUTHOR: int = 1 << 2
+FLAG_AUTHOR_ID: int = 1 << 3
+FLAG_THUMBNAIL: int = 1 << 4
+FLAG_URL: int = 1 << 5
+FLAG_IS_LIVE: int = 1 << 6
+
+HEADER: struct.Struct = struct.Struct('>BBB')
+LENGTH: struct.Struct = struct.Struct('>I')
+STRING_LENGTH: struct.Struct = struct.Struct('>H')
+
+SOURCES: dict[str, int] = {
+    'generic':    0,
+    'youtube':    1,
+    'soundcloud': 2,
+    'niconico':   3,
+    'bilibili':   4,
+}
+SOURCE_TAGS: dict[int, str] = {tag: source for source, tag in SOURCES.items()}
+
+# yt-dlp extractor keys mapped to the source tag they are stored under.
+EXTRACTOR_SOURCES: dict[str, str] = {
+    'Youtube':    'youtube',
+    'Soundcloud': 'soundcloud',
+    'Niconico':   'niconico',
+    'BiliBili':   'bilibili',
+}
+
+CANONICAL_URLS: dict[str, Callable[[str], str]] = {
+    'youtube':  lambda identifier: f'https://www.youtube.com/watch?v={identifier}',
+    'niconico': lambda identifier: f'https://www.nicovideo.jp/watch/{identifier}',
+}
+
+
+def _pack_string(value: str) -> bytes:
+
+    data = value.encode()
+    if len(data) > 0xFFFF:
+        data = data[:0xFFFF].decode(errors='ignore').encode()
+
+    return STRING_LENGTH.pack(len(data)) + data
+
+
+def _unpack_string(data: bytes, offset: int) -> tuple[str, int]:
+
+    (length,) = STRING_LENGTH.unpack_from(data, offset)
+    offset += STRING_LENGTH.size
+    return data[offset:offset + length].decode(), offset + length
+
+
+def encode_track_id(info: dict[str, Any], extractor: str | None = None) -> str:
+
+    source = EXTRACTOR_SOURCES.get(extractor or '', 'generic')
+    identifier: str = info['identifier']
+
+    flags = 0
+    body = [_pack_string(identifier)]
+
+    if length := info.get('length'):
+        flags |= FLAG_LENGTH
+        body.append(LENGTH.pack(min(int(length), 0xFFFFFFFF)))
+
+    for flag, value in (
+        (FLAG_TITLE, info.get('title')),
+        (FLAG_AUTHOR, info.get('author')),
+        (FLAG_AUTHOR_ID, info.get('author_id')),
+        (FLAG_THUMBNAIL, (info.get('thumbnail') or {}).get('url')),
+    ):
+        if value:
+            flags |= flag
+            body.append(_pack_string(value))
+
+    url: str = info['url']
+    if (canonical := CANONICAL_URLS.get(source)) is None or canonical(identifier) != url:
+        flags |= FLAG_URL
+        body.append(_pack_string(url))
+
+    if info.get('is_live') in (True, 'is_live'):
+        flags |= FLAG_IS_LIVE
+
+    data = HEADER.pack(VERSION, SOURCES[source], flags) + b''.join(body)
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _decode_legacy_track_id(_id: str, /) -> dict[str, Any]:
+    return json.loads(base64.b64decode(_id).decode())
+
+
+def decode_track_id(_id: str, /) -> dict[str, Any]:
+
+    # legacy ids are base64 encoded json objects, which always start with '{"'.
+    if _id.startswith('eyJ'):
+        try:
+            return _decode_legacy_track_id(_id)
+        except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as error:
+            raise ValueError('Invalid track id.') from error
+
+    try:
+        data = base64.urlsafe_b64decode(_id + '=' * (-len(_id) % 4))
+        version, tag, flags = HEADER.unpack_from(data)
+    except (binascii.Error, struct.error) as error:
+        raise ValueError('Invalid track id.') from error
+
+    if version != VERSION or tag not in SOURCE_TAGS:
+        raise ValueError(f'Unsupported track id version \'{version}\' or source \'{tag}\'.')
+
+    source = SOURCE_TAGS[tag]
+
+    try:
+        identifier, offset = _unpack_string(data, HEADER.size)
+
+        length = 0
+        if flags & FLAG_LENGTH:
+            (length,) = LENGTH.unpack_from(data, offset)
+            offset += LENGTH.size
+
+        strings: dict[int, str | None] = {}
+        for flag in (FLAG_TITLE, FLAG_AUTHOR, FLAG_AUTHOR_ID, FLAG_THUMBNAIL, FLAG_URL):
+            strings[flag] = None
+            if flags & flag:
+                strings[flag], offset = _unpack_string(data, offset)
+
+    except (struct.error, UnicodeDecodeError) as error:
+        raise ValueError('Invalid track id.') from error
+
+    if (url := strings[FLAG_URL]) is None:
+        if (canonical := CANONICAL_URLS.get(source)) is None:
+            raise ValueError('Invalid track id.')
+        url = canonical(identifier)
+
+    return {
+        'title':      strings[FLAG_TITLE] or 'Unknown',
+        'identifier': identifier,
+        'url':        url,
+        'length':     length,
+        'author':     strings[FLAG_AUTHOR] or 'Unknown',
+        'author_id':  strings[FLAG_AUTHOR_ID],
+        'thumbnail':  strings[FLAG_THUMBNAIL],
+        'is_live':    bool(flags & FLAG_IS_LIVE),
+        'source':     source,
+    }
@@ -27,16 +27,29 @@ from typing_extensions import NotRequired
 __all__ = (
     # Received
     'VoiceUpdateData',
+    'DestroyData',
     'PlayData',
+    'PrefetchData',
+    'StopData',
     'SetPauseStateData',
     'SetPositionData',
     'SetFilterData',
+    'EqualizerBandData',
+    'TimescaleData',
+    'DebugData',
+    'MigrateData',
 
     'ReceivedPayloadOp',
     'ReceivedPayload',
 
     # Sent
     'EventData',
+    'TrackUpdateData',
+    'TrackUpdateBatchData',
+    'PacingStatsData',
+    'PlayerDebugData',
+    'FiltersData',
+    'PlayerMigrateData',
 
     'SentPayloadOp',
     'SentPayload',
@@ -44,6 +57,10 @@ __all__ = (
     # Final
     'PayloadHandlers',
     'Payload',
+
+    # Rest
+    'NodeStatsData',
+    'AggregateStatsData',
 )
 
 
@@ -56,6 +73,11 @@ class VoiceUpdateData(TypedDict):
     session_id: str
     token: str
     endpoint: str
+    encoder_profile: NotRequired[str]
+
+
+class DestroyData(TypedDict):
+    guild_id: str
 
 
 class PlayData(TypedDict):
@@ -64,6 +86,18 @@ class PlayData(TypedDict):
     start_time: NotRequired[int]
     end_time: NotRequired[int]
     replace: NotRequired[bool]
+    next_track_id: NotRequired[str]
+    shared: NotRequired[bool]
+    encoder_profile: NotRequired[str]
+
+
+class PrefetchData(TypedDict):
+    guild_id: str
+    track_id: str
+
+
+class StopData(TypedDict):
+    guild_id: str
 
 
 class SetPauseStateData(TypedDict):
@@ -76,18 +110,44 @@ class SetPositionData(TypedDict):
     position: int
 
 
+class EqualizerBandData(TypedDict):
+    band: int
+    gain: float
+
+
+class TimescaleData(TypedDict):
+    speed: NotRequired[float]
+    pitch: NotRequired[float]
+    rate: NotRequired[float]
+
+
 class SetFilterData(TypedDict):
     guild_id: str
+    volume: NotRequired[float]
+    equalizer: NotRequired[list[EqualizerBandData]]
+    timescale: NotRequired[TimescaleData]
+
+
+class DebugData(TypedDict):
+    guild_id: str
+
+
+class MigrateData(TypedDict):
+    guild_id: str
+    node: NotRequired[str]
 
 
 ReceivedPayloadOp = Literal[
     'voice_update',
     'destroy',
     'play',
+    'prefetch',
     'stop',
     'set_pause_state',
     'set_position',
     'set_filter',
+    'debug',
+    'migrate',
 ]
 
 
@@ -102,7 +162,55 @@ class ReceivedPayload(TypedDict):
 
 class EventData(TypedDict):
     guild_id: str
-    type: Literal['track_start', 'track_end', 'track_error', 'track_update', 'player_debug']
+    type: Literal['track_start', 'track_end', 'track_error', 'track_update', 'player_debug', 'player_migrate']
+
+
+class TrackUpdateData(TypedDict):
+    guild_id: str
+    position: int
+    paused: bool
+
+
+class TrackUpdateBatchData(TypedDict):
+    type: Literal['track_update']
+    updates: list[TrackUpdateData]
+
+
+class PacingStatsData(TypedDict):
+    frames: int
+    late_frames: int
+    jitter: float
+    max_lateness: float
+    drift: float
+
+
+class PlayerDebugData(TypedDict):
+    guild_id: str
+    type: Literal['player_debug']
+    connected: bool
+    playing: bool
+    paused: bool
+    position: int
+    pacing: PacingStatsData | None
+
+
+class FiltersData(TypedDict):
+    volume: float
+    equalizer: list[EqualizerBandData]
+    timescale: TimescaleData
+
+
+class PlayerMigrateData(TypedDict):
+    guild_id: str
+    type: Literal['player_migrate']
+    node: str
+    track_id: str | None
+    position: int
+    end_time: int | None
+    paused: bool
+    shared: bool
+    encoder_profile: str
+    filters: FiltersData
 
 
 SentPayloadOp = Literal['event']
@@ -120,12 +228,35 @@ class SentPayload(TypedDict):
 
 class PayloadHandlers(TypedDict):
     voice_update: Callable[[VoiceUpdateData], Awaitable[None]]
-    destroy: Callable[..., Awaitable[None]]
+    destroy: Callable[[DestroyData], Awaitable[None]]
     play: Callable[[PlayData], Awaitable[None]]
-    stop: Callable[..., Awaitable[None]]
+    prefetch: Callable[[PrefetchData], Awaitable[None]]
+    stop: Callable[[StopData], Awaitable[None]]
     set_pause_state: Callable[[SetPauseStateData], Awaitable[None]]
     set_position: Callable[[SetPositionData], Awaitable[None]]
     set_filter: Callable[[SetFilterData], Awaitable[None]]
+    debug: Callable[[DebugData], Awaitable[None]]
+    migrate: Callable[[MigrateData], Awaitable[None]]
 
 
 Payload = Union[ReceivedPayload, SentPayload]
+
+
+########
+# Rest #
+########
+
+class NodeStatsData(TypedDict):
+    node: str
+    players: int
+    voice_connections: int
+    cpu: float
+    cpus: int
+    jitter: float
+    draining: bool
+    load: float
+    worker: NotRequired[int]
+
+
+class AggregateStatsData(NodeStatsData):
+    workers: list[NodeStatsData]
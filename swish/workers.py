@@ -0,0 +1,238 @@
+"""Swish. A standalone audio player and server for bots on Discord.
+
+Copyright (C) 2022 PythonistaGuild <https://github.com/PythonistaGuild>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import multiprocessing.connection
+import multiprocessing.process
+import signal
+import sys
+import time
+from typing import Any
+
+import aiohttp.web
+import discord.backoff
+
+
+__all__ = (
+    'Supervisor',
+    'run_worker',
+)
+
+
+LOG: logging.Logger = logging.getLogger('swish.workers')
+
+
+##########
+# Worker #
+##########
+
+async def _run_worker(index: int, connection: multiprocessing.connection.Connection) -> None:
+
+    # imported here so that the supervisor never loads the native extension or starts any of its threads.
+    from .app import App
+
+    app = App()
+    app._coordinator.worker = index
+    await app.run(reuse_port=True)
+
+    # every worker also listens on a port of its own, which is where the other workers reach this one specifically.
+    assert app._runner is not None
+    site = aiohttp.web.TCPSite(app._runner, '127.0.0.1', 0)
+    await site.start()
+
+    url = f'http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}'  # type: ignore
+    connection.send(url)
+
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+
+    def receive() -> None:
+
+        try:
+            urls: list[str] = connection.recv()
+        except EOFError:
+            # the supervisor closes the connection to stop this worker, or it exited itself.
+            LOG.info(f'Worker {index} lost its connection to the supervisor, shutting down.')
+            loop.remove_reader(connection.fileno())
+            stopped.set()
+            return
+
+        app._coordinator.set_workers([other for other in urls if other != url])
+
+    loop.add_reader(connection.fileno(), receive)
+
+    # signals end the worker the same way, so that its cleanup (stopping the extractor and its processes) always runs.
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopped.set)
+
+    await stopped.wait()
+
+    loop.remove_reader(connection.fileno())
+    await app._runner.cleanup()
+
+
+def run_worker(index: int, connection: multiprocessing.connection.Connection) -> None:
+
+    from .logging import setup_logging
+    setup_logging(f'.worker{index}')
+
+    try:
+        asyncio.run(_run_worker(index, connection))
+    except KeyboardInterrupt:
+        pass
+
+
+##############
+# Supervisor #
+##############
+
+class Supervisor:
+
+    def __init__(self, workers: int) -> None:
+
+        self.workers: int = workers
+
+        self._context: Any = multiprocessing.get_context('spawn')
+
+        self._processes: dict[int, multiprocessing.process.BaseProcess] = {}
+        self._connections: dict[int, multiprocessing.connection.Connection] = {}
+        self._urls: dict[int, str] = {}
+
+        self._backoffs: dict[int, discord.backoff.ExponentialBackoff] = {}
+        self._restarts: dict[int, float] = {}
+
+    def _start(self, index: int) -> None:
+
+        connection, child = self._context.Pipe()
+
+        # not daemonic, as the extractor's process mode needs workers to be able to start processes of their own.
+        process = self._context.Process(target=run_worker, args=(index, child), name=f'swish-worker-{index}')
+        process.start()
+        child.close()
+
+        self._processes[index] = process
+        self._connections[index] = connection
+
+        LOG.info(f'Started worker {index} (pid {process.pid}).')
+
+    def _broadcast(self) -> None:
+
+        # every worker gets the private urls of all workers, including its own.
+        urls = list(self._urls.values())
+        for connection in self._connections.values():
+            try:
+                connection.send(urls)
+            except OSError:
+                # the worker is exiting, which is handled once its process has ended.
+                pass
+
+    def _handle_exit(self, index: int) -> None:
+
+        process = self._processes.pop(index)
+        process.join()
+        self._connections.pop(index).close()
+
+        if self._urls.pop(index, None) is not None:
+            self._broadcast()
+
+        # workers that keep crashing straight away are restarted less and less often.
+        delay = self._backoffs[index].delay()
+        self._restarts[index] = time.monotonic() + delay
+
+        LOG.error(f'Worker {index} (pid {process.pid}) exited with code {process.exitcode}, restarting in {delay:.1f}s.')
+
+    def run(self) -> None:
+
+        # stopped the same way whether interrupted or terminated, so that workers are never left behind.
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+        for index in range(self.workers):
+            self._backoffs[index] = discord.backoff.ExponentialBackoff()
+            self._start(index)
+
+        try:
+            while True:
+                self._poll()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def _poll(self) -> None:
+
+        timeout = None
+        if self._restarts:
+            timeout = max(0.0, min(self._restarts.values()) - time.monotonic())
+
+        waitables: dict[Any, tuple[str, int]] = {
+            **{process.sentinel: ('exit', index) for index, process in self._processes.items()},
+            **{connection: ('message', index) for index, connection in self._connections.items()},
+        }
+
+        for ready in multiprocessing.connection.wait(list(waitables), timeout):
+
+            kind, index = waitables[ready]
+
+            if kind == 'exit':
+                if index in self._processes and self._processes[index].sentinel == ready:
+                    self._handle_exit(index)
+                continue
+
+            # a worker that already exited during this wait is no longer in the connections.
+            if self._connections.get(index) is not ready:
+                continue
+            try:
+                self._urls[index] = ready.recv()
+            except EOFError:
+                continue
+            self._broadcast()
+
+        now = time.monotonic()
+        for index, restart in list(self._restarts.items()):
+            if restart <= now:
+                del self._restarts[index]
+                self._start(index)
+
+    def stop(self) -> None:
+
+        # closing a worker's connection tells it to clean up and exit, workers that don't in time are terminated and
+        # then killed.
+        for connection in self._connections.values():
+            connection.close()
+
+        deadline = time.monotonic() + 10
+        for process in self._processes.values():
+            process.join(timeout=max(0.0, deadline - time.monotonic()))
+
+        for index, process in self._processes.items():
+            if not process.is_alive():
+                continue
+            LOG.warning(f'Worker {index} (pid {process.pid}) did not exit in time, terminating it.')
+            process.terminate()
+            process.join(timeout=5)
+            if process.is_alive():
+                LOG.warning(f'Worker {index} (pid {process.pid}) did not exit after being terminated, killing it.')
+                process.kill()
+                process.join()
+
+        self._processes.clear()
+        self._connections.clear()